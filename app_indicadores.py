@@ -1,12 +1,21 @@
 import streamlit as st
-import pandas as pd
-import plotly.graph_objects as go
-import plotly.express as px
-import sqlite3
-import time
 import os
-import unicodedata
+import sqlite3
+import tempfile
 from datetime import datetime
+from functools import partial
+from motor_datos import (
+    FILAS_POR_PAGINA, LISTA_MESES, MAPA_TABLAS_OPERATIVAS, PROCESOS_TENDENCIA, SEGUNDOS_SONDEO, RESULTADOS_POR_PAGINA,
+    ModuloDiferido, init_db, get_connection, autenticar, normalize_text, filtrar_por_periodo, obtener_datos,
+    obtener_resumen, leer_en_paralelo, resolver_tabla, opciones_periodo, contar_registros, leer_pagina, calcular_cacheado,
+    total_kpi, tendencia_procesos, anios_resumenes, top_aseguradoras, edades_cartera, corte_edades, tabla_edades, recaudo_vs_provision,
+    bloques_consulta, sin_columnas_internas, columnas_visibles, exportar_csv, exportar_xlsx, buscar_texto,
+    crear_usuario_bd, encolar_carga, listar_trabajos, asegurar_trabajador,
+    iniciar_rerun, cerrar_rerun, medir_etapa, get_registro_tiempos, percentiles_etapas,
+)
+
+# pandas se importa al primer uso (después del login); plotly, solo en la página que grafica
+pd = ModuloDiferido('pandas')
 
 # --- CONFIGURACIÓN DE LA PÁGINA ---
 st.set_page_config(
@@ -21,33 +30,20 @@ COLOR_PRIMARY = "#663399"
 COLOR_SECONDARY = "#2c3e50"
 COLOR_ACCENT = "#e67e22"
 
-# RUTA DE LA BASE DE DATOS
-DB_PATH_ABSOLUTE = r"C:\Users\pedro\OneDrive\GENERAL ANTIGUA\Escritorio\mi_proyecto_inventario\Christus_DB_Master.db"
-DB_NAME_LOCAL = "Christus_DB_Master.db"
-
 # Listas para gestión
 LISTA_ANIOS = [2025, 2026, 2027]
-LISTA_MESES = [
-    "Enero", "Febrero", "Marzo", "Abril", "Mayo", "Junio",
-    "Julio", "Agosto", "Septiembre", "Octubre", "Noviembre", "Diciembre"
-]
 ROLES_USUARIOS = ["Admin", "Ceo", "Admin Delegado", "Lider"]
 AREAS_ACCESO = ["Todas", "Facturación", "Cuentas Medicas", "Admisiones", "Autorizaciones", "Cartera"]
 
-# Mapeo de Tablas Operativas
-MAPA_TABLAS_OPERATIVAS = {
-    'FACTURACION': 'ope_facturacion',
-    'RADICACION': 'ope_radicacion',
-    'ADMISIONES': 'ope_admisiones',
-    'AUTORIZACIONES': 'ope_autorizaciones',
-    'CUENTAS MEDICAS': 'ope_cuentas_medicas',
-    'CARTERA': 'ope_cartera',
-    'PROVISION': 'ope_provision'
-}
+# Tendencia financiera: color de cada proceso y medida elegida -> columna de tendencia_procesos
+COLORES_TENDENCIA = {'Facturado': COLOR_PRIMARY, 'Radicado': COLOR_ACCENT, 'Recaudo': '#27ae60'}
+MEDIDAS_TENDENCIA = {"Mensual": 'Valor', "Móvil 3 meses": 'Móvil 3m', "Móvil 12 meses": 'Móvil 12m', "Variación anual": 'Var. anual'}
 
 # Archivos de personalización visual
 LOCAL_LOGO_PATH = "logo_christus_custom.png"     
 LOCAL_BANNER_PATH = "banner_christus_custom.png" 
+# Carpeta donde el panel de Rendimiento guarda los logs exportados
+LOG_RENDIMIENTO_DIR = "logs_rendimiento"
 DEFAULT_LOGO_URL = "https://upload.wikimedia.org/wikipedia/commons/thumb/8/87/Christus_Health_Logo.svg/1200px-Christus_Health_Logo.svg.png"
 
 # --- ESTILOS CSS ---
@@ -73,172 +69,37 @@ st.markdown(f"""
     </style>
 """, unsafe_allow_html=True)
 
-# ==============================================================================
-# 1. GESTIÓN DE CONEXIÓN Y AUTO-REPARACIÓN
-# ==============================================================================
-
-def get_connection():
-    """Devuelve la conexión a la BD, creándola si no existe."""
-    path = DB_NAME_LOCAL
-    if os.path.exists(DB_PATH_ABSOLUTE):
-        path = DB_PATH_ABSOLUTE
-    
-    conn = sqlite3.connect(path, check_same_thread=False)
-    return conn, path
-
-def init_db():
-    """Crea las tablas necesarias si no existen."""
-    conn, _ = get_connection()
-    c = conn.cursor()
-
-    try:
-        c.execute("CREATE TABLE IF NOT EXISTS usuarios (id INTEGER PRIMARY KEY AUTOINCREMENT, usuario TEXT UNIQUE NOT NULL, rol TEXT, area_acceso TEXT)")
-        cols = [info[1] for info in c.execute("PRAGMA table_info(usuarios)")]
-        if 'contrasena' not in cols:
-            try: c.execute("ALTER TABLE usuarios ADD COLUMN contrasena TEXT DEFAULT '1234'")
-            except: pass 
-    except Exception as e:
-        print(f"Error init usuarios: {e}")
-
-    c.execute("""
-        CREATE TABLE IF NOT EXISTS catalogo_indicadores (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            area TEXT,
-            responsable TEXT,
-            indicador TEXT,
-            fecha_carga TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    """)
-    conn.commit()
-    conn.close()
-
+# Aplica las migraciones de esquema pendientes (solo en el primer rerun del proceso)
 init_db()
 
-# ==============================================================================
-# 2. FUNCIONES DE LECTURA E INTELIGENCIA
-# ==============================================================================
-
-def normalize_text(text):
-    if not isinstance(text, str): return str(text)
-    text = unicodedata.normalize('NFD', text).encode('ascii', 'ignore').decode('utf-8')
-    return text.upper().strip()
-
-def buscar_columna_inteligente(df, palabras_clave):
-    """Busca una columna que contenga alguna de las palabras clave."""
-    cols_norm = {normalize_text(c): c for c in df.columns}
-    for kw in palabras_clave:
-        kw_norm = normalize_text(kw)
-        for col_n, col_real in cols_norm.items():
-            if kw_norm == col_n: # Prioridad coincidencia exacta
-                return col_real
-    # Si no hay exacta, buscar parcial
-    for kw in palabras_clave:
-        kw_norm = normalize_text(kw)
-        for col_n, col_real in cols_norm.items():
-            if kw_norm in col_n:
-                return col_real
-    return None
-
-def autenticar(user, pwd):
-    conn, _ = get_connection()
-    try:
-        query = "SELECT * FROM usuarios"
-        all_users = pd.read_sql(query, conn)
-        
-        col_pwd = None
-        for c in all_users.columns:
-            if normalize_text(c) in ['CONTRASENA', 'PASSWORD', 'CLAVE', 'CONTRASEÑA']:
-                col_pwd = c
-                break
-        
-        if col_pwd:
-            user_match = all_users[
-                (all_users['usuario'].astype(str) == user) & 
-                (all_users[col_pwd].astype(str) == pwd)
-            ]
-            if not user_match.empty:
-                row = user_match.iloc[0]
-                conn.close()
-                return {
-                    'USUARIO': row['usuario'],
-                    'ROL': row.get('rol', 'Usuario'),
-                    'AREA_ACCESO': row.get('area_acceso', 'Todas')
-                }, None
-    except Exception as e:
-        conn.close()
-        return None, str(e)
-    conn.close()
-    return None, "Credenciales incorrectas"
-
-def buscar_tabla_inteligente(conn, nombre_objetivo):
-    try:
-        tablas = pd.read_sql("SELECT name FROM sqlite_master WHERE type='table'", conn)['name'].tolist()
-        if nombre_objetivo in tablas: return nombre_objetivo
-        for t in tablas:
-            if t.lower() == nombre_objetivo.lower(): return t
-        clave = nombre_objetivo.replace('ope_', '')
-        for t in tablas:
-            if clave in t.lower(): return t
-        return None
-    except: return None
-
-def obtener_datos(nombre_ui, nombre_tabla_ideal):
-    conn, _ = get_connection()
-    tabla_real = buscar_tabla_inteligente(conn, nombre_tabla_ideal)
-    df = pd.DataFrame()
-    if tabla_real:
-        try: df = pd.read_sql(f"SELECT * FROM {tabla_real}", conn)
-        except: pass
-    conn.close()
-    return df, tabla_real
-
-# ==============================================================================
-# 3. FUNCIONES DE ESCRITURA (GESTOR)
-# ==============================================================================
-
-def crear_usuario_bd(usuario, contrasena, rol, area):
-    conn, _ = get_connection()
-    try:
-        cols = [info[1] for info in conn.execute("PRAGMA table_info(usuarios)")]
-        col_pwd = 'contrasena' if 'contrasena' in cols else 'password'
-        conn.execute(f"INSERT INTO usuarios (usuario, {col_pwd}, rol, area_acceso) VALUES (?, ?, ?, ?)", (usuario, contrasena, rol, area))
-        conn.commit()
-        return True, "Usuario creado exitosamente."
-    except sqlite3.IntegrityError: return False, "El usuario ya existe."
-    except Exception as e: return False, f"Error: {e}"
-    finally: conn.close()
-
-def cargar_dataframe_bd(df, nombre_tabla, modo='append', anio_sel=None, mes_sel=None):
-    conn, _ = get_connection()
-    try:
-        # Asegurar columnas de periodo
-        col_anio = buscar_columna_inteligente(df, ['ANIO', 'YEAR', 'PERIODO_ANIO'])
-        col_mes = buscar_columna_inteligente(df, ['MES', 'MONTH', 'PERIODO_MES'])
-        
-        # Si no existen en el archivo o están vacías, usamos las seleccionadas
-        if not col_anio and anio_sel:
-            df['PERIODO_ANIO'] = anio_sel
-        elif col_anio and anio_sel:
-             # Opcional: Rellenar vacíos con la selección
-             df[col_anio] = df[col_anio].fillna(anio_sel)
-
-        if not col_mes and mes_sel:
-            df['PERIODO_MES'] = mes_sel
-        elif col_mes and mes_sel:
-             df[col_mes] = df[col_mes].fillna(mes_sel)
-
-        df['fecha_carga'] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        df.columns = df.columns.astype(str)
-        
-        df.to_sql(nombre_tabla, conn, if_exists=modo, index=False)
-        return True, f"✅ Éxito: {len(df)} registros procesados."
-    except Exception as e: return False, f"❌ Error SQL: {e}"
-    finally: conn.close()
-
 def obtener_imagen_local(path, default=None):
     if os.path.exists(path): return path
     return default
 
+def botones_exportacion(bloques, nombre_base, clave):
+    """
+    Botones de descarga CSV y Excel de la vista filtrada. El archivo se genera recién al hacer clic
+    (en otro hilo, sin bloquear la página), con `bloques()` entregando las filas de a bloques a un
+    archivo temporal. Límite: st.download_button sirve bytes, así que el archivo terminado queda una
+    vez en memoria (en el media manager de Streamlit) mientras dura la descarga; las filas no.
+    """
+    def diferido(exportar):
+        def generar():
+            with tempfile.TemporaryFile() as salida:
+                exportar(bloques(), salida)
+                salida.seek(0)
+                return salida.read()
+        return generar
+    c1, c2, _ = st.columns([1, 1, 4])
+    c1.download_button("⬇️ CSV", diferido(exportar_csv), file_name=f"{nombre_base}.csv", mime="text/csv",
+                       key=f"csv_{clave}", on_click="ignore")
+    c2.download_button("⬇️ Excel", diferido(exportar_xlsx), file_name=f"{nombre_base}.xlsx", key=f"xlsx_{clave}",
+                       mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet", on_click="ignore")
+
+def figura_cacheada(tablas, nombre, params, construir):
+    """Figura de Plotly ya armada, compartida entre reruns y sesiones por versión de `tablas` y filtros `params`."""
+    return calcular_cacheado(tablas, f"figura_{nombre}", params, construir)
+
 # ==============================================================================
 # INTERFAZ PRINCIPAL
 # ==============================================================================
@@ -281,6 +142,10 @@ if st.session_state.user_info is None:
 user = st.session_state.user_info
 rol_usuario = user['ROL']
 area_usuario = user['AREA_ACCESO']
+# Alcance por área: sin acceso total, las lecturas de las tablas de AREA_ACCESO_POR_TABLA (motor_datos)
+# se filtran en SQL por el área del usuario; las demás tablas no se filtran
+acceso_total = normalize_text(area_usuario) in ['TODAS', 'ALL'] or normalize_text(rol_usuario) in ['ADMIN', 'CEO']
+area_alcance = None if acceso_total else area_usuario
 
 # --- SIDEBAR ---
 with st.sidebar:
@@ -290,7 +155,7 @@ with st.sidebar:
     st.info(f"👤 {user['USUARIO']}\n\nRol: {rol_usuario}")
     
     # Menú Principal
-    opciones_menu = ["🚀 Dashboard Gerencial", "📊 Indicadores", "📈 Tablero Operativo"]
+    opciones_menu = ["🚀 Dashboard Gerencial", "📊 Indicadores", "📈 Tablero Operativo", "🔎 Búsqueda Global"]
     
     if normalize_text(rol_usuario) in ['ADMIN', 'CEO', 'ADMIN DELEGADO', 'LIDER', 'ADMINISTRADOR']:
         opciones_menu.append("📂 Gestión y Carga")
@@ -302,6 +167,9 @@ with st.sidebar:
         st.session_state.user_info = None
         st.rerun()
 
+# Cada etapa medida desde aquí queda etiquetada con la página y el usuario del rerun
+iniciar_rerun(nav, user['USUARIO'])
+
 # --- HEADER ---
 if banner_actual:
     try: st.image(banner_actual, use_container_width=True)
@@ -309,35 +177,12 @@ if banner_actual:
 
 st.title(nav)
 
-# ==============================================================================
-# FUNCIONES COMUNES DE FILTRADO
-# ==============================================================================
-def filtrar_por_periodo(df, anio, mes):
-    """Filtra un DataFrame genérico por Año y Mes usando búsqueda inteligente de columnas."""
-    if df.empty: return df
-    
-    df_filtrado = df.copy()
-    
-    # 1. Filtro Año
-    col_anio = buscar_columna_inteligente(df_filtrado, ['ANIO', 'YEAR', 'PERIODO_ANIO'])
-    if col_anio and anio:
-        df_filtrado = df_filtrado[df_filtrado[col_anio].astype(str) == str(anio)]
-        
-    # 2. Filtro Mes
-    if mes and mes != "Todos":
-        col_mes = buscar_columna_inteligente(df_filtrado, ['MES', 'MONTH', 'PERIODO_MES'])
-        if col_mes:
-            mes_norm = normalize_text(mes)
-            # Normalizamos la columna para comparar
-            df_filtrado['TEMP_MES_NORM'] = df_filtrado[col_mes].astype(str).apply(normalize_text)
-            df_filtrado = df_filtrado[df_filtrado['TEMP_MES_NORM'] == mes_norm].drop(columns=['TEMP_MES_NORM'])
-            
-    return df_filtrado
-
 # ==============================================================================
 # MÓDULO 1: DASHBOARD GERENCIAL
 # ==============================================================================
 if nav == "🚀 Dashboard Gerencial":
+    import plotly.express as px
+
     st.markdown("### Visión Estratégica Integral")
     
     # --- FILTROS GLOBALES ---
@@ -347,102 +192,140 @@ if nav == "🚀 Dashboard Gerencial":
     mes_dash = col_f2.selectbox("Seleccionar Mes:", ["Todos"] + LISTA_MESES, index=0)
     st.markdown("---")
     
-    # 1. Obtener Datos Crudos
-    df_fact, _ = obtener_datos('FACTURACION', 'ope_facturacion')
-    df_rad, _ = obtener_datos('RADICACION', 'ope_radicacion')
-    df_cart, _ = obtener_datos('CARTERA', 'ope_cartera')
-    df_adm, _ = obtener_datos('ADMISIONES', 'ope_admisiones')
-    df_ind, _ = obtener_datos('INDICADORES', 'catalogo_indicadores')
-
-    # 2. Aplicar Filtros
-    df_fact_f = filtrar_por_periodo(df_fact, anio_dash, mes_dash)
-    df_rad_f = filtrar_por_periodo(df_rad, anio_dash, mes_dash)
-    df_cart_f = filtrar_por_periodo(df_cart, anio_dash, mes_dash)
-    df_adm_f = filtrar_por_periodo(df_adm, anio_dash, mes_dash)
-    
+    # 1. Resúmenes mensuales precalculados en la carga (su tamaño no depende de las filas crudas),
+    #    leídos y filtrados por mes en paralelo; la latencia es la de la tabla más lenta
+    def resumen_filtrado(nombre_tabla):
+        res_y = obtener_resumen(nombre_tabla, anio_dash)
+        with medir_etapa('filtrar_por_periodo', nombre_tabla):
+            return res_y, filtrar_por_periodo(res_y, None, mes_dash)
+
+    tareas = {t: partial(resumen_filtrado, t) for t in ['ope_facturacion', 'ope_radicacion', 'ope_cartera', 'ope_admisiones',
+                                                         'ope_provision']}
+    # Historia completa de los procesos de la tendencia (años, variación anual y móviles)
+    tareas.update({f"historico_{t}": partial(obtener_resumen, t) for t in PROCESOS_TENDENCIA.values()})
+    # Edades de cartera del año del tablero (un GROUP BY en SQL, cacheado por versión de datos)
+    tareas['edades_cartera'] = lambda: edades_cartera(anio_dash, area=area_alcance)
     # Nota: Los indicadores a veces no tienen columna fecha si son solo catálogo. 
     # Si tienen histórico, se filtran igual.
-    df_ind_f = filtrar_por_periodo(df_ind, anio_dash, mes_dash)
+    tareas['catalogo_indicadores'] = lambda: sin_columnas_internas(
+        obtener_datos('INDICADORES', 'catalogo_indicadores', anio=anio_dash, mes=mes_dash, area=area_alcance)[0])
 
     # --- TARJETAS KPI ---
+    # Cada tarjeta se pinta en cuanto llegan sus datos
     col1, col2, col3, col4 = st.columns(4)
-    
-    # KPI 1: Facturación
-    col_val_fact = buscar_columna_inteligente(df_fact_f, ['VALOR', 'FACTURADO', 'TOTAL'])
-    total_fact = df_fact_f[col_val_fact].sum() if not df_fact_f.empty and col_val_fact else 0
-    
-    with col1:
-        st.markdown(f"""<div class="kpi-card"><div class="kpi-title">Facturación</div><div class="kpi-value">${total_fact:,.0f}</div></div>""", unsafe_allow_html=True)
-
-    # KPI 2: Radicación
-    col_val_rad = buscar_columna_inteligente(df_rad_f, ['VALOR', 'RADICADO'])
-    total_rad = df_rad_f[col_val_rad].sum() if not df_rad_f.empty and col_val_rad else 0
-    
-    with col2:
-        st.markdown(f"""<div class="kpi-card" style="border-left-color: {COLOR_ACCENT}"><div class="kpi-title">Radicación</div><div class="kpi-value">${total_rad:,.0f}</div></div>""", unsafe_allow_html=True)
-
-    # KPI 3: Recaudo
-    col_val_recaudo = buscar_columna_inteligente(df_cart_f, ['RECAUDO', 'REAL'])
-    total_recaudo = df_cart_f[col_val_recaudo].sum() if not df_cart_f.empty and col_val_recaudo else 0
-    
-    with col3:
-        st.markdown(f"""<div class="kpi-card" style="border-left-color: #27ae60"><div class="kpi-title">Recaudo</div><div class="kpi-value">${total_recaudo:,.0f}</div></div>""", unsafe_allow_html=True)
-
-    # KPI 4: Admisiones
-    col_adm_cant = buscar_columna_inteligente(df_adm_f, ['CANTIDAD', 'ACTIVIDADES', 'PACIENTES'])
-    total_adm = df_adm_f[col_adm_cant].sum() if not df_adm_f.empty and col_adm_cant else 0
-    
-    with col4:
-        st.markdown(f"""<div class="kpi-card" style="border-left-color: #3498db"><div class="kpi-title">Admisiones</div><div class="kpi-value">{total_adm:,.0f}</div></div>""", unsafe_allow_html=True)
+    tarjetas = {
+        'ope_facturacion': (col1.empty(), 'Facturación', '', '$'),
+        'ope_radicacion': (col2.empty(), 'Radicación', f' style="border-left-color: {COLOR_ACCENT}"', '$'),
+        'ope_cartera': (col3.empty(), 'Recaudo', ' style="border-left-color: #27ae60"', '$'),
+        'ope_admisiones': (col4.empty(), 'Admisiones', ' style="border-left-color: #3498db"', ''),
+    }
+
+    resultados = {}
+    for clave, resultado in leer_en_paralelo(tareas):
+        resultados[clave] = resultado
+        if clave in tarjetas:
+            hueco, titulo, estilo, prefijo = tarjetas[clave]
+            total = total_kpi(resultado[1])
+            hueco.markdown(f"""<div class="kpi-card"{estilo}><div class="kpi-title">{titulo}</div><div class="kpi-value">{prefijo}{total:,.0f}</div></div>""", unsafe_allow_html=True)
+
+    _, res_fact_f = resultados['ope_facturacion']
+    df_ind_f = resultados['catalogo_indicadores']
 
     # --- GRÁFICOS ESTRATÉGICOS ---
     c_chart1, c_chart2 = st.columns(2)
 
     with c_chart1:
-        st.subheader("📊 Tendencia Financiera (Anual)")
-        # Para tendencia usamos los datos SIN filtro de mes, pero CON filtro de año
-        df_fact_y = filtrar_por_periodo(df_fact, anio_dash, "Todos")
-        df_rad_y = filtrar_por_periodo(df_rad, anio_dash, "Todos")
-        
-        datos_grafico = []
-        def agregar_serie(df_in, col_v, etiqueta):
-            if df_in.empty or not col_v: return
-            col_m = buscar_columna_inteligente(df_in, ['MES', 'MONTH'])
-            if col_m:
-                agrupado = df_in.groupby(col_m)[col_v].sum().reset_index()
-                # Ordenar por mes lógico
-                agrupado['Mes_Num'] = agrupado[col_m].apply(lambda x: LISTA_MESES.index(x) if x in LISTA_MESES else 99)
-                agrupado = agrupado.sort_values('Mes_Num')
-                for _, r in agrupado.iterrows():
-                    datos_grafico.append({'Mes': r[col_m], 'Valor': r[col_v], 'Tipo': etiqueta})
-
-        agregar_serie(df_fact_y, col_val_fact, 'Facturado')
-        agregar_serie(df_rad_y, col_val_rad, 'Radicado')
-        
-        if datos_grafico:
-            fig = px.line(pd.DataFrame(datos_grafico), x='Mes', y='Valor', color='Tipo', markers=True,
-                          color_discrete_map={'Facturado': COLOR_PRIMARY, 'Radicado': COLOR_ACCENT})
-            st.plotly_chart(fig, use_container_width=True)
+        st.subheader("📊 Tendencia Financiera")
+        # Toda la historia, sin filtro de mes; por defecto los tres últimos años con datos hasta el seleccionado
+        historicos = {etiqueta: resultados[f"historico_{t}"] for etiqueta, t in PROCESOS_TENDENCIA.items()}
+        anios_datos = anios_resumenes(historicos)
+
+        if anios_datos:
+            hasta = max([a for a in anios_datos if a <= anio_dash] or anios_datos[:1])
+            desde = anios_datos[max(0, anios_datos.index(hasta) - 2)]
+            if len(anios_datos) > 1:
+                desde, hasta = st.select_slider("Años:", options=anios_datos, value=(desde, hasta), key="anios_tendencia")
+            medida = st.radio("Medida:", list(MEDIDAS_TENDENCIA), horizontal=True, key="medida_tendencia")
+            anios = tuple(a for a in anios_datos if desde <= a <= hasta)
+
+            def figura_tendencia():
+                columna = MEDIDAS_TENDENCIA[medida]
+                fig = px.line(tendencia_procesos(historicos, anios), x='Periodo', y=columna, color='Tipo', markers=True,
+                              color_discrete_map=COLORES_TENDENCIA,
+                              hover_data={'Valor': ':,.0f', 'Año anterior': ':,.0f', 'Var. anual': ':.1%',
+                                          'Móvil 3m': ':,.0f', 'Móvil 12m': ':,.0f'})
+                fig.update_layout(xaxis_title=None, yaxis_title=medida)
+                if columna == 'Var. anual': fig.update_yaxes(tickformat='.0%')
+                return fig
+
+            with medir_etapa('plotly', ','.join(PROCESOS_TENDENCIA.values())):
+                st.plotly_chart(figura_cacheada(list(PROCESOS_TENDENCIA.values()), 'tendencia', (anios, medida), figura_tendencia),
+                                use_container_width=True)
         else:
             st.info("No hay suficientes datos temporales para graficar tendencias.")
 
     with c_chart2:
         st.subheader("🏢 Top Aseguradoras (Periodo Actual)")
-        # Usamos los datos filtrados por mes y año
-        col_aseg = buscar_columna_inteligente(df_fact_f, ['ASEGURADORA', 'CLIENTE', 'EPS'])
+        # Usamos el resumen filtrado por mes y año
+        with medir_etapa('top_aseguradoras', 'ope_facturacion'):
+            df_top = top_aseguradoras(res_fact_f)
         
-        if not df_fact_f.empty and col_aseg and col_val_fact:
-            df_top = df_fact_f.groupby(col_aseg)[col_val_fact].sum().reset_index().sort_values(col_val_fact, ascending=False).head(7)
-            fig2 = px.bar(df_top, x=col_val_fact, y=col_aseg, orientation='h', text_auto='.2s', color=col_val_fact)
-            fig2.update_layout(yaxis={'categoryorder':'total ascending'})
-            st.plotly_chart(fig2, use_container_width=True)
+        if not df_top.empty:
+            def figura_top():
+                fig2 = px.bar(df_top, x='Valor', y='Aseguradora', orientation='h', text_auto='.2s', color='Valor')
+                fig2.update_layout(yaxis={'categoryorder':'total ascending'})
+                return fig2
+
+            with medir_etapa('plotly', 'ope_facturacion'):
+                st.plotly_chart(figura_cacheada(['ope_facturacion'], 'top_aseguradoras', (anio_dash, mes_dash), figura_top),
+                                use_container_width=True)
         else:
             st.info("Faltan datos de Aseguradora/Valor para este periodo.")
 
+    # --- EDADES DE CARTERA ---
+    st.markdown("### ⏳ Edades de Cartera")
+    c_edad1, c_edad2 = st.columns([3, 2])
+
+    with c_edad1:
+        mes_corte, corte = corte_edades(resultados['edades_cartera'], anio_dash, mes_dash)
+        if not corte.empty:
+            df_edades = tabla_edades(corte)
+            st.caption(f"Saldo por días desde la fecha del documento al cierre de {LISTA_MESES[mes_corte - 1]} {anio_dash}")
+            def figura_edades():
+                tramos = [c for c in df_edades.columns if c not in ('Aseguradora', 'Total')]
+                barras = df_edades[df_edades['Aseguradora'] != 'Total'].melt(id_vars='Aseguradora', value_vars=tramos,
+                                                                              var_name='Tramo', value_name='Saldo')
+                fig3 = px.bar(barras, x='Saldo', y='Aseguradora', color='Tramo', orientation='h')
+                fig3.update_layout(yaxis={'categoryorder': 'total ascending'})
+                return fig3
+
+            with medir_etapa('plotly', 'ope_cartera'):
+                st.plotly_chart(figura_cacheada(['ope_cartera'], 'edades', (anio_dash, mes_dash, area_alcance), figura_edades),
+                                use_container_width=True)
+            st.dataframe(df_edades, hide_index=True, use_container_width=True,
+                         column_config={c: st.column_config.NumberColumn(format="$%,.0f") for c in df_edades.columns[1:]})
+        else:
+            st.info("Sin saldos de cartera para este periodo (se necesitan columnas de saldo y fecha del documento).")
+
+    with c_edad2:
+        st.subheader("💰 Recaudo vs Provisión")
+        df_rp = recaudo_vs_provision(resultados['ope_cartera'][0], resultados['ope_provision'][0])
+        if not df_rp.empty:
+            figura_rp = lambda: px.bar(df_rp, x='Mes', y=['Recaudo', 'Provisión'], barmode='group',
+                                       color_discrete_sequence=['#27ae60', COLOR_ACCENT])
+            with medir_etapa('plotly', 'ope_cartera,ope_provision'):
+                st.plotly_chart(figura_cacheada(['ope_cartera', 'ope_provision'], 'recaudo_provision', (anio_dash,), figura_rp),
+                                use_container_width=True)
+            provision = df_rp['Provisión'].sum()
+            if provision: st.caption(f"Cobertura del año: {df_rp['Recaudo'].sum() / provision:.0%} del valor provisionado")
+        else:
+            st.info("Sin recaudo ni provisión para este año.")
+
     # --- SECCIÓN INDICADORES (KPIs) ---
     st.markdown("### 🚦 Estado de Indicadores")
     if not df_ind_f.empty:
-        st.dataframe(df_ind_f, use_container_width=True)
+        with medir_etapa('st.dataframe', 'catalogo_indicadores'):
+            st.dataframe(df_ind_f, use_container_width=True)
     else:
         st.info("No hay indicadores registrados para este periodo.")
 
@@ -451,62 +334,142 @@ if nav == "🚀 Dashboard Gerencial":
 # MÓDULO 2: INDICADORES (DETALLE)
 # ==============================================================================
 elif nav == "📊 Indicadores":
-    df, _ = obtener_datos("INDICADORES", "catalogo_indicadores")
+    # El filtro por área va en SQL sobre area_norm (indexada): solo llegan las filas del área del usuario
+    df, _ = obtener_datos("INDICADORES", "catalogo_indicadores", area=area_alcance)
     
     if df.empty:
         st.warning("No hay indicadores. Ve a 'Gestión y Carga' para subir el archivo base.")
     else:
+        # area_norm y fecha_carga son del motor: el usuario ve y exporta las columnas de su archivo
+        df = sin_columnas_internas(df)
         df.columns = [normalize_text(c) for c in df.columns]
-        col_area = next((c for c in df.columns if 'AREA' in c), None)
-        
-        if col_area:
-            if normalize_text(area_usuario) not in ['TODAS', 'ALL'] and normalize_text(rol_usuario) not in ['ADMIN', 'CEO']:
-                df = df[df[col_area].apply(normalize_text) == normalize_text(area_usuario)]
         
-        st.dataframe(df, use_container_width=True)
+        with medir_etapa('st.dataframe', 'catalogo_indicadores'):
+            st.dataframe(df, use_container_width=True)
+        # Exporta desde SQL con el mismo alcance por área, no desde el DataFrame en memoria
+        tabla_ind, roles_ind = resolver_tabla("catalogo_indicadores")
+        botones_exportacion(partial(bloques_consulta, tabla_ind, roles_ind, area=area_alcance,
+                                    columnas=columnas_visibles(tabla_ind)), "indicadores", "indicadores")
 
 # ==============================================================================
 # MÓDULO 3: TABLERO OPERATIVO (DETALLE)
 # ==============================================================================
 elif nav == "📈 Tablero Operativo":
-    tabs = st.tabs(list(MAPA_TABLAS_OPERATIVAS.keys()))
-    
-    for i, (nombre_ui, nombre_tabla) in enumerate(MAPA_TABLAS_OPERATIVAS.items()):
-        with tabs[i]:
-            df, real_name = obtener_datos(nombre_ui, nombre_tabla)
-            
-            if not df.empty:
-                # Filtros Locales por Pestaña
-                c1, c2 = st.columns(2)
-                
-                df_view = df.copy()
-                col_anio = buscar_columna_inteligente(df_view, ['ANIO', 'YEAR', 'PERIODO_ANIO'])
-                col_mes = buscar_columna_inteligente(df_view, ['MES', 'MONTH', 'PERIODO_MES'])
-                
-                sel_a, sel_m = None, None
-                
-                if col_anio:
-                    anios = sorted(df_view[col_anio].astype(str).unique())
-                    sel_a = c1.multiselect(f"Año", anios, key=f"fa_{i}")
-                    if sel_a: df_view = df_view[df_view[col_anio].astype(str).isin(sel_a)]
-                
-                if col_mes:
-                    meses = df_view[col_mes].astype(str).unique()
-                    sel_m = c2.multiselect(f"Mes", meses, key=f"fm_{i}")
-                    if sel_m: df_view = df_view[df_view[col_mes].astype(str).isin(sel_m)]
-                
-                st.dataframe(df_view, use_container_width=True)
-                st.caption(f"Registros: {len(df_view)}")
-            else:
-                st.info(f"Sin datos en {nombre_ui}.")
+    # Solo se consulta la pestaña elegida; la grilla se pagina en SQL
+    nombres_ui = list(MAPA_TABLAS_OPERATIVAS.keys())
+    nombre_ui = st.radio("Proceso", nombres_ui, horizontal=True, label_visibility="collapsed", key="tab_operativa")
+    i = nombres_ui.index(nombre_ui)
+    real_name, roles = resolver_tabla(MAPA_TABLAS_OPERATIVAS[nombre_ui])
+
+    if real_name and contar_registros(real_name, roles, area=area_alcance):
+        # Filtros Locales por Pestaña
+        c1, c2 = st.columns(2)
+        anios, meses = opciones_periodo(real_name, roles, area=area_alcance)
+        
+        sel_a, sel_m = [], []
+        
+        # Columnas canónicas enteras: opciones numéricas, el mes se muestra por nombre
+        if roles.get('anio'):
+            sel_a = c1.multiselect(f"Año", list(anios), key=f"fa_{i}")
+        
+        if roles.get('mes'):
+            sel_m = c2.multiselect(f"Mes", list(meses), format_func=lambda m: LISTA_MESES[m - 1], key=f"fm_{i}")
+        
+        total = contar_registros(real_name, roles, sel_a, sel_m, area=area_alcance)
+        paginas = max(1, -(-total // FILAS_POR_PAGINA))
+        # La clave incluye los filtros para volver a la página 1 al cambiarlos
+        pagina = st.number_input("Página", min_value=1, max_value=paginas, value=1, key=f"pag_{i}_{sel_a}_{sel_m}")
+        df_view = leer_pagina(real_name, roles, sel_a, sel_m, int(pagina), area=area_alcance)
+        
+        with medir_etapa('st.dataframe', real_name):
+            st.dataframe(df_view, use_container_width=True)
+        st.caption(f"Registros: {total} · Página {int(pagina)} de {paginas}")
+        # La descarga trae todos los registros filtrados, no solo la página visible
+        nombre_base = "_".join([real_name] + [str(a) for a in sel_a] + [f"{m:02d}" for m in sel_m])
+        botones_exportacion(partial(bloques_consulta, real_name, roles, sel_a, sel_m, area=area_alcance), nombre_base, f"tab_{i}")
+    else:
+        st.info(f"Sin datos en {nombre_ui}.")
 
 # ==============================================================================
-# MÓDULO 4: GESTIÓN Y CARGA
+# MÓDULO 4: BÚSQUEDA GLOBAL
+# ==============================================================================
+elif nav == "🔎 Búsqueda Global":
+    # Índices FTS5 de las tablas operativas: solo viajan al navegador los resultados de la página
+    consulta = st.text_input("Buscar en Facturación, Radicación, Cartera y Cuentas Médicas",
+                             placeholder="Factura, documento del paciente, aseguradora…", key="busqueda_global")
+    if consulta.strip():
+        conteos, resultados = buscar_texto(consulta, area=area_alcance)
+        total = sum(conteos.values())
+        if total:
+            paginas = max(1, -(-total // RESULTADOS_POR_PAGINA))
+            # La clave incluye la consulta para volver a la página 1 al cambiarla
+            pagina = st.number_input("Página", min_value=1, max_value=paginas, value=1, key=f"pag_busqueda_{consulta}")
+            if pagina > 1:
+                conteos, resultados = buscar_texto(consulta, area=area_alcance, pagina=int(pagina))
+            with medir_etapa('st.dataframe', 'busqueda'):
+                st.dataframe(resultados, hide_index=True, use_container_width=True,
+                             column_config={'Registro': st.column_config.TextColumn(width="large")})
+            nombres = {v: k.title() for k, v in MAPA_TABLAS_OPERATIVAS.items()}
+            detalle = ", ".join(f"{nombres.get(t, t)}: {n}" for t, n in conteos.items() if n)
+            st.caption(f"Coincidencias: {total} ({detalle}) · Página {int(pagina)} de {paginas}")
+        else:
+            st.info("Sin coincidencias.")
+
+# ==============================================================================
+# MÓDULO 5: GESTIÓN Y CARGA
 # ==============================================================================
 elif nav == "📂 Gestión y Carga":
     st.markdown("### 🛠️ Centro de Control de Datos")
     
-    tab_carga, tab_usr, tab_brand = st.tabs(["📤 Carga Masiva", "👤 Usuarios", "🎨 Marca"])
+    # El panel de Rendimiento es solo para administradores
+    es_admin = normalize_text(rol_usuario) in ['ADMIN', 'ADMINISTRADOR', 'ADMIN DELEGADO']
+    pestanas = ["📤 Carga Masiva", "👤 Usuarios", "🎨 Marca"] + (["⏱️ Rendimiento"] if es_admin else [])
+    tab_carga, tab_usr, tab_brand, *tab_rend = st.tabs(pestanas)
+
+    def encolar(archivos, tabla, **opciones):
+        """Deja los archivos en la cola del trabajador de cargas y lo arranca si no está corriendo."""
+        try:
+            for archivo in archivos:
+                id_trabajo = encolar_carga(archivo, tabla, usuario=user['USUARIO'], **opciones)
+                st.success(f"📥 Carga #{id_trabajo} ({archivo.name}) en cola. Se procesa en segundo plano; "
+                           "puede seguir trabajando o cerrar la pestaña.")
+            asegurar_trabajador()
+        except sqlite3.OperationalError:  # Lock de la cola retenido más de SEGUNDOS_ESPERA_COLA
+            st.warning("⏳ La cola de cargas está ocupada; intente de nuevo en unos segundos.")
+        except Exception as e: st.error(f"Error: {e}")
+
+    def panel_trabajos(sondeando):
+        """Estado de las cargas en segundo plano; se refresca solo mientras haya alguna activa."""
+        df_j = listar_trabajos()
+        activos = df_j['estado'].isin(['pendiente', 'procesando']).any()
+        if sondeando and not activos:
+            st.rerun()  # Terminaron todas: la página completa se actualiza y deja de sondear
+        if activos: asegurar_trabajador()  # Por si el trabajador se detuvo con cargas pendientes
+        if df_j.empty:
+            st.caption("Aún no hay cargas registradas.")
+            return
+        estados = {'pendiente': '🕓 En cola', 'procesando': '⏳ Procesando', 'completado': '✅ Completado', 'error': '❌ Error'}
+        vista = pd.DataFrame({
+            '#': df_j['id'],
+            'Archivo': df_j['nombre_original'],
+            'Tabla': df_j['tabla'],
+            'Periodo': (df_j['mes'].fillna('') + ' ' + pd.to_numeric(df_j['anio']).astype('Int64').astype('string').fillna('')).str.strip(),
+            'Modo': df_j['modo'],
+            'Estado': df_j['estado'].map(estados),
+            'Avance': pd.to_numeric(df_j['avance']).mul(100).where(df_j['estado'] == 'procesando',
+                                                                    (df_j['estado'] == 'completado') * 100.0),
+            'Filas': df_j['filas'],
+            'Filas/s': pd.to_numeric(df_j['filas_seg']).round(),
+            'Detalle': df_j['mensaje'],
+            'Usuario': df_j['usuario'],
+            'Encolado': df_j['creado'],
+            'Terminado': df_j['terminado'],
+        })
+        st.dataframe(vista, hide_index=True, use_container_width=True, column_config={
+            'Avance': st.column_config.ProgressColumn(min_value=0, max_value=100, format="%.0f%%"),
+            'Filas': st.column_config.NumberColumn(format="%d"),
+            'Filas/s': st.column_config.NumberColumn(format="%d"),
+        })
     
     # --- PESTAÑA 1: CARGA DE ARCHIVOS ---
     with tab_carga:
@@ -518,12 +481,7 @@ elif nav == "📂 Gestión y Carga":
             st.info("Sube el archivo 'BASE INDICADORES.csv'")
             f = st.file_uploader("Archivo Indicadores", type=['csv', 'xlsx'])
             if f and st.button("Procesar Indicadores"):
-                try:
-                    df = pd.read_csv(f) if f.name.endswith('.csv') else pd.read_excel(f)
-                    ok, msg = cargar_dataframe_bd(df, "catalogo_indicadores", modo="replace")
-                    if ok: st.success(msg)
-                    else: st.error(msg)
-                except Exception as e: st.error(f"Error: {e}")
+                encolar([f], "catalogo_indicadores", modo="replace")
                 
         else: # Datos Operativos
             proceso = st.selectbox("Seleccione el Proceso:", list(MAPA_TABLAS_OPERATIVAS.keys()))
@@ -534,20 +492,30 @@ elif nav == "📂 Gestión y Carga":
             anio = c1.selectbox("Año de los datos:", LISTA_ANIOS)
             mes = c2.selectbox("Mes de los datos:", LISTA_MESES)
             
-            f = st.file_uploader(f"Archivo para {proceso}", type=['csv', 'xlsx'])
-            modo = st.radio("Modo:", ["Agregar (Append)", "Reemplazar Todo (Replace)"])
+            archivos = st.file_uploader(f"Archivos para {proceso}", type=['csv', 'xlsx'], accept_multiple_files=True)
+            modos = {"Agregar (Append)": 'append',
+                     "Reemplazar Solo el Mes Seleccionado": 'particion',
+                     "Reemplazar Todo (Replace)": 'replace'}
+            modo = st.radio("Modo:", list(modos.keys()))
+            deduplicar = False
+            if modos[modo] == 'append':
+                deduplicar = st.checkbox("Omitir filas ya cargadas (evita duplicados si el archivo se sube dos veces)")
+            else:
+                st.caption(f"Solo se reemplazan los registros de {mes} {anio}; el archivo debe traer únicamente ese periodo."
+                           if modos[modo] == 'particion' else "Se borra toda la historia de la tabla antes de cargar.")
             
-            if f and st.button(f"Cargar a {proceso}"):
-                try:
-                    df = pd.read_csv(f) if f.name.endswith('.csv') else pd.read_excel(f)
-                    
-                    modo_sql = 'append' if 'Append' in modo else 'replace'
-                    # Pasamos anio y mes para que la función los inyecte si faltan
-                    ok, msg = cargar_dataframe_bd(df, tabla_destino, modo=modo_sql, anio_sel=anio, mes_sel=mes)
-                    
-                    if ok: st.success(msg)
-                    else: st.error(msg)
-                except Exception as e: st.error(f"Error: {e}")
+            if archivos and st.button(f"Cargar a {proceso}"):
+                # Cada archivo reemplazaría lo cargado por el anterior en el mismo periodo
+                if modos[modo] != 'append' and len(archivos) > 1:
+                    st.error("Para reemplazar suba un solo archivo; varios archivos se cargan en modo Agregar.")
+                else:
+                    # Pasamos anio y mes para que la carga los inyecte si faltan; cada archivo es un trabajo en cola
+                    encolar(archivos, tabla_destino, modo=modos[modo], anio_sel=anio, mes_sel=mes, deduplicar=deduplicar)
+
+        st.markdown("---")
+        st.subheader("Cargas en Segundo Plano")
+        hay_activas = listar_trabajos()['estado'].isin(['pendiente', 'procesando']).any()
+        st.fragment(panel_trabajos, run_every=SEGUNDOS_SONDEO if hay_activas else None)(hay_activas)
 
     # --- PESTAÑA 2: USUARIOS ---
     with tab_usr:
@@ -584,3 +552,46 @@ elif nav == "📂 Gestión y Carga":
         if ub:
             with open(LOCAL_BANNER_PATH, "wb") as f: f.write(ub.getbuffer())
             st.success("Banner actualizado")
+
+    # --- PESTAÑA 4: RENDIMIENTO ---
+    if tab_rend:
+        with tab_rend[0]:
+            st.subheader("Tiempos por Etapa")
+            st.caption("Mediciones recientes de todas las sesiones (en memoria, se pierden al reiniciar la app).")
+            df_t = get_registro_tiempos().como_dataframe()
+            
+            if df_t.empty:
+                st.info("Aún no hay mediciones. Navegue por el tablero para generarlas.")
+            else:
+                c1, c2, c3 = st.columns(3)
+                sel_nav = c1.multiselect("Página", sorted(df_t['nav'].unique()), key="rend_nav")
+                sel_usr = c2.multiselect("Usuario", sorted(df_t['usuario'].unique()), key="rend_usr")
+                sel_tab = c3.multiselect("Tabla", sorted(t for t in df_t['tabla'].unique() if t), key="rend_tab")
+                if sel_nav: df_t = df_t[df_t['nav'].isin(sel_nav)]
+                if sel_usr: df_t = df_t[df_t['usuario'].isin(sel_usr)]
+                if sel_tab: df_t = df_t[df_t['tabla'].isin(sel_tab) | (df_t['etapa'] == 'rerun')]
+                
+                st.markdown("##### Percentiles de latencia (ms)")
+                st.dataframe(percentiles_etapas(df_t).round(1), use_container_width=True, hide_index=True)
+                
+                st.markdown("##### Reruns más lentos")
+                lentos = df_t[df_t['etapa'] == 'rerun'].nlargest(15, 'ms')[['rerun', 'fecha', 'nav', 'usuario', 'ms']]
+                st.dataframe(lentos.round({'ms': 1}), use_container_width=True, hide_index=True)
+                if not lentos.empty:
+                    rerun_sel = st.selectbox("Detalle del rerun:", lentos['rerun'].tolist(), key="rend_rerun")
+                    detalle = df_t[(df_t['rerun'] == rerun_sel) & (df_t['etapa'] != 'rerun')]
+                    st.dataframe(detalle[['etapa', 'tabla', 'ms']].sort_values('ms', ascending=False).round(1),
+                                 use_container_width=True, hide_index=True)
+                
+                st.markdown("##### Exportar")
+                csv_t = df_t.to_csv(index=False).encode('utf-8')
+                c1, c2 = st.columns(2)
+                c1.download_button("⬇️ Descargar log (CSV)", csv_t, file_name="rendimiento.csv", mime="text/csv")
+                if c2.button("💾 Guardar log en disco"):
+                    os.makedirs(LOG_RENDIMIENTO_DIR, exist_ok=True)
+                    ruta_log = os.path.join(LOG_RENDIMIENTO_DIR, f"rendimiento_{datetime.now():%Y%m%d_%H%M%S}.csv")
+                    with open(ruta_log, "wb") as f: f.write(csv_t)
+                    st.success(f"Log guardado en {os.path.abspath(ruta_log)}")
+
+# Cierra la medición del rerun (los st.stop()/st.rerun() previos no llegan aquí y no se registran)
+cerrar_rerun()
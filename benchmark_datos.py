@@ -0,0 +1,380 @@
+"""
+Benchmark sin servidor de la capa de datos (motor_datos) con datos sintéticos.
+
+Genera todas las tablas de MAPA_TABLAS_OPERATIVAS a la escala pedida (filas por tabla),
+con meses escritos de formas mezcladas ('Enero', 'ENERO', '01', 'Setiembre', vacíos), montos con
+formato colombiano ('$1.234.567,89'), fechas dd/mm/aaaa y nombres de columna con tildes, y mide:
+  - ingesta: filas/s de cargar_bloques_bd, sin contar el tiempo de generar los datos, y el
+    reemplazo de un solo mes (modo 'particion')
+  - dashboard: resúmenes + filtro de mes, KPI, serie mensual y top de aseguradoras
+  - tablero: conteo, opciones de periodo, páginas de la grilla y lectura filtrada
+  - exportación: CSV y XLSX por bloques del mes filtrado, escritos a disco
+  - búsqueda: texto libre en los índices FTS5 (término común, prefijo de documento, con área)
+  - cartera: edades de cartera de toda la historia (recálculo completo y con alcance por área); con
+    DuckDB instalado, también la escritura del snapshot Parquet y las mismas edades con ese motor
+  - arranque: primer pintado del login en un proceso nuevo (imports de la app y migraciones de
+    esquema, con la BD ya poblada y con una BD nueva) y un rerun posterior
+  - memoria pico (tracemalloc) de cada etapa, en una corrida aparte para no sesgar los tiempos
+
+Los resultados se escriben como JSON (un registro por escala/etapa/caso) para compararlos entre corridas.
+
+Uso:
+    python benchmark_datos.py --escalas 10k,1M --salida resultados.json
+    python benchmark_datos.py --escalas 10k --comparar resultados_anteriores.json
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+from importlib.metadata import version as version_paquete
+
+import numpy as np
+import pandas as pd
+import streamlit.logger
+
+import motor_datos as md
+
+# Sin servidor, Streamlit avisa en cada lectura que no hay contexto de sesión
+streamlit.logger.set_log_level('error')
+
+ANIO_BENCH = 2025
+MES_BENCH = 'Marzo'
+
+# Formas en que llega el mes en los archivos reales (se elige una al azar por fila)
+VARIANTES_MES = [
+    [m, m.upper(), m.lower(), f" {m} ", str(i), f"{i:02d}"] for i, m in enumerate(md.LISTA_MESES, start=1)
+]
+VARIANTES_MES[8][2] = 'Setiembre'
+
+# Corre en un proceso nuevo: pinta el login de la app con AppTest y devuelve los tiempos como JSON
+SCRIPT_ARRANQUE = """
+import json, sys, time
+from streamlit.testing.v1 import AppTest
+inicio = time.perf_counter()
+app = AppTest.from_file(sys.argv[1], default_timeout=120).run()
+frio = time.perf_counter() - inicio
+inicio = time.perf_counter()
+app.run()
+caliente = time.perf_counter() - inicio
+print(json.dumps({'segundos': frio, 'segundos_cache': caliente, 'pandas_cargado': 'pandas' in sys.modules,
+                  'errores': len(app.exception)}))
+"""
+
+ASEGURADORAS = ['Sura', 'Nueva EPS', 'Sanitas', 'Compensar', 'Famisanar', 'Salud Total', 'Coosalud', 'Mutual Ser', 'Particular']
+AREAS = ['Urgencias', 'Hospitalización', 'Cirugía', 'Consulta Externa', 'Imágenes Diagnósticas', 'Laboratorio Clínico']
+
+# Columnas propias de cada tabla: nombre -> (tipo, escala)
+MEDIDAS_POR_TABLA = {
+    'ope_facturacion': {'VALOR FACTURADO': ('monto', 5e6)},
+    'ope_radicacion': {'VALOR RADICADO': ('monto', 5e6), 'DÍAS RADICACIÓN': ('entero', 30)},
+    'ope_admisiones': {'CANTIDAD': ('entero', 20)},
+    'ope_autorizaciones': {'CANTIDAD': ('entero', 10), 'TIEMPO RESPUESTA (HORAS)': ('monto', 72)},
+    'ope_cuentas_medicas': {'VALOR GLOSADO': ('monto', 2e6), 'VALOR ACEPTADO': ('monto', 1e6)},
+    'ope_cartera': {'RECAUDO': ('monto', 8e6), 'SALDO': ('monto', 2e7)},
+    'ope_provision': {'VALOR PROVISIÓN': ('monto', 3e6)},
+}
+
+def parsear_escala(texto):
+    """'10k' -> 10000, '1M' -> 1000000, '20M' -> 20000000."""
+    texto = texto.strip().upper()
+    factor = {'K': 1_000, 'M': 1_000_000}.get(texto[-1], 1)
+    return int(float(texto.rstrip('KM')) * factor)
+
+def montos_colombianos(valores):
+    """1234567.891 -> '$1.234.567,89', como llegan los montos en las exportaciones."""
+    return '$' + pd.Series(valores).map('{:,.2f}'.format).str.translate(str.maketrans(',.', '.,'))
+
+def bloques_sinteticos(tabla, filas, semilla, tiempos, filas_por_bloque=md.FILAS_POR_BLOQUE, mes=None):
+    """
+    Genera (df, avance) como leer_archivo_por_bloques; acumula en `tiempos['generacion']` lo que tarda.
+    Con `mes` (1..12) todas las filas son de ese mes (archivo de corrección de un periodo).
+    """
+    rng = np.random.default_rng(semilla)
+    variantes = np.array(VARIANTES_MES, dtype=object)
+    hechas = 0
+    while hechas < filas:
+        inicio = time.perf_counter()
+        n = min(filas_por_bloque, filas - hechas)
+        meses = variantes[rng.integers(0, 12, n) if mes is None else mes - 1, rng.integers(0, variantes.shape[1], n)]
+        if mes is None: meses[rng.random(n) < 0.01] = None
+        df = pd.DataFrame({
+            'AÑO': ANIO_BENCH,
+            'MES': meses,
+            'ASEGURADORA': rng.choice(ASEGURADORAS, n),
+            'NÚMERO DOCUMENTO': (rng.integers(10**6, 10**10, n)).astype(str),
+            'FECHA ATENCIÓN': pd.Series(np.datetime64(f'{ANIO_BENCH}-01-01') + rng.integers(0, 365, n)).dt.strftime('%d/%m/%Y'),
+            'ÁREA': rng.choice(AREAS, n),
+        })
+        for col, (tipo, escala) in MEDIDAS_POR_TABLA[tabla].items():
+            df[col] = rng.integers(0, int(escala), n) if tipo == 'entero' else montos_colombianos(rng.random(n) * escala)
+        hechas += n
+        tiempos['generacion'] += time.perf_counter() - inicio
+        yield df, hechas / filas
+
+def vaciar_cache():
+    """Deja el caché de resultados vacío para medir lecturas en frío."""
+    md.get_cache_resultados.clear()
+
+def medir(funcion, repeticiones):
+    """(segundos en frío, mediana en caliente, memoria pico MB en frío) de una etapa de lectura."""
+    vaciar_cache()
+    inicio = time.perf_counter()
+    funcion()
+    frio = time.perf_counter() - inicio
+
+    calientes = []
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        funcion()
+        calientes.append(time.perf_counter() - inicio)
+
+    vaciar_cache()
+    tracemalloc.start()
+    funcion()
+    _, pico = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return frio, statistics.median(calientes) if calientes else None, pico / 2**20
+
+def etapa_dashboard(anio, mes):
+    """Mismo trabajo que el Dashboard Gerencial: lecturas en paralelo, KPI y gráficos."""
+    def resumen_filtrado(nombre_tabla):
+        res_y = md.obtener_resumen(nombre_tabla, anio)
+        return res_y, md.filtrar_por_periodo(res_y, None, mes)
+
+    tareas = {t: (lambda t=t: resumen_filtrado(t)) for t in md.ROLLUPS_MENSUALES}
+    tareas.update({f"historico_{t}": (lambda t=t: md.obtener_resumen(t)) for t in md.PROCESOS_TENDENCIA.values()})
+    tareas['catalogo_indicadores'] = lambda: md.obtener_datos('INDICADORES', 'catalogo_indicadores', anio=anio, mes=mes)[0]
+    resultados = dict(md.leer_en_paralelo(tareas))
+    kpis = {t: md.total_kpi(resultados[t][1]) for t in md.ROLLUPS_MENSUALES}
+    historicos = {etiqueta: resultados[f"historico_{t}"] for etiqueta, t in md.PROCESOS_TENDENCIA.items()}
+    tendencia = md.tendencia_procesos(historicos, md.anios_resumenes(historicos))
+    top = md.top_aseguradoras(resultados['ope_facturacion'][1])
+    return kpis, tendencia, top
+
+def etapas_tablero(nombre_tabla):
+    """Casos de la pestaña del Tablero Operativo de una tabla: {caso: función}."""
+    def caso(nombre):
+        tabla_real, roles = md.resolver_tabla(nombre_tabla)
+        anios, meses = [ANIO_BENCH], [md.numero_mes(MES_BENCH)]
+        total = md.contar_registros(tabla_real, roles)
+        ultima = max(1, -(-total // md.FILAS_POR_PAGINA))
+        if nombre == 'conteo': return total
+        if nombre == 'opciones_periodo': return md.opciones_periodo(tabla_real, roles)
+        if nombre == 'pagina_1': return md.leer_pagina(tabla_real, roles, pagina=1)
+        if nombre == 'ultima_pagina': return md.leer_pagina(tabla_real, roles, pagina=ultima)
+        if nombre == 'conteo_filtrado': return md.contar_registros(tabla_real, roles, anios, meses)
+        if nombre == 'pagina_filtrada': return md.leer_pagina(tabla_real, roles, anios, meses, pagina=1)
+        if nombre == 'datos_mes': return md.obtener_datos(nombre_tabla, nombre_tabla, anio=ANIO_BENCH, mes=MES_BENCH)
+        # Alcance por área de un líder (filtro sobre area_norm)
+        if nombre == 'conteo_area': return md.contar_registros(tabla_real, roles, anios, meses, area=AREAS[0])
+        if nombre == 'pagina_area': return md.leer_pagina(tabla_real, roles, anios, meses, pagina=1, area=AREAS[0])
+    return {n: (lambda n=n: caso(n)) for n in
+            ['conteo', 'opciones_periodo', 'pagina_1', 'ultima_pagina', 'conteo_filtrado', 'pagina_filtrada', 'datos_mes',
+             'conteo_area', 'pagina_area']}
+
+def etapas_exportacion(nombre_tabla, directorio):
+    """Descarga del Tablero Operativo (mes filtrado) en cada formato: {caso: función}."""
+    def caso(formato, exportar):
+        tabla_real, roles = md.resolver_tabla(nombre_tabla)
+        ruta = os.path.join(directorio, f"bench_export.{formato}")
+        try:
+            with open(ruta, 'wb') as salida:
+                return exportar(md.bloques_consulta(tabla_real, roles, [ANIO_BENCH], [md.numero_mes(MES_BENCH)]), salida)
+        finally: os.remove(ruta)
+    return {f: (lambda f=f, e=e: caso(f, e)) for f, e in [('csv', md.exportar_csv), ('xlsx', md.exportar_xlsx)]}
+
+def medir_arranque(ruta_bd):
+    """Login de la app en un proceso nuevo contra `ruta_bd`: {segundos, segundos_cache, pandas_cargado, errores}."""
+    app = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'app_indicadores.py')
+    salida = subprocess.run([sys.executable, '-c', SCRIPT_ARRANQUE, app], env=dict(os.environ, CHRISTUS_DB_PATH=ruta_bd),
+                            cwd=os.path.dirname(ruta_bd), capture_output=True, text=True, check=True)
+    return json.loads(salida.stdout.strip().splitlines()[-1])
+
+def etapas_busqueda():
+    """Búsqueda global (primera página): {caso: función}."""
+    casos = {
+        'comun': lambda: md.buscar_texto(ASEGURADORAS[0]),
+        'documento': lambda: md.buscar_texto('12345'),
+        'dos_terminos': lambda: md.buscar_texto(f"{ASEGURADORAS[1]} {AREAS[1]}"),
+        'comun_area': lambda: md.buscar_texto(ASEGURADORAS[0], area=AREAS[0]),
+        'pagina_10': lambda: md.buscar_texto(ASEGURADORAS[0], pagina=10),
+    }
+    return casos
+
+def ingerir(tabla, filas, semilla):
+    """Carga la tabla sintética completa y devuelve (segundos de ingesta, mensaje)."""
+    tiempos = {'generacion': 0.0}
+    inicio = time.perf_counter()
+    ok, mensaje = md.cargar_bloques_bd(bloques_sinteticos(tabla, filas, semilla, tiempos), tabla, 'replace', ANIO_BENCH, 'Enero')
+    if not ok: raise RuntimeError(f"{tabla}: {mensaje}")
+    return time.perf_counter() - inicio - tiempos['generacion'], mensaje
+
+def reemplazar_mes(tabla, filas, semilla):
+    """Reemplaza solo el periodo (ANIO_BENCH, MES_BENCH) con un archivo de ~1/12 de las filas."""
+    tiempos = {'generacion': 0.0}
+    inicio = time.perf_counter()
+    bloques = bloques_sinteticos(tabla, max(1, filas // 12), semilla, tiempos, mes=md.numero_mes(MES_BENCH))
+    ok, mensaje = md.cargar_bloques_bd(bloques, tabla, 'particion', ANIO_BENCH, MES_BENCH)
+    if not ok: raise RuntimeError(f"{tabla}: {mensaje}")
+    return time.perf_counter() - inicio - tiempos['generacion']
+
+def memoria_ingesta(tabla, filas):
+    """Memoria pico de la carga por bloques, sobre una muestra de dos bloques en una tabla temporal."""
+    tabla_muestra = f"bench_muestra_{tabla}"
+    tracemalloc.start()
+    ok, mensaje = md.cargar_bloques_bd(bloques_sinteticos(tabla, min(filas, 2 * md.FILAS_POR_BLOQUE), 0, {'generacion': 0.0}),
+                                       tabla_muestra, 'replace', ANIO_BENCH, 'Enero')
+    _, pico = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    conn, _ = md.get_connection(escritura=True)
+    try:
+        conn.execute(f"DROP TABLE IF EXISTS {md.citar_sql(tabla_muestra)}")
+        conn.execute("DELETE FROM registro_esquema WHERE tabla = ?", (tabla_muestra,))
+        conn.execute("DELETE FROM control_versiones WHERE tabla = ?", (tabla_muestra.lower(),))
+        conn.commit()
+    finally: conn.close()
+    if not ok: raise RuntimeError(f"{tabla_muestra}: {mensaje}")
+    return pico / 2**20
+
+def correr_escala(etiqueta, filas, directorio, repeticiones, tablas):
+    """Corre todas las etapas sobre una BD nueva y devuelve la lista de registros de resultado."""
+    ruta = os.path.join(directorio, f"bench_{etiqueta}.db")
+    for sufijo in ['', '-wal', '-shm']:
+        if os.path.exists(ruta + sufijo): os.remove(ruta + sufijo)
+    os.environ['CHRISTUS_DB_PATH'] = ruta
+    md.get_pool.clear()
+    md.migrar_esquema.clear()  # La ruta pudo usarse antes con otra BD
+    vaciar_cache()
+    md.init_db()
+
+    registros = []
+    def registrar(etapa, caso, **valores):
+        registros.append({'escala': etiqueta, 'filas': filas, 'etapa': etapa, 'caso': caso, **valores})
+        print(f"  {etapa:<10} {caso:<40} " + "  ".join(f"{k}={v:,.4f}" if isinstance(v, float) else f"{k}={v}" for k, v in valores.items()), flush=True)
+
+    for i, tabla in enumerate(tablas):
+        segundos, _ = ingerir(tabla, filas, semilla=i)
+        registrar('ingesta', tabla, segundos=segundos, filas_por_s=filas / max(segundos, 1e-9),
+                  memoria_pico_mb=memoria_ingesta(tabla, filas))
+        segundos = reemplazar_mes(tabla, filas, semilla=100 + i)
+        registrar('ingesta', f"{tabla}/reemplazo_mes", segundos=segundos, filas_por_s=max(1, filas // 12) / max(segundos, 1e-9))
+
+    for mes in ['Todos', MES_BENCH]:
+        frio, caliente, pico = medir(lambda: etapa_dashboard(ANIO_BENCH, mes), repeticiones)
+        registrar('dashboard', f"mes={mes}", segundos=frio, segundos_cache=caliente, memoria_pico_mb=pico)
+
+    for tabla in tablas:
+        for caso, funcion in etapas_tablero(tabla).items():
+            frio, caliente, pico = medir(funcion, repeticiones)
+            registrar('tablero', f"{tabla}/{caso}", segundos=frio, segundos_cache=caliente, memoria_pico_mb=pico)
+        # La exportación no pasa por el caché: una sola corrida más la de memoria
+        for caso, funcion in etapas_exportacion(tabla, directorio).items():
+            segundos, _, pico = medir(funcion, 0)
+            registrar('exportacion', f"{tabla}/{caso}", segundos=segundos, memoria_pico_mb=pico)
+
+    if set(tablas) & set(md.TABLAS_BUSQUEDA):
+        for caso, funcion in etapas_busqueda().items():
+            frio, caliente, pico = medir(funcion, repeticiones)
+            registrar('busqueda', caso, segundos=frio, segundos_cache=caliente, memoria_pico_mb=pico)
+
+    if 'ope_cartera' in tablas:
+        for caso, funcion in [('edades', lambda: md.edades_cartera(ANIO_BENCH)),
+                              ('edades_area', lambda: md.edades_cartera(ANIO_BENCH, area=AREAS[0]))]:
+            frio, caliente, pico = medir(funcion, repeticiones)
+            registrar('cartera', caso, segundos=frio, segundos_cache=caliente, memoria_pico_mb=pico)
+        if md.duckdb_instalado():
+            motor, md.MOTOR_ANALITICO = md.MOTOR_ANALITICO, 'duckdb'
+            try:
+                # Las cargas de arriba no escribieron snapshot (motor 'sqlite'): la primera lectura lo arma completo
+                tabla_real, roles = md.resolver_tabla('ope_cartera')
+                inicio = time.perf_counter()
+                md.snapshot_vigente(tabla_real, roles)
+                registrar('cartera', 'snapshot_parquet', segundos=time.perf_counter() - inicio)
+                for caso, funcion in [('edades_duckdb', lambda: md.edades_cartera(ANIO_BENCH)),
+                                      ('edades_area_duckdb', lambda: md.edades_cartera(ANIO_BENCH, area=AREAS[0]))]:
+                    frio, caliente, pico = medir(funcion, repeticiones)
+                    registrar('cartera', caso, segundos=frio, segundos_cache=caliente, memoria_pico_mb=pico)
+            finally: md.MOTOR_ANALITICO = motor
+
+    # Arranque en frío del login (en otro proceso): con la BD poblada y con una BD sin migrar
+    ruta_nueva = os.path.join(directorio, f"bench_{etiqueta}_arranque.db")
+    for caso, ruta_bd in [('login', ruta), ('login_bd_nueva', ruta_nueva)]:
+        registrar('arranque', caso, **medir_arranque(ruta_bd))
+    for sufijo in ['', '-wal', '-shm']:
+        if os.path.exists(ruta_nueva + sufijo): os.remove(ruta_nueva + sufijo)
+
+    md.get_pool.clear()
+    return registros
+
+def version_codigo():
+    try: return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                               cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError: return None
+
+def comparar(actuales, ruta_base):
+    """Imprime la razón actual/base de los tiempos en frío de cada registro común."""
+    with open(ruta_base, encoding='utf-8') as f: base = json.load(f)
+    clave = lambda r: (r['escala'], r['etapa'], r['caso'])
+    indice = {clave(r): r for r in base['resultados']}
+    print(f"\nComparación contra {ruta_base} (commit {base.get('entorno', {}).get('commit')}); razón < 1 es más rápido:")
+    for r in actuales:
+        previo = indice.get(clave(r))
+        if not previo or not previo.get('segundos'): continue
+        print(f"  {r['escala']:<6} {r['etapa']:<10} {r['caso']:<40} {previo['segundos']:.4f}s -> {r['segundos']:.4f}s"
+              f"  x{r['segundos'] / previo['segundos']:.2f}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark sin servidor de ingesta, dashboard y tablero operativo.")
+    parser.add_argument('--escalas', default='10k', help="Filas por tabla, separadas por coma (p. ej. 10k,1M,20M)")
+    parser.add_argument('--tablas', default=','.join(md.MAPA_TABLAS_OPERATIVAS.values()), help="Tablas operativas a generar")
+    parser.add_argument('--repeticiones', type=int, default=3, help="Lecturas en caliente por caso (se informa la mediana)")
+    parser.add_argument('--directorio', default=None, help="Carpeta para las BD de prueba (por defecto, una temporal)")
+    parser.add_argument('--salida', default='benchmark_resultados.json', help="Archivo JSON de resultados")
+    parser.add_argument('--comparar', default=None, help="JSON de una corrida anterior para comparar")
+    args = parser.parse_args()
+
+    tablas = [t.strip() for t in args.tablas.split(',') if t.strip()]
+    desconocidas = set(tablas) - set(MEDIDAS_POR_TABLA)
+    if desconocidas: parser.error(f"tablas sin esquema sintético: {', '.join(sorted(desconocidas))}")
+
+    directorio = args.directorio or tempfile.mkdtemp(prefix='bench_christus_')
+    os.makedirs(directorio, exist_ok=True)
+    resultados = []
+    try:
+        for etiqueta in [e.strip() for e in args.escalas.split(',') if e.strip()]:
+            filas = parsear_escala(etiqueta)
+            print(f"Escala {etiqueta} ({filas:,} filas por tabla)", flush=True)
+            resultados += correr_escala(etiqueta, filas, directorio, args.repeticiones, tablas)
+    finally:
+        if not args.directorio: shutil.rmtree(directorio, ignore_errors=True)
+
+    informe = {
+        'fecha': datetime.now().isoformat(timespec='seconds'),
+        'entorno': {
+            'commit': version_codigo(),
+            'python': platform.python_version(),
+            'pandas': pd.__version__,
+            'numpy': np.__version__,
+            'sqlite': sqlite3.sqlite_version,
+            'duckdb': version_paquete('duckdb') if md.duckdb_instalado() else None,
+            'plataforma': platform.platform(),
+        },
+        'parametros': {'escalas': args.escalas, 'tablas': tablas, 'repeticiones': args.repeticiones,
+                       'filas_por_bloque': md.FILAS_POR_BLOQUE, 'filas_por_pagina': md.FILAS_POR_PAGINA},
+        'resultados': resultados,
+    }
+    with open(args.salida, 'w', encoding='utf-8') as f: json.dump(informe, f, ensure_ascii=False, indent=2)
+    print(f"\nResultados en {args.salida}")
+    if args.comparar: comparar(resultados, args.comparar)
+
+if __name__ == '__main__':
+    main()
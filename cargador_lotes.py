@@ -0,0 +1,280 @@
+"""
+Carga por lotes sin servidor de archivos mensuales CSV/XLSX (directorios o patrones).
+
+Para cada archivo infiere el proceso (tabla de MAPA_TABLAS_OPERATIVAS) y el periodo a partir de la
+ruta (p. ej. 'facturacion_2024_01.csv', 'Cartera Enero 2025.xlsx', 'radicacion/202403.csv') o, si el
+nombre no trae el periodo, de las columnas de año y mes del propio archivo. Los archivos se leen y
+tipifican en paralelo en un pool de procesos; un único escritor (este proceso) inserta los resultados
+agrupados por tabla en transacciones de hasta --filas-por-transaccion filas y al final imprime el
+resumen de throughput. Si una transacción de varios archivos falla, esos archivos se reintentan uno
+por uno para que un archivo malo no descarte a los demás.
+
+Uso:
+    python cargador_lotes.py historico/
+    python cargador_lotes.py "historico/**/facturacion_*.csv" --procesos 6
+    python cargador_lotes.py cartera_2024/ --tabla CARTERA --modo particion
+    python cargador_lotes.py historico/ --simular
+"""
+import argparse
+import glob
+import os
+import re
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from datetime import datetime
+
+import pandas  # motor_datos lo difiere; aquí se importa antes del pool para que los procesos lo hereden
+import streamlit.logger
+
+import motor_datos as md
+
+# Sin servidor, Streamlit avisa en cada lectura que no hay contexto de sesión
+streamlit.logger.set_log_level('error')
+
+EXTENSIONES = ('.csv', '.xlsx')
+ABREVIATURAS_MES = {'ENE': 1, 'FEB': 2, 'MAR': 3, 'ABR': 4, 'MAY': 5, 'JUN': 6, 'JUL': 7, 'AGO': 8,
+                    'SEP': 9, 'SET': 9, 'OCT': 10, 'NOV': 11, 'DIC': 12}
+FILAS_POR_TRANSACCION = 500000
+
+
+def expandir_rutas(rutas):
+    """Archivos CSV/XLSX de los directorios (recursivo) y patrones glob dados, sin repetir y ordenados."""
+    archivos = set()
+    for ruta in rutas:
+        if os.path.isdir(ruta):
+            for raiz, _, nombres in os.walk(ruta):
+                archivos.update(os.path.join(raiz, n) for n in nombres)
+        else:
+            archivos.update(glob.glob(ruta, recursive=True))
+    # Los temporales de Excel ('~$archivo.xlsx') no son datos
+    return sorted(a for a in archivos if a.lower().endswith(EXTENSIONES) and not os.path.basename(a).startswith('~$'))
+
+
+def palabras(texto):
+    """Texto normalizado (sin tildes, mayúsculas) con cualquier separador convertido en un espacio."""
+    return " ".join(t for t in re.split(r'[^A-Z0-9]+', md.normalize_text(texto)) if t)
+
+
+def inferir_tabla(ruta):
+    """Tabla operativa según el nombre del archivo o, si no lo dice, el de sus carpetas; None si no es única."""
+    partes = [os.path.splitext(os.path.basename(ruta))[0]] + os.path.normpath(os.path.dirname(ruta)).split(os.sep)[::-1]
+    for parte in partes:
+        texto = f" {palabras(parte)} "
+        encontradas = {tabla for clave, tabla in md.MAPA_TABLAS_OPERATIVAS.items()
+                       if f" {palabras(clave)} " in texto or f" {palabras(tabla)} " in texto}
+        if len(encontradas) == 1: return encontradas.pop()
+        if encontradas: return None  # Ambiguo: mejor pedir --tabla que adivinar
+    return None
+
+
+def inferir_periodo(ruta):
+    """(año, mes) del nombre del archivo: '2024-01', '202401', '01_2024', 'Enero 2024', 'ENE24'... (None si falta)."""
+    texto = md.normalize_text(os.path.splitext(os.path.basename(ruta))[0])
+    m = re.search(r'(?<!\d)(20\d{2})[-_. ]?(0[1-9]|1[0-2])(?!\d)', texto)
+    if m: return int(m.group(1)), int(m.group(2))
+    m = re.search(r'(?<!\d)(0?[1-9]|1[0-2])[-_. ](20\d{2})(?!\d)', texto)
+    if m: return int(m.group(2)), int(m.group(1))
+
+    anio = re.search(r'(?<!\d)(20\d{2})(?!\d)', texto)
+    anio = int(anio.group(1)) if anio else None
+    mes = next((md.numero_mes(p) or ABREVIATURAS_MES.get(p) for p in re.findall(r'[A-Z]+', texto)
+                if md.numero_mes(p) or p in ABREVIATURAS_MES), None)
+    if anio is None:
+        # Año de dos cifras pegado al mes abreviado ('ENE24')
+        m = re.search(r'(?<![A-Z])(' + '|'.join(ABREVIATURAS_MES) + r')[-_ ]?(\d{2})(?!\d)', texto)
+        if m: anio, mes = 2000 + int(m.group(2)), mes or ABREVIATURAS_MES[m.group(1)]
+    return anio, mes
+
+
+def planificar(archivos, tabla=None, anio=None, mes=None):
+    """Un dict por archivo con la tabla y el periodo inferidos (los de la línea de comandos mandan)."""
+    plan = []
+    for ruta in archivos:
+        anio_nombre, mes_nombre = inferir_periodo(ruta)
+        destino = tabla or inferir_tabla(ruta)
+        plan.append({'ruta': ruta, 'tabla': destino, 'anio': anio or anio_nombre, 'mes': mes or mes_nombre,
+                     'error': None if destino else "no se pudo inferir el proceso (use --tabla)"})
+    return plan
+
+
+def parsear_archivo(ruta, tabla, anio, mes, fecha_carga, filas_por_bloque):
+    """
+    (En un proceso del pool) Lee el archivo por bloques y lo deja listo para insertar: periodo inyectado
+    con preparar_bloque (año/mes del nombre donde el archivo no los trae) y tipos con tipificar_bloque.
+    """
+    inicio = time.perf_counter()
+    resultado = {'ruta': ruta, 'bloques': [], 'filas': 0, 'fallidas': {}, 'periodos': set(), 'error': None}
+    try:
+        mes_sel = md.LISTA_MESES[mes - 1] if mes else None
+        formatos = {}  # Separador decimal y columnas que quedan como texto: uno por archivo, no por bloque
+        with open(ruta, 'rb') as f:
+            for df, _ in md.leer_archivo_por_bloques(f, filas_por_bloque):
+                df = md.preparar_bloque(df, anio, mes_sel, fecha_carga, tabla)
+                df, fallidas = md.tipificar_bloque(df, formatos)
+                for col, n in fallidas.items(): resultado['fallidas'][col] = resultado['fallidas'].get(col, 0) + n
+                periodo = list(md.COLUMNAS_PERIODO.values())
+                if not all(c in df.columns for c in periodo):
+                    raise ValueError("no se pudo inferir el periodo (ni del nombre ni de columnas de año y mes)")
+                sin_periodo = int(df[periodo].isna().any(axis=1).sum())
+                if sin_periodo:
+                    raise ValueError(f"{sin_periodo} filas sin año o mes reconocible")
+                resultado['periodos'].update(df[periodo].drop_duplicates().itertuples(index=False, name=None))
+                resultado['bloques'].append(df)
+                resultado['filas'] += len(df)
+        if not resultado['filas']: raise ValueError("el archivo no tiene registros")
+    except Exception as e:
+        resultado.update(bloques=[], error=str(e))
+    resultado['segundos'] = time.perf_counter() - inicio
+    return resultado
+
+
+class Escritor:
+    """Único escritor: junta los archivos ya parseados por tabla y los inserta en transacciones por lote."""
+    def __init__(self, modo, deduplicar, filas_por_transaccion):
+        self.modo = modo
+        self.deduplicar = deduplicar
+        self.filas_por_transaccion = filas_por_transaccion
+        self.lotes = {}  # (tabla, columnas) -> [resultado]
+        self.reemplazadas = set()
+        self.segundos = 0.0
+        self.filas = {}
+        self.errores = []
+
+    def agregar(self, tabla, resultado):
+        if self.modo == 'particion':
+            # Cada archivo reemplaza su propio mes: una transacción por archivo
+            return self.escribir(tabla, [resultado])
+        # Solo van juntos los archivos con las mismas columnas
+        clave = (tabla, tuple(sorted(c.lower() for c in resultado['bloques'][0].columns)))
+        lote = self.lotes.setdefault(clave, [])
+        lote.append(resultado)
+        if sum(r['filas'] for r in lote) >= self.filas_por_transaccion:
+            self.escribir(tabla, self.lotes.pop(clave))
+
+    def vaciar(self):
+        for (tabla, _), lote in list(self.lotes.items()):
+            self.escribir(tabla, lote)
+        self.lotes.clear()
+
+    def escribir(self, tabla, lote):
+        # 'replace' borra la tabla solo en su primera transacción; las siguientes agregan
+        modo = 'append' if self.modo == 'replace' and tabla in self.reemplazadas else self.modo
+        anio, mes = None, None
+        if modo == 'particion':
+            periodos = lote[0]['periodos']
+            if len(periodos) != 1:
+                return self.fallar(lote, f"trae {len(periodos)} periodos; el reemplazo por mes requiere uno solo")
+            anio, mes = next(iter(periodos))
+            mes = md.LISTA_MESES[mes - 1]
+
+        inicio = time.perf_counter()
+        bloques = ((df, None) for r in lote for df in r['bloques'])
+        ok, mensaje = md.cargar_bloques_bd(bloques, tabla, modo, anio, mes, deduplicar=self.deduplicar, preparados=True)
+        self.segundos += time.perf_counter() - inicio
+        nombres = ", ".join(os.path.basename(r['ruta']) for r in lote)
+        if ok:
+            if modo == 'replace': self.reemplazadas.add(tabla)
+            self.filas[tabla] = self.filas.get(tabla, 0) + sum(r['filas'] for r in lote)
+            print(f"  💾 {tabla} ← {len(lote)} archivo(s) [{nombres}]: {mensaje}", flush=True)
+        elif len(lote) > 1:
+            print(f"  ⚠️ {tabla}: falló la transacción de {len(lote)} archivos ({mensaje}); se reintentan uno por uno", flush=True)
+            for resultado in lote: self.escribir(tabla, [resultado])
+        else:
+            self.fallar(lote, mensaje)
+        for r in lote: r['bloques'] = []  # Libera la memoria del lote ya escrito
+
+    def fallar(self, lote, motivo):
+        for r in lote:
+            self.errores.append((r['ruta'], motivo))
+            print(f"  ❌ {os.path.basename(r['ruta'])}: {motivo}", flush=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Carga por lotes de archivos mensuales CSV/XLSX a las tablas operativas.")
+    parser.add_argument('rutas', nargs='+', help="Directorios (se recorren completos) o patrones glob de archivos")
+    parser.add_argument('--tabla', help="Proceso o tabla destino para todos los archivos (p. ej. CARTERA u ope_cartera)")
+    parser.add_argument('--anio', type=int, help="Año para todos los archivos (si no, se infiere)")
+    parser.add_argument('--mes', help="Mes para todos los archivos, por nombre o número (si no, se infiere)")
+    parser.add_argument('--modo', choices=['append', 'particion', 'replace'], default='append',
+                        help="append agrega; particion reemplaza el mes de cada archivo; replace reescribe cada tabla")
+    parser.add_argument('--deduplicar', action='store_true', help="Omite filas ya cargadas (huella de fila)")
+    parser.add_argument('--procesos', type=int, default=max(1, (os.cpu_count() or 2) - 1), help="Procesos de parseo")
+    parser.add_argument('--filas-por-transaccion', type=int, default=FILAS_POR_TRANSACCION,
+                        help="Filas que el escritor junta (de varios archivos de una tabla) antes de confirmar")
+    parser.add_argument('--bd', help="Ruta de la base de datos (por defecto la misma que usa la app)")
+    parser.add_argument('--simular', action='store_true', help="Solo muestra qué se cargaría y dónde")
+    args = parser.parse_args()
+
+    if args.bd: os.environ['CHRISTUS_DB_PATH'] = os.path.abspath(args.bd)
+    tabla = None
+    if args.tabla:
+        tabla = md.MAPA_TABLAS_OPERATIVAS.get(md.normalize_text(args.tabla).replace('_', ' '), args.tabla.lower())
+        if tabla not in md.MAPA_TABLAS_OPERATIVAS.values():
+            parser.error(f"--tabla: '{args.tabla}' no es un proceso de {', '.join(md.MAPA_TABLAS_OPERATIVAS)}")
+    mes = md.numero_mes(args.mes) if args.mes else None
+    if args.mes and not mes: parser.error(f"--mes: '{args.mes}' no es un mes reconocible")
+
+    archivos = expandir_rutas(args.rutas)
+    if not archivos:
+        print("No se encontraron archivos CSV/XLSX.")
+        return 1
+    plan = planificar(archivos, tabla, args.anio, mes)
+
+    print(f"{len(plan)} archivo(s) → {md.get_pool().path}")
+    for p in plan:
+        periodo = f"{md.LISTA_MESES[p['mes'] - 1] if p['mes'] else '¿mes?'} {p['anio'] or '¿año?'}"
+        print(f"  {os.path.basename(p['ruta']):<45} {p['tabla'] or '—':<22} {periodo:<16} {p['error'] or ''}")
+    if args.simular: return 0
+
+    md.init_db()
+    escritor = Escritor(args.modo, args.deduplicar, args.filas_por_transaccion)
+    for p in plan:
+        if p['error']: escritor.fallar([p], p['error'])
+    pendientes = [p for p in plan if not p['error']]
+
+    fecha_carga = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    inicio, segundos_parseo, filas_leidas, hechos = time.perf_counter(), 0.0, 0, 0
+    with ProcessPoolExecutor(max_workers=args.procesos) as pool:
+        # A lo sumo dos archivos parseados por proceso esperando al escritor: acota la memoria
+        en_vuelo, siguiente = {}, iter(pendientes)
+        while True:
+            while len(en_vuelo) < 2 * args.procesos:
+                p = next(siguiente, None)
+                if p is None: break
+                futuro = pool.submit(parsear_archivo, p['ruta'], p['tabla'], p['anio'], p['mes'], fecha_carga, md.FILAS_POR_BLOQUE)
+                en_vuelo[futuro] = p
+            if not en_vuelo: break
+            listos, _ = wait(en_vuelo, return_when=FIRST_COMPLETED)
+            for futuro in listos:
+                p = en_vuelo.pop(futuro)
+                resultado = futuro.result()
+                hechos += 1
+                segundos_parseo += resultado['segundos']
+                avisos = "".join(f" ⚠️ {col}: {n} celdas vacías" for col, n in resultado['fallidas'].items())
+                print(f"[{hechos:>4}/{len(pendientes)}] {os.path.basename(p['ruta'])} → {p['tabla']}: "
+                      f"{resultado['filas']:,} filas en {resultado['segundos']:.1f}s{avisos}", flush=True)
+                if resultado['error']:
+                    escritor.fallar([resultado], resultado['error'])
+                    continue
+                filas_leidas += resultado['filas']
+                escritor.agregar(p['tabla'], resultado)
+        escritor.vaciar()
+    total = time.perf_counter() - inicio
+
+    filas = sum(escritor.filas.values())
+    print("\n=== Resumen ===")
+    print(f"Archivos: {len(plan) - len(escritor.errores)} cargados, {len(escritor.errores)} con error, de {len(plan)}")
+    for nombre_tabla, n in sorted(escritor.filas.items()):
+        print(f"  {nombre_tabla:<24} {n:>12,} filas")
+    print(f"Filas cargadas: {filas:,} de {filas_leidas:,} leídas en {total:.1f}s → {filas / max(total, 1e-9):,.0f} filas/s")
+    print(f"Parseo: {segundos_parseo:.1f}s de proceso en {args.procesos} proceso(s) "
+          f"({filas_leidas / max(segundos_parseo, 1e-9):,.0f} filas/s por proceso)")
+    print(f"Escritura: {escritor.segundos:.1f}s ({filas / max(escritor.segundos, 1e-9):,.0f} filas/s)")
+    for ruta, motivo in escritor.errores:
+        print(f"  ❌ {ruta}: {motivo}")
+    return 1 if escritor.errores else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,2154 @@
+"""
+Capa de datos del Tablero Christus: conexión SQLite, registro de esquema, lecturas,
+resúmenes mensuales y carga masiva. No depende de la interfaz, de modo que la usan
+tanto la app de Streamlit como los procesos sin servidor (benchmark, cargas por lote).
+"""
+import streamlit as st
+import sqlite3
+import time
+import os
+import io
+import sys
+import json
+import uuid
+import glob
+import shutil
+import subprocess
+import queue
+import contextvars
+import itertools
+import threading
+import unicodedata
+import importlib
+from importlib.util import find_spec
+from collections import Counter, OrderedDict, deque
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
+from functools import lru_cache
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+
+
+class ModuloDiferido:
+    """
+    Módulo pesado que se importa recién al usar uno de sus atributos: la pantalla de login se pinta
+    sin cargar pandas/numpy. El import del intérprete ya es seguro entre hilos (sesiones simultáneas).
+    El primer uso desde cualquier ModuloDiferido aplica el ajuste del módulo en AJUSTES, si tiene.
+    """
+    AJUSTES = {}
+
+    def __init__(self, nombre):
+        self.__nombre = nombre
+
+    def __getattr__(self, attr):
+        modulo = importlib.import_module(self.__nombre)
+        ajuste = ModuloDiferido.AJUSTES.pop(self.__nombre, None)
+        if ajuste: ajuste(modulo)
+        valor = getattr(modulo, attr)
+        setattr(self, attr, valor)  # Los siguientes accesos no pasan por aquí
+        return valor
+
+pd = ModuloDiferido('pandas')
+np = ModuloDiferido('numpy')
+
+def activar_copy_on_write(pandas):
+    """
+    Copy-on-write: filtros y vistas comparten memoria con su origen hasta que alguien escribe.
+    Siempre activo desde pandas 3; en versiones anteriores se activa en el primer uso real de pandas.
+    """
+    if int(pandas.__version__.split('.')[0]) < 3:
+        pandas.options.mode.copy_on_write = True
+
+ModuloDiferido.AJUSTES['pandas'] = activar_copy_on_write
+
+# --- CONSTANTES Y CONFIGURACIÓN ---
+
+# RUTA DE LA BASE DE DATOS
+DB_PATH_ABSOLUTE = r"C:\Users\pedro\OneDrive\GENERAL ANTIGUA\Escritorio\mi_proyecto_inventario\Christus_DB_Master.db"
+DB_NAME_LOCAL = "Christus_DB_Master.db"
+
+# Pool de conexiones: lectores ociosos que se conservan por proceso y ajustes de cada conexión
+MAX_LECTORES = 8
+MAX_HILOS_LECTURA = 5  # Lecturas simultáneas del dashboard (cada una con su conexión del pool)
+PRAGMAS_CONEXION = [
+    "PRAGMA journal_mode = WAL",
+    "PRAGMA synchronous = NORMAL",
+    "PRAGMA busy_timeout = 30000",
+    "PRAGMA cache_size = -64000",
+    "PRAGMA mmap_size = 268435456",
+    "PRAGMA temp_store = MEMORY",
+]
+
+# Memoria máxima del caché de resultados compartido por todas las sesiones
+CACHE_MAX_MB = 256
+# Filas por bloque en la carga masiva (acota la memoria sin importar el tamaño del archivo)
+FILAS_POR_BLOQUE = 50000
+FILAS_POR_PAGINA = 500  # Tamaño de página de la grilla del Tablero Operativo
+MAX_FILAS_XLSX = 1048576  # Límite de filas por hoja de Excel (incluye el encabezado)
+# Mediciones de tiempo por etapa que se conservan en memoria (las más recientes)
+MAX_REGISTROS_TIEMPO = 20000
+
+# Cola de cargas en segundo plano: los archivos esperan en una carpeta junto a la BD y los trabajos
+# se anotan en un archivo SQLite propio (Christus_DB_Master.db -> Christus_DB_Master_cola.db)
+CARPETA_STAGING = "staging_cargas"
+TABLA_TRABAJOS = "trabajos_carga"
+SUFIJO_COLA = "_cola.db"
+SEGUNDOS_ESPERA_COLA = 5  # Espera máxima por el lock de la cola (solo la usan operaciones de una fila)
+SEGUNDOS_SONDEO = 2      # Cada cuánto el trabajador busca trabajos pendientes
+SEGUNDOS_LATIDO = 30     # Sin latido en este tiempo, el trabajador se da por detenido
+MAX_SEGUNDOS_OCIOSO = 600  # El trabajador termina tras este tiempo sin trabajos (la app lo vuelve a lanzar)
+
+# Meses del año (orden lógico)
+LISTA_MESES = [
+    "Enero", "Febrero", "Marzo", "Abril", "Mayo", "Junio",
+    "Julio", "Agosto", "Septiembre", "Octubre", "Noviembre", "Diciembre"
+]
+# Palabras clave para ubicar las columnas de periodo en cualquier tabla
+CLAVES_ANIO = ['ANIO', 'ANO', 'YEAR', 'PERIODO_ANIO']
+# Claves que solo valen como nombre completo de columna ('AÑO' normalizado es 'ANO', que también está en 'PLANO')
+CLAVES_EXACTAS = {'ANO'}
+CLAVES_MES = ['MES', 'MONTH', 'PERIODO_MES']
+# Palabras clave de las columnas que consume el Dashboard Gerencial
+CLAVES_VALOR_FACT = ['VALOR', 'FACTURADO', 'TOTAL']
+CLAVES_VALOR_RAD = ['VALOR', 'RADICADO']
+CLAVES_RECAUDO = ['RECAUDO', 'REAL']
+CLAVES_CANTIDAD = ['CANTIDAD', 'ACTIVIDADES', 'PACIENTES']
+CLAVES_ASEGURADORA = ['ASEGURADORA', 'CLIENTE', 'EPS']
+CLAVES_AREA = ['AREA']
+# Edades de cartera: saldo pendiente y fecha del documento desde la que se cuentan los días
+CLAVES_SALDO = ['SALDO']
+CLAVES_FECHA_DOCUMENTO = ['FECHA FACTURA', 'FECHA RADICACION', 'FECHA EMISION', 'FECHA DOCUMENTO', 'FECHA']
+# Palabras clave de las columnas que la carga convierte a número (montos, cantidades) y a fecha ISO
+CLAVES_NUMERICAS = ['VALOR', 'FACTURADO', 'TOTAL', 'RADICADO', 'RECAUDO', 'SALDO', 'MONTO', 'GLOSA',
+                    'PROVISION', 'COSTO', 'PRECIO', 'CANTIDAD', 'ACTIVIDADES', 'PACIENTES']
+CLAVES_FECHA = ['FECHA', 'DATE']
+# Si en el primer bloque con datos falla más de esta fracción de celdas, la columna no era de ese tipo
+# y se deja como viene en toda la carga
+MAX_FRACCION_FALLIDAS = 0.5
+# Una columna de texto se lee como category si sus valores distintos son a lo sumo esta fracción de las filas
+MAX_FRACCION_CATEGORIA = 0.5
+# Roles canónicos de columna -> palabras clave para ubicarlos (registro de esquema)
+ROLES_COLUMNAS = {
+    'anio': CLAVES_ANIO,
+    'mes': CLAVES_MES,
+    'valor': CLAVES_VALOR_FACT,
+    'recaudo': CLAVES_RECAUDO,
+    'aseguradora': CLAVES_ASEGURADORA,
+    'cantidad': CLAVES_CANTIDAD,
+    'area': CLAVES_AREA,
+    'saldo': CLAVES_SALDO,
+    'fecha': CLAVES_FECHA_DOCUMENTO,
+}
+# Excepciones por tabla a las palabras clave de un rol
+ROLES_POR_TABLA = {
+    'ope_radicacion': {'valor': CLAVES_VALOR_RAD},
+    'ope_provision': {'valor': ['PROVISION', 'VALOR']},
+}
+# Versión del formato del registro de esquema (al cambiarla se re-registran todas las tablas)
+VERSION_REGISTRO = "v6"
+# Columnas canónicas de periodo (enteros) que escribe la carga; se indexan en cada tabla
+COLUMNAS_PERIODO = {'anio': 'periodo_anio', 'mes': 'periodo_mes'}
+# Huella de cada fila (carga con deduplicación); un índice único evita repetirla
+COLUMNA_HUELLA = 'huella_fila'
+# Área normalizada (sin tildes, mayúsculas) escrita en la carga e indexada: alcance por área en SQL
+COLUMNA_AREA = 'area_norm'
+# Tablas con alcance por área de acceso del usuario -> palabras clave de la columna que guarda esa área.
+# En las ope_* 'ÁREA' es el servicio clínico (Urgencias, Cirugía): una ope_* se agrega aquí solo si tiene
+# una columna con el área de acceso (Cartera, Facturación...); las demás no se filtran por área.
+AREA_ACCESO_POR_TABLA = {
+    'catalogo_indicadores': CLAVES_AREA,
+}
+# Columnas que agrega la carga (no vienen del archivo): no se usan como roles ni se indexan para búsqueda
+COLUMNAS_CANONICAS = {*COLUMNAS_PERIODO.values(), COLUMNA_HUELLA, COLUMNA_AREA, 'fecha_carga'}
+# Mes normalizado -> número (Enero, ENERO -> 1) y número/nombre -> nombre para mostrar
+MAPA_MES_NUMERO = {m.upper(): i for i, m in enumerate(LISTA_MESES, start=1)}
+MAPA_MES_NUMERO['SETIEMBRE'] = 9
+MAPA_MES_NOMBRE = {m.upper(): m for m in LISTA_MESES}
+MAPA_MES_NOMBRE.update({str(i): m for i, m in enumerate(LISTA_MESES, start=1)})
+
+# Migraciones aplicadas a la BD (ver MIGRACIONES)
+TABLA_ESQUEMA = "schema_version"
+
+# Mapeo de Tablas Operativas
+MAPA_TABLAS_OPERATIVAS = {
+    'FACTURACION': 'ope_facturacion',
+    'RADICACION': 'ope_radicacion',
+    'ADMISIONES': 'ope_admisiones',
+    'AUTORIZACIONES': 'ope_autorizaciones',
+    'CUENTAS MEDICAS': 'ope_cuentas_medicas',
+    'CARTERA': 'ope_cartera',
+    'PROVISION': 'ope_provision'
+}
+
+# Resúmenes mensuales precalculados al cargar: tabla -> (rol de la medida, rol de la dimensión)
+PREFIJO_ROLLUP = "rollup_"
+ROLLUPS_MENSUALES = {
+    'ope_facturacion': ('valor', 'aseguradora'),
+    'ope_radicacion': ('valor', None),
+    'ope_cartera': ('recaudo', None),
+    'ope_admisiones': ('cantidad', None),
+    'ope_provision': ('valor', 'aseguradora'),
+}
+# Tendencia financiera del dashboard: proceso -> tabla con resumen mensual (su valor es la medida graficada)
+PROCESOS_TENDENCIA = {'Facturado': 'ope_facturacion', 'Radicado': 'ope_radicacion', 'Recaudo': 'ope_cartera'}
+
+# Tramos de edad de cartera: (nombre, días hasta; None = sin tope). Los días van de la fecha del
+# documento al cierre del mes del periodo; un documento posterior al cierre cae en el primer tramo.
+TRAMOS_EDAD = [('0-30', 30), ('31-60', 60), ('61-90', 90), ('91-180', 180), ('180+', None)]
+TRAMO_SIN_FECHA = 'Sin fecha'
+
+# Búsqueda de texto: índice FTS5 (sin contenido, solo rowid -> texto) de las columnas descriptivas de cada tabla
+PREFIJO_BUSQUEDA = "fts_"
+TABLAS_BUSQUEDA = ['ope_facturacion', 'ope_radicacion', 'ope_cartera', 'ope_cuentas_medicas']
+RESULTADOS_POR_PAGINA = 50
+# Sin tildes ni mayúsculas: 'facturacion' encuentra 'Facturación'
+TOKENIZADOR_BUSQUEDA = "unicode61 remove_diacritics 2"
+
+# Motor de las agregaciones que recorren tablas completas (edades de cartera): 'sqlite' o 'duckdb'
+# (este último con las dependencias de requirements-opcional.txt).
+# Con 'duckdb' cada carga deja además snapshots Parquet por periodo de las tablas ope_* junto a la BD;
+# SQLite sigue siendo el registro oficial: sin DuckDB instalado o con el snapshot atrasado se lee de ahí.
+MOTOR_ANALITICO = os.environ.get('CHRISTUS_MOTOR_ANALITICO', 'sqlite').strip().lower()
+PREFIJO_SNAPSHOT = "ope_"
+# Christus_DB_Master.db -> Christus_DB_Master_parquet/<tabla>/periodo_anio=2025/periodo_mes=3/datos.parquet
+SUFIJO_CARPETA_PARQUET = "_parquet"
+ARCHIVO_PARTICION = "datos.parquet"
+ARCHIVO_VERSION_SNAPSHOT = "_version.json"  # Versión de datos de SQLite que refleja el snapshot
+
+# ==============================================================================
+# 1. GESTIÓN DE CONEXIÓN Y AUTO-REPARACIÓN
+# ==============================================================================
+
+class ConexionPool(sqlite3.Connection):
+    """Conexión SQLite cuyo close() la devuelve al pool en lugar de cerrarla."""
+    pool = None
+    prestada = False
+
+    def close(self):
+        if self.pool is None: return super().close()
+        if self.prestada: self.pool.devolver(self)
+
+class PoolConexiones:
+    """
+    Conexiones de larga vida por proceso: varias de lectura (WAL permite leer mientras se escribe)
+    y una única de escritura, serializada con un lock hasta que se devuelve.
+    """
+    def __init__(self, path, max_lectores=MAX_LECTORES):
+        self.path = path
+        self.max_lectores = max_lectores
+        self.libres = queue.LifoQueue()
+        self.lock_escritura = threading.Lock()
+        self.conn_escritura = None
+
+    def abrir(self):
+        conn = sqlite3.connect(self.path, check_same_thread=False, factory=ConexionPool, timeout=30)
+        for pragma in PRAGMAS_CONEXION: conn.execute(pragma)
+        # normalize_text en SQL, para migrar area_norm en tablas cargadas antes de existir
+        conn.create_function('normalizar_texto', 1, lambda v: None if v is None else normalize_text(v), deterministic=True)
+        conn.pool = self
+        return conn
+
+    def lector(self):
+        try: conn = self.libres.get_nowait()
+        except queue.Empty: conn = self.abrir()
+        conn.prestada = True
+        return conn
+
+    def escritor(self):
+        self.lock_escritura.acquire()
+        if self.conn_escritura is None: self.conn_escritura = self.abrir()
+        self.conn_escritura.prestada = True
+        return self.conn_escritura
+
+    def devolver(self, conn):
+        conn.prestada = False
+        if conn.in_transaction: conn.rollback()
+        if conn is self.conn_escritura:
+            self.lock_escritura.release()
+        elif self.libres.qsize() < self.max_lectores:
+            self.libres.put(conn)
+        else:
+            sqlite3.Connection.close(conn)
+
+@st.cache_resource
+def get_pool():
+    """Pool único por proceso; la ruta de la BD se resuelve una sola vez (CHRISTUS_DB_PATH la fija)."""
+    path = DB_NAME_LOCAL
+    if os.environ.get('CHRISTUS_DB_PATH'):
+        path = os.environ['CHRISTUS_DB_PATH']
+    elif os.path.exists(DB_PATH_ABSOLUTE):
+        path = DB_PATH_ABSOLUTE
+    return PoolConexiones(path)
+
+def get_connection(escritura=False):
+    """
+    Devuelve (conexión, ruta) desde el pool del proceso; `conn.close()` la devuelve al pool.
+    Las escrituras piden `escritura=True` para usar la conexión única de escritura.
+    """
+    pool = get_pool()
+    conn = pool.escritor() if escritura else pool.lector()
+    return conn, pool.path
+
+def migracion_tablas_sistema(conn):
+    """Usuarios (con contraseña), catálogo de indicadores, registro de esquema y versiones de datos."""
+    conn.execute("CREATE TABLE IF NOT EXISTS usuarios (id INTEGER PRIMARY KEY AUTOINCREMENT, usuario TEXT UNIQUE NOT NULL, rol TEXT, area_acceso TEXT)")
+    if 'contrasena' not in [info[1] for info in conn.execute("PRAGMA table_info(usuarios)")]:
+        conn.execute("ALTER TABLE usuarios ADD COLUMN contrasena TEXT DEFAULT '1234'")
+
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS catalogo_indicadores (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            area TEXT,
+            responsable TEXT,
+            indicador TEXT,
+            fecha_carga TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+
+    # Registro de esquema: columna física de cada rol canónico por tabla
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS registro_esquema (
+            tabla TEXT NOT NULL COLLATE NOCASE,
+            rol TEXT NOT NULL,
+            columna TEXT,
+            firma TEXT NOT NULL,
+            PRIMARY KEY (tabla, rol)
+        )
+    """)
+
+    # Versión de datos por tabla: cada carga la incrementa e invalida el caché
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS control_versiones (
+            tabla TEXT PRIMARY KEY,
+            version INTEGER NOT NULL DEFAULT 0,
+            actualizado TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+
+def migracion_cola_cargas(conn):
+    """Cola de cargas: la app encola, el trabajador (otro proceso) ejecuta y deja el resultado."""
+    crear_tabla_trabajos(conn)
+
+def crear_tabla_trabajos(conn):
+    conn.execute(f"""
+        CREATE TABLE IF NOT EXISTS {TABLA_TRABAJOS} (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            tabla TEXT NOT NULL,
+            archivo TEXT NOT NULL,
+            nombre_original TEXT,
+            modo TEXT NOT NULL,
+            anio INTEGER,
+            mes TEXT,
+            deduplicar INTEGER NOT NULL DEFAULT 0,
+            usuario TEXT,
+            estado TEXT NOT NULL DEFAULT 'pendiente',
+            filas INTEGER,
+            filas_seg REAL,
+            mensaje TEXT,
+            pid INTEGER,
+            creado TIMESTAMP,
+            iniciado TIMESTAMP,
+            terminado TIMESTAMP
+        )
+    """)
+    conn.execute(f"CREATE INDEX IF NOT EXISTS ix_{TABLA_TRABAJOS}_estado ON {TABLA_TRABAJOS} (estado, id)")
+
+def migracion_cola_aparte(conn):
+    """
+    Pasa los trabajos de la cola al archivo propio de la cola y borra su tabla de la BD principal.
+    INSERT OR IGNORE por id: si la migración se reintenta no duplica trabajos.
+    """
+    if not conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (TABLA_TRABAJOS,)).fetchone():
+        return
+    cur = conn.execute(f"SELECT * FROM {TABLA_TRABAJOS}")
+    columnas, filas = [d[0] for d in cur.description], cur.fetchall()
+    if filas:
+        cola = conexion_cola()
+        try:
+            cola.executemany(f"INSERT OR IGNORE INTO {TABLA_TRABAJOS} ({', '.join(columnas)}) "
+                             f"VALUES ({', '.join('?' * len(columnas))})", filas)
+            cola.commit()
+        finally: cola.close()
+    conn.execute(f"DROP TABLE {TABLA_TRABAJOS}")
+
+# Migraciones de esquema en orden: (versión, descripción, función). Cada una es idempotente
+# (una BD anterior al control de versiones las aplica todas sin perder nada); las nuevas van al final.
+MIGRACIONES = [
+    (1, "Tablas del sistema: usuarios, catálogo, registro de esquema y versiones de datos", migracion_tablas_sistema),
+    (2, "Cola de cargas en segundo plano", migracion_cola_cargas),
+    (3, "Cola de cargas en su propio archivo (encolar no espera a una carga en curso)", migracion_cola_aparte),
+]
+
+def version_esquema(conn):
+    """Última migración aplicada a la BD (0 si nunca se migró)."""
+    try: return conn.execute(f"SELECT COALESCE(MAX(version), 0) FROM {TABLA_ESQUEMA}").fetchone()[0]
+    except sqlite3.OperationalError: return 0
+
+def aplicar_migraciones():
+    """Aplica en una transacción las migraciones pendientes y las anota en schema_version; devuelve la versión final."""
+    conn, _ = get_connection()
+    try: vigente = version_esquema(conn)
+    finally: conn.close()
+    if vigente >= MIGRACIONES[-1][0]: return vigente  # Al día: no espera el lock de escritura de una carga en curso
+
+    conn, _ = get_connection(escritura=True)
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        conn.execute(f"""CREATE TABLE IF NOT EXISTS {TABLA_ESQUEMA} (
+                             version INTEGER PRIMARY KEY, descripcion TEXT, aplicada TIMESTAMP)""")
+        vigente = version_esquema(conn)  # Otro proceso pudo migrar mientras se esperaba el lock
+        for version, descripcion, migrar in MIGRACIONES:
+            if version <= vigente: continue
+            migrar(conn)
+            conn.execute(f"INSERT INTO {TABLA_ESQUEMA} (version, descripcion, aplicada) VALUES (?, ?, ?)",
+                         (version, descripcion, ahora_texto()))
+            vigente = version
+        conn.commit()
+        return vigente
+    except Exception:
+        conn.rollback()
+        raise
+    finally: conn.close()
+
+@st.cache_resource
+def migrar_esquema(path):
+    """Una vez por proceso y BD: los reruns siguientes no vuelven a tocar el esquema."""
+    version = aplicar_migraciones()
+    registrar_tablas()
+    return version
+
+def init_db():
+    """Deja el esquema de la BD del pool al día (solo la primera llamada del proceso consulta la BD)."""
+    return migrar_esquema(get_pool().path)
+
+
+def version_tabla(conn, tabla):
+    """Versión de datos vigente de una tabla (0 si nunca se ha cargado)."""
+    try:
+        fila = conn.execute("SELECT version FROM control_versiones WHERE tabla = ?", (tabla.lower(),)).fetchone()
+        return fila[0] if fila else 0
+    except sqlite3.Error: return 0
+
+def incrementar_version(conn, tabla):
+    """Marca una nueva versión de datos para la tabla (no hace commit)."""
+    conn.execute("""
+        INSERT INTO control_versiones (tabla, version) VALUES (?, 1)
+        ON CONFLICT(tabla) DO UPDATE SET version = version + 1, actualizado = CURRENT_TIMESTAMP
+    """, (tabla.lower(),))
+    return version_tabla(conn, tabla)
+
+# ==============================================================================
+# 1.1 CACHÉ DE RESULTADOS (LECTURAS Y AGREGADOS)
+# ==============================================================================
+
+class CacheResultados:
+    """
+    Caché LRU en memoria, acotada en bytes y compartida por todas las sesiones del proceso.
+    Cada clave empieza con las versiones (tabla, version) de las tablas de las que depende,
+    de modo que una carga nueva deja sus entradas obsoletas y se purgan al detectarla.
+    """
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.bytes_usados = 0
+        self.entradas = OrderedDict()
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def medir(valor):
+        """Tamaño aproximado en bytes de una entrada."""
+        if isinstance(valor, pd.DataFrame): return int(valor.memory_usage(deep=True).sum())
+        if isinstance(valor, pd.Series): return int(valor.memory_usage(deep=True))
+        if hasattr(valor, 'to_plotly_json'): return len(valor.to_json())  # Figura de Plotly terminada
+        return 1024
+
+    def obtener(self, clave):
+        with self.lock:
+            if clave not in self.entradas: return None
+            self.entradas.move_to_end(clave)
+            valor = self.entradas[clave][0]
+        return self.copia(valor)
+
+    @staticmethod
+    def copia(valor):
+        # Copia superficial: con copy-on-write, si la página modifica el resultado no toca el caché
+        return valor.copy(deep=False) if isinstance(valor, (pd.DataFrame, pd.Series)) else valor
+
+    def guardar(self, clave, valor):
+        """Guarda `valor` y devuelve la copia que se entrega a quien lo calculó (igual que en obtener)."""
+        tam = self.medir(valor)
+        if tam > self.max_bytes: return valor
+        with self.lock:
+            if clave in self.entradas:
+                self.bytes_usados -= self.entradas.pop(clave)[1]
+            self.entradas[clave] = (valor, tam)
+            self.bytes_usados += tam
+            while self.bytes_usados > self.max_bytes:
+                _, (_, t) = self.entradas.popitem(last=False)
+                self.bytes_usados -= t
+        return self.copia(valor)
+
+    def invalidar(self, tabla, version_vigente=None):
+        """Elimina las entradas de `tabla` que no correspondan a su versión vigente."""
+        tabla = tabla.lower()
+        with self.lock:
+            for clave in list(self.entradas):
+                if any(t == tabla and v != version_vigente for t, v in clave[0]):
+                    self.bytes_usados -= self.entradas.pop(clave)[1]
+
+@st.cache_resource
+def get_cache_resultados():
+    """Instancia única por proceso (sobrevive a los reruns de Streamlit)."""
+    return CacheResultados(CACHE_MAX_MB * 1024 * 1024)
+
+def calcular_cacheado(tablas, nombre, params, calcular):
+    """Devuelve `calcular()` cacheado por nombre, parámetros y versión de las tablas de las que depende."""
+    with medir_etapa(nombre, ",".join(tablas)):
+        conn, _ = get_connection()
+        try: versiones = tuple((t.lower(), version_tabla(conn, t)) for t in tablas)
+        finally: conn.close()
+
+        cache = get_cache_resultados()
+        clave = (versiones, nombre, params)
+        resultado = cache.obtener(clave)
+        if resultado is None:
+            for t, v in versiones: cache.invalidar(t, v)
+            resultado = cache.guardar(clave, calcular())
+        return resultado
+
+# ==============================================================================
+# 1.2 PERFILADO DE ETAPAS (RENDIMIENTO)
+# ==============================================================================
+# Etiquetas del rerun en curso (página, usuario); los hilos de lectura reciben una copia
+contexto_rerun = contextvars.ContextVar('contexto_rerun', default=None)
+contador_reruns = itertools.count(1)
+
+class RegistroTiempos:
+    """Mediciones recientes (fecha, rerun, nav, usuario, tabla, etapa, ms) de todas las sesiones, acotadas."""
+    def __init__(self, max_registros=MAX_REGISTROS_TIEMPO):
+        self.registros = deque(maxlen=max_registros)
+        self.lock = threading.Lock()
+
+    def agregar(self, registro):
+        with self.lock: self.registros.append(registro)
+
+    def como_dataframe(self):
+        with self.lock: registros = list(self.registros)
+        return pd.DataFrame(registros, columns=['fecha', 'rerun', 'nav', 'usuario', 'tabla', 'etapa', 'ms'])
+
+@st.cache_resource
+def get_registro_tiempos():
+    return RegistroTiempos()
+
+def iniciar_rerun(nav, usuario):
+    """Abre la medición de un rerun; las etapas medidas hasta cerrar_rerun() quedan etiquetadas con él."""
+    contexto_rerun.set({'rerun': next(contador_reruns), 'nav': nav, 'usuario': usuario,
+                        'inicio': time.perf_counter(), 'registro': get_registro_tiempos()})
+
+def anotar_etapa(ctx, etapa, tabla, inicio):
+    ctx['registro'].agregar((datetime.now(), ctx['rerun'], ctx['nav'], ctx['usuario'], tabla or '', etapa,
+                             (time.perf_counter() - inicio) * 1000))
+
+def cerrar_rerun():
+    """Registra el total del rerun como la etapa 'rerun'."""
+    ctx = contexto_rerun.get()
+    if ctx is None: return
+    anotar_etapa(ctx, 'rerun', None, ctx['inicio'])
+    contexto_rerun.set(None)
+
+@contextmanager
+def medir_etapa(etapa, tabla=None):
+    """Mide el bloque como `etapa` del rerun en curso; fuera de un rerun (procesos sin servidor) no registra nada."""
+    ctx = contexto_rerun.get()
+    inicio = time.perf_counter()
+    try: yield
+    finally:
+        if ctx is not None: anotar_etapa(ctx, etapa, tabla, inicio)
+
+def percentiles_etapas(df):
+    """Latencia por etapa y tabla: mediciones, p50/p90/p95/p99 y máximo en ms."""
+    columnas = ['etapa', 'tabla', 'n', 'p50', 'p90', 'p95', 'p99', 'max']
+    if df.empty: return pd.DataFrame(columns=columnas)
+    grupos = df.groupby(['etapa', 'tabla'])['ms']
+    res = grupos.quantile([0.5, 0.9, 0.95, 0.99]).unstack()
+    res.columns = ['p50', 'p90', 'p95', 'p99']
+    res['n'] = grupos.size()
+    res['max'] = grupos.max()
+    return res.reset_index()[columnas].sort_values('p95', ascending=False)
+
+# ==============================================================================
+# 2. FUNCIONES DE LECTURA E INTELIGENCIA
+# ==============================================================================
+
+@lru_cache(maxsize=4096)
+def normalize_text(text):
+    if not isinstance(text, str): return str(text)
+    text = unicodedata.normalize('NFD', text).encode('ascii', 'ignore').decode('utf-8')
+    return text.upper().strip()
+
+def buscar_columna_inteligente(df, palabras_clave):
+    """Busca una columna que contenga alguna de las palabras clave (acepta DataFrame o lista de nombres)."""
+    columnas = df.columns if hasattr(df, 'columns') else df  # Sin isinstance: no obliga a importar pandas
+    cols_norm = {normalize_text(c): c for c in columnas}
+    for kw in palabras_clave:
+        kw_norm = normalize_text(kw)
+        for col_n, col_real in cols_norm.items():
+            if kw_norm == col_n: # Prioridad coincidencia exacta
+                return col_real
+    # Si no hay exacta, buscar parcial
+    for kw in palabras_clave:
+        kw_norm = normalize_text(kw)
+        if kw_norm in CLAVES_EXACTAS: continue
+        for col_n, col_real in cols_norm.items():
+            if kw_norm in col_n:
+                return col_real
+    return None
+
+def autenticar(user, pwd):
+    conn, _ = get_connection()
+    try:
+        query = "SELECT * FROM usuarios"
+        all_users = pd.read_sql(query, conn)
+        
+        col_pwd = None
+        for c in all_users.columns:
+            if normalize_text(c) in ['CONTRASENA', 'PASSWORD', 'CLAVE', 'CONTRASEÑA']:
+                col_pwd = c
+                break
+        
+        if col_pwd:
+            user_match = all_users[
+                (all_users['usuario'].astype(str) == user) & 
+                (all_users[col_pwd].astype(str) == pwd)
+            ]
+            if not user_match.empty:
+                row = user_match.iloc[0]
+                conn.close()
+                return {
+                    'USUARIO': row['usuario'],
+                    'ROL': row.get('rol', 'Usuario'),
+                    'AREA_ACCESO': row.get('area_acceso', 'Todas')
+                }, None
+    except Exception as e:
+        conn.close()
+        return None, str(e)
+    conn.close()
+    return None, "Credenciales incorrectas"
+
+def buscar_tabla_inteligente(conn, nombre_objetivo):
+    try:
+        # Camino rápido: tabla ya inscrita en el registro de esquema
+        fila = conn.execute("SELECT tabla FROM registro_esquema WHERE tabla = ? LIMIT 1", (nombre_objetivo,)).fetchone()
+        if fila: return fila[0]
+
+        tablas = [fila[0] for fila in conn.execute("SELECT name FROM sqlite_master WHERE type='table'")]
+        tablas = [t for t in tablas if not t.lower().startswith((PREFIJO_ROLLUP, PREFIJO_BUSQUEDA))]
+        if nombre_objetivo in tablas: return nombre_objetivo
+        for t in tablas:
+            if t.lower() == nombre_objetivo.lower(): return t
+        clave = nombre_objetivo.replace('ope_', '')
+        for t in tablas:
+            if clave in t.lower(): return t
+        return None
+    except: return None
+
+def citar_sql(nombre):
+    """Cita un identificador (tabla o columna) para usarlo en SQL."""
+    return '"' + str(nombre).replace('"', '""') + '"'
+
+def numero_mes(mes):
+    """'Enero', 'ENERO', '1' o '01' -> 1; None si no es un mes reconocible."""
+    texto = normalize_text(mes)
+    if texto.isdigit(): return int(texto) if 1 <= int(texto) <= 12 else None
+    return MAPA_MES_NUMERO.get(texto)
+
+def normalizar_anio(serie):
+    """Año a entero nullable (2025, '2025', '2025.0' -> 2025), vectorizado."""
+    return np.floor(pd.to_numeric(serie, errors='coerce')).astype('Int64')
+
+def normalizar_mes(serie):
+    """Mes a entero nullable 1..12, vectorizado: solo se normalizan los valores distintos."""
+    codigos, unicos = pd.factorize(serie)
+    texto = pd.Series(unicos, dtype=object).astype(str).str.strip().str.upper()
+    num = pd.to_numeric(texto, errors='coerce')
+    meses = num.where(num.between(1, 12)).fillna(texto.map(MAPA_MES_NUMERO)).to_numpy(dtype=float)
+    # El código -1 (nulos) cae en el NaN agregado al final
+    return pd.Series(np.append(meses, np.nan)[codigos], index=serie.index).astype('Int64')
+
+def normalizar_area(serie):
+    """Área con normalize_text (igual que el perfil del usuario), calculada una vez por valor distinto."""
+    return serie.map({v: normalize_text(v) for v in serie.dropna().unique()}).astype('string')
+
+def sql_anio_numero(expr):
+    """Equivalente SQL de normalizar_anio."""
+    return f"CASE WHEN TRIM(CAST({expr} AS TEXT)) GLOB '[0-9]*' THEN CAST({expr} AS INTEGER) END"
+
+def sql_mes_numero(expr):
+    """Equivalente SQL de normalizar_mes."""
+    txt = f"TRIM(CAST({expr} AS TEXT))"
+    casos = " ".join(f"WHEN '{nombre}' THEN {num}" for nombre, num in MAPA_MES_NUMERO.items())
+    return (f"CASE WHEN {txt} GLOB '[0-9]*' AND CAST({expr} AS INTEGER) BETWEEN 1 AND 12 THEN CAST({expr} AS INTEGER) "
+            f"ELSE CASE UPPER({txt}) {casos} END END")
+
+def sql_periodo(roles, rol):
+    """Expresión entera del año o mes de una tabla: la columna canónica indexada si existe (y ya es entera)."""
+    col = roles.get(rol)
+    if not col: return None
+    if col.lower() == COLUMNAS_PERIODO[rol] and col.lower() not in roles.get('periodo_texto', ()): return citar_sql(col)
+    return (sql_anio_numero if rol == 'anio' else sql_mes_numero)(citar_sql(col))
+
+def asegurar_periodo_canonico(conn, tabla, columnas_tabla):
+    """
+    Migra una tabla cargada antes de las columnas canónicas: agrega periodo_anio / periodo_mes
+    a partir de las columnas de periodo existentes, o convierte a entero las PERIODO_* heredadas
+    en texto ('Enero'). Crea el índice compuesto de periodo (no hace commit).
+    """
+    existentes = {info[1].lower(): (info[1], (info[2] or '').upper()) for info in conn.execute(f"PRAGMA table_info({citar_sql(tabla)})")}
+    for rol, canonica in COLUMNAS_PERIODO.items():
+        a_numero = sql_anio_numero if rol == 'anio' else sql_mes_numero
+        if canonica in existentes:
+            col, tipo = existentes[canonica]
+            if tipo != 'INTEGER':
+                conn.execute(f"UPDATE {citar_sql(tabla)} SET {citar_sql(col)} = {a_numero(citar_sql(col))} "
+                             f"WHERE {citar_sql(col)} IS NOT {a_numero(citar_sql(col))}")
+        else:
+            origen = buscar_columna_inteligente(columnas_tabla, ROLES_COLUMNAS[rol])
+            if not origen: continue
+            conn.execute(f"ALTER TABLE {citar_sql(tabla)} ADD COLUMN {canonica} INTEGER")
+            conn.execute(f"UPDATE {citar_sql(tabla)} SET {canonica} = {a_numero(citar_sql(origen))}")
+    crear_indice_periodo(conn, tabla)
+
+def crear_indice_periodo(conn, tabla):
+    columnas = {info[1].lower() for info in conn.execute(f"PRAGMA table_info({citar_sql(tabla)})")}
+    if all(c in columnas for c in COLUMNAS_PERIODO.values()):
+        conn.execute(f"CREATE INDEX IF NOT EXISTS {citar_sql('idx_' + tabla.lower() + '_periodo')} "
+                     f"ON {citar_sql(tabla)} (periodo_anio, periodo_mes)")
+
+def asegurar_area_canonica(conn, tabla, columnas_tabla):
+    """
+    Migra una tabla de AREA_ACCESO_POR_TABLA cargada antes de area_norm: la agrega calculada en SQL
+    desde su columna de área de acceso, si tiene una, y crea su índice (no hace commit).
+    """
+    claves = AREA_ACCESO_POR_TABLA.get(tabla.lower())
+    if not claves: return
+    if COLUMNA_AREA not in {c.lower() for c in columnas_tabla}:
+        origen = buscar_columna_inteligente([c for c in columnas_tabla if c.lower() != COLUMNA_AREA], claves)
+        if not origen: return
+        conn.execute(f"ALTER TABLE {citar_sql(tabla)} ADD COLUMN {COLUMNA_AREA} TEXT")
+        conn.execute(f"UPDATE {citar_sql(tabla)} SET {COLUMNA_AREA} = normalizar_texto({citar_sql(origen)})")
+    crear_indice_area(conn, tabla)
+
+def crear_indice_area(conn, tabla):
+    """Índice del alcance por área; si la tabla tiene periodo canónico incluye (periodo_anio, periodo_mes)."""
+    if tabla.lower() not in AREA_ACCESO_POR_TABLA: return
+    columnas = {info[1].lower() for info in conn.execute(f"PRAGMA table_info({citar_sql(tabla)})")}
+    if COLUMNA_AREA not in columnas: return
+    indice = [COLUMNA_AREA] + ([*COLUMNAS_PERIODO.values()] if all(c in columnas for c in COLUMNAS_PERIODO.values()) else [])
+    conn.execute(f"CREATE INDEX IF NOT EXISTS {citar_sql('idx_' + tabla.lower() + '_area')} "
+                 f"ON {citar_sql(tabla)} ({', '.join(indice)})")
+
+def resolver_roles(tabla, columnas_tabla):
+    """
+    {rol: columna física o None} a partir de los nombres de columna, sin tocar la BD.
+    Prefiere las columnas canónicas; si una tabla con alcance por área aún no tiene area_norm
+    devuelve su columna de área original (condiciones_area la normaliza en la consulta).
+    """
+    canonicas = {c.lower(): c for c in columnas_tabla}
+    originales = [c for c in columnas_tabla if c.lower() not in COLUMNAS_CANONICAS]  # 'FECHA' no es fecha_carga
+    excepciones = ROLES_POR_TABLA.get(tabla.lower(), {})
+
+    def resolver(rol, claves):
+        if COLUMNAS_PERIODO.get(rol) in canonicas: return canonicas[COLUMNAS_PERIODO[rol]]
+        if rol == 'area':  # Solo en tablas con alcance por área
+            claves_area = AREA_ACCESO_POR_TABLA.get(tabla.lower())
+            if not claves_area: return None
+            return canonicas.get(COLUMNA_AREA) or buscar_columna_inteligente(originales, claves_area)
+        return buscar_columna_inteligente(originales, excepciones.get(rol, claves))
+
+    return {rol: resolver(rol, claves) for rol, claves in ROLES_COLUMNAS.items()}
+
+def registrar_esquema(conn, tabla):
+    """
+    Resuelve y guarda en `registro_esquema` la columna física de cada rol canónico.
+    Solo recalcula si las columnas de la tabla cambiaron desde el último registro; en ese caso
+    migra las columnas de periodo y de área y descarta el resumen mensual para que se reconstruya (no hace commit).
+    """
+    crear_indice_periodo(conn, tabla)
+    crear_indice_area(conn, tabla)
+    columnas_tabla = [info[1] for info in conn.execute(f"PRAGMA table_info({citar_sql(tabla)})")]
+    firma = VERSION_REGISTRO + "|" + "|".join(columnas_tabla)
+    fila = conn.execute("SELECT firma FROM registro_esquema WHERE tabla = ? LIMIT 1", (tabla,)).fetchone()
+    if fila and fila[0] == firma: return
+
+    asegurar_periodo_canonico(conn, tabla, columnas_tabla)
+    asegurar_area_canonica(conn, tabla, columnas_tabla)
+    columnas_tabla = [info[1] for info in conn.execute(f"PRAGMA table_info({citar_sql(tabla)})")]
+    firma = VERSION_REGISTRO + "|" + "|".join(columnas_tabla)
+    conn.execute("DELETE FROM registro_esquema WHERE tabla = ?", (tabla,))
+    conn.executemany(
+        "INSERT INTO registro_esquema (tabla, rol, columna, firma) VALUES (?, ?, ?, ?)",
+        [(tabla, rol, col, firma) for rol, col in resolver_roles(tabla, columnas_tabla).items()]
+    )
+    conn.execute(f"DROP TABLE IF EXISTS {citar_sql(PREFIJO_ROLLUP + tabla.lower())}")
+    incrementar_version(conn, tabla)
+
+def registro_vigente(conn, tabla):
+    """True si la tabla está inscrita con la versión actual de los roles."""
+    fila = conn.execute("SELECT firma FROM registro_esquema WHERE tabla = ? LIMIT 1", (tabla,)).fetchone()
+    return bool(fila) and fila[0].startswith(VERSION_REGISTRO + "|")
+
+def roles_tabla(conn, tabla):
+    """
+    Devuelve {rol: columna física o None} del registro. Es de solo lectura: si la tabla no está
+    inscrita (o lo está con una versión anterior de los roles) los resuelve en memoria; la inscripción
+    y la migración las hacen init_db y las cargas con la conexión de escritura.
+    """
+    if registro_vigente(conn, tabla):
+        return dict(conn.execute("SELECT rol, columna FROM registro_esquema WHERE tabla = ?", (tabla,)).fetchall())
+    info = conn.execute(f"PRAGMA table_info({citar_sql(tabla)})").fetchall()
+    roles = resolver_roles(tabla, [i[1] for i in info])
+    # PERIODO_* heredadas en texto ('Enero'): sql_periodo las convierte hasta que la tabla se inscriba
+    roles['periodo_texto'] = {i[1].lower() for i in info
+                              if i[1].lower() in COLUMNAS_PERIODO.values() and (i[2] or '').upper() != 'INTEGER'}
+    return roles
+
+def registrar_tablas():
+    """
+    Inscribe con la conexión de escritura las tablas de datos sin registro vigente: las operativas,
+    el catálogo y las ya inscritas con una versión anterior de los roles. Devuelve las tablas inscritas.
+    """
+    conn, _ = get_connection()
+    try:
+        candidatas = {fila[0] for fila in conn.execute("SELECT DISTINCT tabla FROM registro_esquema")}
+        for nombre in [*MAPA_TABLAS_OPERATIVAS.values(), 'catalogo_indicadores']:
+            tabla = buscar_tabla_inteligente(conn, nombre)
+            if tabla: candidatas.add(tabla)
+        pendientes = sorted(t for t in candidatas if not registro_vigente(conn, t))
+    finally: conn.close()
+    if not pendientes: return []  # Al día: no espera el lock de escritura de una carga en curso
+
+    conn, _ = get_connection(escritura=True)
+    try:
+        existentes = {fila[0] for fila in conn.execute("SELECT name FROM sqlite_master WHERE type='table'")}
+        for tabla in pendientes:
+            conn.execute("BEGIN IMMEDIATE")
+            if tabla in existentes and not registro_vigente(conn, tabla):  # Otro proceso pudo inscribirla
+                registrar_esquema(conn, tabla)
+            conn.commit()
+        return pendientes
+    except Exception:
+        conn.rollback()
+        raise
+    finally: conn.close()
+
+def obtener_roles(nombre_tabla):
+    conn, _ = get_connection()
+    try: return roles_tabla(conn, nombre_tabla)
+    except: return {}
+    finally: conn.close()
+
+def compactar_df(df):
+    """
+    Representación compacta de una lectura: texto repetido (aseguradora, área, mes) como category
+    y enteros al tipo más pequeño. Los decimales quedan en float64 (float32 perdería centavos).
+    """
+    for col in df.columns:
+        serie = df[col]
+        if pd.api.types.is_integer_dtype(serie) and not pd.api.types.is_bool_dtype(serie):
+            df[col] = pd.to_numeric(serie, downcast='integer')
+        elif pd.api.types.is_object_dtype(serie) or pd.api.types.is_string_dtype(serie):
+            if serie.nunique() <= MAX_FRACCION_CATEGORIA * len(serie):
+                df[col] = serie.astype('category')
+    return df
+
+def filtrar_por_periodo(df, anio, mes):
+    """Filtra un DataFrame genérico por Año y Mes usando búsqueda inteligente de columnas."""
+    if df.empty: return df
+    
+    df_filtrado = df
+    
+    # 1. Filtro Año
+    col_anio = buscar_columna_inteligente(df_filtrado, CLAVES_ANIO)
+    if col_anio and anio:
+        df_filtrado = df_filtrado[normalizar_anio(df_filtrado[col_anio]).eq(int(anio)).fillna(False)]
+        
+    # 2. Filtro Mes (vectorizado: 'Enero', 'ENERO', '1' y '01' son el mismo mes)
+    if mes and mes != "Todos":
+        col_mes = buscar_columna_inteligente(df_filtrado, CLAVES_MES)
+        if col_mes:
+            df_filtrado = df_filtrado[normalizar_mes(df_filtrado[col_mes]).eq(numero_mes(mes)).fillna(False)]
+            
+    return df_filtrado
+
+def condiciones_periodo(roles, anios=None, meses=None):
+    """
+    Condiciones SQL ([condición], params) para años y meses enteros elegidos.
+    Devuelve None si la tabla no tiene la columna de periodo que el filtro necesita.
+    """
+    # Con columnas canónicas la condición es una búsqueda sobre el índice (periodo_anio, periodo_mes)
+    condiciones, params = [], []
+    for rol, valores in (('anio', anios), ('mes', meses)):
+        if not valores: continue
+        expr = sql_periodo(roles, rol)
+        if not expr: return None
+        condiciones.append(f"{expr} IN ({', '.join('?' * len(valores))})")
+        params.extend(valores)
+    return condiciones, params
+
+def condiciones_area(roles, area=None):
+    """
+    Condición SQL ([condición], params) del alcance por área sobre area_norm (indexada); sobre la
+    columna original normalizada si la tabla aún no está inscrita. Vacía si no se pide área
+    o si la tabla no tiene columna de área.
+    """
+    if not area or not roles.get('area'): return [], []
+    col = citar_sql(roles['area'])
+    if roles['area'].lower() != COLUMNA_AREA: col = f"normalizar_texto({col})"
+    return [f"{col} = ?"], [normalize_text(area)]
+
+def condiciones_filtro(roles, anios=None, meses=None, area=None):
+    """Periodo (si la tabla lo permite) y alcance por área, como ([condición], params)."""
+    condiciones, params = condiciones_periodo(roles, anios, meses) or ([], [])
+    condiciones_a, params_a = condiciones_area(roles, area)
+    return condiciones + condiciones_a, params + params_a
+
+def clave_area(roles, area=None):
+    """Parte de la clave de caché que distingue el alcance por área (None si no aplica)."""
+    return normalize_text(area) if area and roles.get('area') else None
+
+def construir_consulta(tabla, roles, anio=None, mes=None, columnas=None, area=None):
+    """
+    Arma un SELECT parametrizado con el filtro de periodo, el alcance por área y la proyección pedida.
+    `roles` viene del registro de esquema y `columnas` es la lista de roles requeridos;
+    las columnas de periodo siempre se incluyen. Devuelve (sql, params), o None si
+    el filtro de periodo no se puede resolver en la tabla.
+    """
+    filtro = condiciones_periodo(roles, [int(anio)] if anio else None,
+                                 [numero_mes(mes)] if mes and mes != "Todos" else None)
+    if filtro is None:
+        return None
+    condiciones_a, params_a = condiciones_area(roles, area)
+    condiciones, params = filtro[0] + condiciones_a, filtro[1] + params_a
+
+    seleccion = "*"
+    if columnas:
+        elegidas = [roles.get(r) for r in ['anio', 'mes'] + list(columnas)]
+        elegidas = list(dict.fromkeys(c for c in elegidas if c))
+        if elegidas:
+            seleccion = ", ".join(citar_sql(c) for c in elegidas)
+
+    sql = f"SELECT {seleccion} FROM {citar_sql(tabla)}"
+    if condiciones:
+        sql += " WHERE " + " AND ".join(condiciones)
+    return sql, params
+
+def obtener_datos(nombre_ui, nombre_tabla_ideal, anio=None, mes=None, columnas=None, area=None):
+    """
+    Lee una tabla aplicando en SQL el filtro de periodo, el alcance por `area` y la proyección de columnas
+    (`columnas` = roles del registro de esquema, p. ej. ['valor', 'aseguradora']).
+    Si la tabla no tiene columnas de periodo reconocibles se lee completa (con el alcance por área)
+    y se filtra en pandas.
+    """
+    conn, _ = get_connection()
+    tabla_real = buscar_tabla_inteligente(conn, nombre_tabla_ideal)
+    df = pd.DataFrame()
+    if tabla_real:
+        try: roles = roles_tabla(conn, tabla_real)
+        except sqlite3.Error: roles = {}
+        cache = get_cache_resultados()
+        version = version_tabla(conn, tabla_real)
+        clave = (((tabla_real.lower(), version),), 'datos', anio, mes,
+                 tuple(columnas) if columnas else None, clave_area(roles, area))
+        df_cache = cache.obtener(clave)
+        if df_cache is not None:
+            conn.close()
+            return df_cache, tabla_real
+
+        cache.invalidar(tabla_real, version)
+        try:
+            consulta = None
+            if anio or mes or columnas or area:
+                consulta = construir_consulta(tabla_real, roles, anio, mes, columnas, area)
+            with medir_etapa('lectura_sql', tabla_real):
+                sql, params = consulta or construir_consulta(tabla_real, roles, area=area)
+                df = pd.read_sql(sql, conn, params=params)
+            if not consulta:
+                with medir_etapa('filtrar_por_periodo', tabla_real):
+                    df = filtrar_por_periodo(df, anio, mes)
+            df = cache.guardar(clave, compactar_df(df))
+        except: pass
+    conn.close()
+    return df, tabla_real
+
+# ==============================================================================
+# 2.1 RESÚMENES MENSUALES PRECALCULADOS (ROLLUPS)
+# ==============================================================================
+
+def tabla_existe(conn, nombre):
+    return conn.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name = ? COLLATE NOCASE", (nombre,)).fetchone() is not None
+
+def sql_resumen_mensual(conn, tabla, rol_valor, rol_aseg):
+    """
+    Devuelve (select, expr_anio, expr_mes): el SELECT agregado por (año, mes, aseguradora)
+    sobre la tabla cruda y las expresiones enteras de periodo, para filtrar por partición.
+    """
+    roles = roles_tabla(conn, tabla)
+    expr_anio = sql_periodo(roles, 'anio') or "NULL"
+    expr_mes = sql_periodo(roles, 'mes') or "NULL"
+    col_valor = roles.get(rol_valor)
+    col_aseg = roles.get(rol_aseg) if rol_aseg else None
+
+    clave_anio = f"COALESCE(CAST({expr_anio} AS TEXT), '')"
+    clave_mes = f"COALESCE(CAST({expr_mes} AS TEXT), '')"
+    expr_aseg = f"COALESCE(CAST({citar_sql(col_aseg)} AS TEXT), '')" if col_aseg else "''"
+    expr_valor = f"TOTAL({citar_sql(col_valor)})" if col_valor else "0"
+    select = f"SELECT {clave_anio}, {clave_mes}, {expr_aseg}, {expr_valor}, COUNT(*) FROM {citar_sql(tabla)}"
+    return select, expr_anio, expr_mes
+
+def crear_tabla_rollup(conn, tabla):
+    conn.execute(f"""
+        CREATE TABLE IF NOT EXISTS {citar_sql(PREFIJO_ROLLUP + tabla.lower())} (
+            anio TEXT NOT NULL,
+            mes TEXT NOT NULL,
+            aseguradora TEXT NOT NULL,
+            valor REAL NOT NULL DEFAULT 0,
+            registros INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (anio, mes, aseguradora)
+        )
+    """)
+
+def reconstruir_rollup(conn, tabla, rol_valor, rol_aseg, anio=None, mes=None):
+    """Recalcula el resumen de la tabla completa, o solo del periodo indicado (no hace commit)."""
+    select, expr_anio, expr_mes = sql_resumen_mensual(conn, tabla, rol_valor, rol_aseg)
+    crear_tabla_rollup(conn, tabla)
+    rollup = citar_sql(PREFIJO_ROLLUP + tabla.lower())
+
+    # El resumen guarda el periodo como texto ('2025', '1'); la tabla cruda se filtra por entero
+    condiciones = []
+    if anio:
+        condiciones.append(("anio", expr_anio, int(anio)))
+    if mes:
+        condiciones.append(("mes", expr_mes, numero_mes(mes)))
+
+    where_rollup = " AND ".join(f"{c} = ?" for c, _, _ in condiciones) or "1"
+    where_cruda = " AND ".join(f"{e} = ?" for _, e, _ in condiciones) or "1"
+    conn.execute(f"DELETE FROM {rollup} WHERE {where_rollup}", [str(v) for _, _, v in condiciones])
+    conn.execute(f"INSERT INTO {rollup} (anio, mes, aseguradora, valor, registros) {select} WHERE {where_cruda} GROUP BY 1, 2, 3",
+                 [v for _, _, v in condiciones])
+
+def acumular_rollup(conn, tabla, rol_valor, rol_aseg, desde_rowid):
+    """Suma al resumen solo las filas agregadas después de `desde_rowid` (no hace commit)."""
+    rollup = citar_sql(PREFIJO_ROLLUP + tabla.lower())
+    select, _, _ = sql_resumen_mensual(conn, tabla, rol_valor, rol_aseg)
+    conn.execute(f"""
+        INSERT INTO {rollup} (anio, mes, aseguradora, valor, registros)
+        {select} WHERE rowid > ? GROUP BY 1, 2, 3
+        ON CONFLICT(anio, mes, aseguradora) DO UPDATE SET
+            valor = valor + excluded.valor,
+            registros = registros + excluded.registros
+    """, (desde_rowid,))
+
+def obtener_resumen(nombre_tabla, anio=None):
+    """
+    Resumen mensual (anio, mes, aseguradora, valor, registros) de una tabla operativa para un año
+    (sin `anio`, toda la historia). Si la tabla se cargó antes de existir los resúmenes, se construye en la primera lectura.
+    """
+    def leer():
+        vacio = pd.DataFrame(columns=['anio', 'mes', 'aseguradora', 'valor', 'registros'])
+        rol_valor, rol_aseg = ROLLUPS_MENSUALES[nombre_tabla]
+        conn, _ = get_connection()
+        try:
+            tabla_real = buscar_tabla_inteligente(conn, nombre_tabla)
+            if not tabla_real: return vacio
+            if not tabla_existe(conn, PREFIJO_ROLLUP + tabla_real.lower()):
+                conn_w, _ = get_connection(escritura=True)
+                try:
+                    reconstruir_rollup(conn_w, tabla_real, rol_valor, rol_aseg)
+                    conn_w.commit()
+                finally: conn_w.close()
+            filtro, params = ("WHERE anio = ?", (str(anio),)) if anio else ("", ())
+            df = pd.read_sql(f"SELECT anio, mes, aseguradora, valor, registros FROM {citar_sql(PREFIJO_ROLLUP + tabla_real.lower())} {filtro}",
+                             conn, params=params)
+        except: return vacio
+        finally: conn.close()
+        df['mes'] = df['mes'].map(MAPA_MES_NOMBRE).fillna(df['mes'])
+        return df
+
+    return calcular_cacheado([nombre_tabla], 'resumen_mensual', (anio,), leer)
+
+def leer_en_paralelo(tareas, max_hilos=MAX_HILOS_LECTURA):
+    """
+    Ejecuta lecturas independientes {clave: función} en un pool acotado de hilos y entrega
+    (clave, resultado) a medida que terminan. Cada hilo toma su propia conexión de lectura.
+    """
+    ctx = get_script_run_ctx()
+    with ThreadPoolExecutor(max_workers=max(1, min(max_hilos, len(tareas))),
+                            initializer=lambda: add_script_run_ctx(threading.current_thread(), ctx)) as ejecutor:
+        # Cada tarea corre en una copia del contexto para conservar las etiquetas del rerun
+        futuros = {ejecutor.submit(contextvars.copy_context().run, tarea): clave for clave, tarea in tareas.items()}
+        for futuro in as_completed(futuros):
+            yield futuros[futuro], futuro.result()
+
+# ==============================================================================
+# 2.2 LECTURA PAGINADA (TABLERO OPERATIVO)
+# ==============================================================================
+def resolver_tabla(nombre_tabla_ideal):
+    """(tabla real, roles) de una tabla operativa; solo lectura (ver roles_tabla)."""
+    conn, _ = get_connection()
+    try:
+        tabla_real = buscar_tabla_inteligente(conn, nombre_tabla_ideal)
+        if not tabla_real: return None, {}
+        try: return tabla_real, roles_tabla(conn, tabla_real)
+        except sqlite3.Error: return tabla_real, {}
+    finally: conn.close()
+
+def opciones_periodo(tabla, roles, area=None):
+    """Años y meses (enteros) presentes en la tabla, con SELECT DISTINCT sobre las columnas de periodo."""
+    def leer():
+        opciones = []
+        condiciones, params = condiciones_area(roles, area)
+        conn, _ = get_connection()
+        try:
+            for rol in ('anio', 'mes'):
+                expr = sql_periodo(roles, rol)
+                filtro = " AND ".join([f"{expr} IS NOT NULL"] + condiciones)
+                filas = conn.execute(f"SELECT DISTINCT {expr} FROM {citar_sql(tabla)} WHERE {filtro}", params).fetchall() if expr else []
+                valores = sorted({int(f[0]) for f in filas})
+                opciones.append(tuple(v for v in valores if rol == 'anio' or 1 <= v <= 12))
+        finally: conn.close()
+        return tuple(opciones)
+    return calcular_cacheado([tabla], 'opciones_periodo', (clave_area(roles, area),), leer)
+
+def contar_registros(tabla, roles, anios=None, meses=None, area=None):
+    """COUNT(*) de la tabla con el filtro de periodo y el alcance por área."""
+    def leer():
+        condiciones, params = condiciones_filtro(roles, anios, meses, area)
+        sql = f"SELECT COUNT(*) FROM {citar_sql(tabla)}"
+        if condiciones: sql += " WHERE " + " AND ".join(condiciones)
+        conn, _ = get_connection()
+        try: return conn.execute(sql, params).fetchone()[0]
+        finally: conn.close()
+    return calcular_cacheado([tabla], 'conteo', (tuple(anios or ()), tuple(meses or ()), clave_area(roles, area)), leer)
+
+def leer_pagina(tabla, roles, anios=None, meses=None, pagina=1, filas_por_pagina=FILAS_POR_PAGINA, area=None):
+    """Una página (1..n) de la tabla filtrada por periodo y área, en orden de carga (LIMIT/OFFSET sobre rowid)."""
+    def leer():
+        condiciones, params = condiciones_filtro(roles, anios, meses, area)
+        sql = f"SELECT * FROM {citar_sql(tabla)}"
+        if condiciones: sql += " WHERE " + " AND ".join(condiciones)
+        sql += " ORDER BY rowid LIMIT ? OFFSET ?"
+        conn, _ = get_connection()
+        try: return pd.read_sql(sql, conn, params=params + [filas_por_pagina, (pagina - 1) * filas_por_pagina])
+        finally: conn.close()
+    return calcular_cacheado([tabla], 'pagina', (tuple(anios or ()), tuple(meses or ()), pagina, filas_por_pagina,
+                                                 clave_area(roles, area)), leer)
+
+# ==============================================================================
+# 2.3 CÁLCULOS DEL DASHBOARD
+# ==============================================================================
+def total_kpi(res):
+    """Total de la medida de un resumen mensual ya filtrado."""
+    return res['valor'].sum() if not res.empty else 0
+
+def serie_tendencia(res):
+    """
+    Serie mensual continua (PeriodIndex, con 0 en los meses sin datos) de un resumen de varios años:
+    valor, valor del mismo mes del año anterior, variación anual y totales móviles de 3 y 12 meses.
+    """
+    anio = pd.to_numeric(res['anio'], errors='coerce')
+    mes = res['mes'].astype(str).str.upper().map(MAPA_MES_NUMERO)
+    validos = anio.notna() & mes.notna()
+    columnas = ['Valor', 'Año anterior', 'Var. anual', 'Móvil 3m', 'Móvil 12m']
+    if not validos.any(): return pd.DataFrame(columns=columnas, index=pd.PeriodIndex([], freq='M'))
+
+    periodos = pd.PeriodIndex.from_fields(year=anio[validos].astype(int), month=mes[validos].astype(int), freq='M')
+    valor = res.loc[validos, 'valor'].groupby(periodos).sum()
+    valor = valor.reindex(pd.period_range(valor.index.min(), valor.index.max(), freq='M'), fill_value=0)
+    # Índice sin huecos: desplazar 12 posiciones es el mismo mes del año anterior
+    anterior = valor.shift(12)
+    return pd.DataFrame({'Valor': valor, 'Año anterior': anterior,
+                         'Var. anual': (valor - anterior) / anterior.where(anterior != 0),
+                         'Móvil 3m': valor.rolling(3).sum(), 'Móvil 12m': valor.rolling(12).sum()}, columns=columnas)
+
+def tendencia_procesos(resumenes, anios=None):
+    """
+    Formato largo (Periodo, Tipo, Valor, Año anterior, Var. anual, Móvil 3m, Móvil 12m) de serie_tendencia por
+    proceso {etiqueta: resumen de toda la historia}. Se recorta a `anios` después de calcular, así los móviles
+    y la variación del primer mes mostrado usan los meses previos.
+    """
+    partes = []
+    for etiqueta, res in resumenes.items():
+        serie = serie_tendencia(res)
+        if anios: serie = serie[serie.index.year.isin(list(anios))]
+        partes.append(serie.assign(Tipo=etiqueta))
+    df = pd.concat(partes) if partes else serie_tendencia(pd.DataFrame(columns=['anio', 'mes', 'valor'])).assign(Tipo='')
+    df.index = df.index.to_timestamp()
+    return df.rename_axis('Periodo').reset_index()[['Periodo', 'Tipo', *df.columns.drop('Tipo')]]
+
+def anios_resumenes(resumenes):
+    """Años (enteros, ordenados) con datos en algún resumen de {etiqueta: resumen}."""
+    anios = set()
+    for res in resumenes.values(): anios.update(pd.to_numeric(res['anio'], errors='coerce').dropna().astype(int))
+    return sorted(anios)
+
+def top_aseguradoras(res, n=7):
+    """Las `n` aseguradoras con mayor valor en un resumen mensual de facturación."""
+    res_aseg = res[res['aseguradora'] != '']
+    df_top = res_aseg.groupby('aseguradora')['valor'].sum().reset_index().sort_values('valor', ascending=False).head(n)
+    df_top.columns = ['Aseguradora', 'Valor']
+    return df_top
+
+# ==============================================================================
+# 2.4 EXPORTACIÓN POR BLOQUES (CSV / XLSX)
+# ==============================================================================
+# Las filas van de SQLite al archivo bloque a bloque: nunca se arma el DataFrame completo
+
+def sin_columnas_internas(df):
+    """Quita las columnas canónicas (periodo, área, huella, fecha de carga): son del motor, no del archivo cargado."""
+    return df.drop(columns=[c for c in df.columns if str(c).lower() in COLUMNAS_CANONICAS])
+
+def columnas_visibles(tabla):
+    """Columnas de `tabla` que vienen del archivo cargado (sin las canónicas), en orden."""
+    conn, _ = get_connection()
+    try: return [info[1] for info in conn.execute(f"PRAGMA table_info({citar_sql(tabla)})")
+                 if info[1].lower() not in COLUMNAS_CANONICAS]
+    finally: conn.close()
+
+def bloques_consulta(tabla, roles, anios=None, meses=None, filas_por_bloque=FILAS_POR_BLOQUE, area=None, columnas=None):
+    """
+    Filas de la tabla filtrada por periodo y área, en orden de carga, como DataFrames de `filas_por_bloque`.
+    `columnas`: columnas físicas a exportar (todas si es None).
+    """
+    condiciones, params = condiciones_filtro(roles, anios, meses, area)
+    seleccion = ", ".join(citar_sql(c) for c in columnas) if columnas else "*"
+    sql = f"SELECT {seleccion} FROM {citar_sql(tabla)}"
+    if condiciones: sql += " WHERE " + " AND ".join(condiciones)
+    sql += " ORDER BY rowid"
+    conn, _ = get_connection()
+    try: yield from pd.read_sql(sql, conn, params=params, chunksize=filas_por_bloque)
+    finally: conn.close()
+
+def exportar_csv(bloques, salida):
+    """Escribe los bloques como CSV en el archivo binario `salida`. Devuelve las filas escritas."""
+    salida.write('\ufeff'.encode('utf-8'))  # BOM: Excel abre el UTF-8 con las tildes correctas
+    filas = 0
+    for df in bloques:
+        salida.write(df.to_csv(index=False, header=filas == 0).encode('utf-8'))
+        filas += len(df)
+    return filas
+
+def exportar_xlsx(bloques, salida, nombre_hoja="Datos"):
+    """
+    Escribe los bloques como XLSX con xlsxwriter en modo constant_memory (cada fila se vuelca a disco
+    al escribirla). Si se supera el límite de filas de Excel sigue en otra hoja. Devuelve las filas escritas.
+    """
+    import xlsxwriter
+    # Los textos se escriben tal cual: sin convertirlos en fórmulas ni hipervínculos
+    libro = xlsxwriter.Workbook(salida, {'constant_memory': True, 'strings_to_formulas': False, 'strings_to_urls': False})
+    negrita = libro.add_format({'bold': True})
+    hoja, fila, hojas, filas = None, 0, 0, 0
+    try:
+        for df in bloques:
+            encabezado = [str(c) for c in df.columns]
+            for registro in df.astype(object).where(df.notna(), None).itertuples(index=False, name=None):
+                if hoja is None or fila >= MAX_FILAS_XLSX:
+                    hojas += 1
+                    hoja = libro.add_worksheet(nombre_hoja if hojas == 1 else f"{nombre_hoja} ({hojas})")
+                    hoja.write_row(0, 0, encabezado, negrita)
+                    fila = 1
+                hoja.write_row(fila, 0, registro)
+                fila += 1
+            filas += len(df)
+    finally: libro.close()
+    return filas
+
+# ==============================================================================
+# 2.5 BÚSQUEDA DE TEXTO (FTS5)
+# ==============================================================================
+# Cada tabla de TABLAS_BUSQUEDA tiene un índice fts_<tabla> con el texto de sus columnas descriptivas
+# bajo el mismo rowid. La carga lo mantiene en la misma transacción que las filas, así que lo ven
+# todos los procesos; la consulta trae rowid y relevancia y luego lee solo las filas de la página.
+
+def columnas_busqueda(conn, tabla):
+    """Columnas cuyo texto se indexa: ni montos, ni fechas, ni columnas canónicas de la carga."""
+    return [info[1] for info in conn.execute(f"PRAGMA table_info({citar_sql(tabla)})")
+            if info[1].lower() not in COLUMNAS_CANONICAS and tipo_columna(info[1]) is None]
+
+def sql_texto_busqueda(conn, tabla):
+    """Expresión SQL con el texto indexable de una fila (las columnas vacías no aportan términos)."""
+    columnas = columnas_busqueda(conn, tabla)
+    return " || ' ' || ".join(f"COALESCE(CAST({citar_sql(c)} AS TEXT), '')" for c in columnas) or "''"
+
+def acumular_busqueda(conn, tabla, desde_rowid=0):
+    """Indexa las filas con rowid posterior a `desde_rowid` (no hace commit)."""
+    conn.execute(f"""INSERT INTO {citar_sql(PREFIJO_BUSQUEDA + tabla.lower())} (rowid, texto)
+                     SELECT rowid, {sql_texto_busqueda(conn, tabla)} FROM {citar_sql(tabla)} WHERE rowid > ?""", (desde_rowid,))
+
+def quitar_de_busqueda(conn, tabla, condicion, params):
+    """
+    Saca del índice las filas que cumplen `condicion` antes de borrarlas. Un índice sin contenido
+    solo las olvida si recibe el mismo texto con que se indexaron (no hace commit).
+    """
+    fts = citar_sql(PREFIJO_BUSQUEDA + tabla.lower())
+    conn.execute(f"""INSERT INTO {fts} ({fts}, rowid, texto)
+                     SELECT 'delete', rowid, {sql_texto_busqueda(conn, tabla)} FROM {citar_sql(tabla)} WHERE {condicion}""", params)
+
+def reconstruir_busqueda(conn, tabla):
+    """Crea desde cero el índice de búsqueda de la tabla completa (no hace commit)."""
+    fts = citar_sql(PREFIJO_BUSQUEDA + tabla.lower())
+    conn.execute(f"DROP TABLE IF EXISTS {fts}")
+    conn.execute(f"CREATE VIRTUAL TABLE {fts} USING fts5(texto, content='', tokenize='{TOKENIZADOR_BUSQUEDA}')")
+    acumular_busqueda(conn, tabla)
+
+def asegurar_indice_busqueda(tabla):
+    """Si la tabla se cargó antes de existir la búsqueda, construye su índice (una sola vez, con el lock de escritura)."""
+    conn, _ = get_connection()
+    try: existe = tabla_existe(conn, PREFIJO_BUSQUEDA + tabla.lower())
+    finally: conn.close()
+    if existe: return
+
+    conn, _ = get_connection(escritura=True)
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        if not tabla_existe(conn, PREFIJO_BUSQUEDA + tabla.lower()):
+            reconstruir_busqueda(conn, tabla)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally: conn.close()
+
+def consulta_fts(texto):
+    """
+    Convierte lo escrito en el buscador en una consulta FTS5 segura: cada palabra como frase con
+    prefijo ('sura 1234' -> "sura"* "1234"*), todas requeridas. None si no hay nada que buscar.
+    """
+    palabras = [p.replace('"', '""') for p in str(texto or '').split() if p.strip('"')]
+    return " ".join(f'"{p}"*' for p in palabras) or None
+
+def texto_periodo(valor):
+    """Año o mes de una fila como texto ('2025', '3'); los enteros leídos como float pierden el '.0'."""
+    if valor is None or pd.isna(valor): return ''
+    if isinstance(valor, float) and valor.is_integer(): valor = int(valor)
+    return str(valor).strip()
+
+def resumir_registro(fila):
+    """Texto 'COLUMNA: valor · ...' de una fila, sin vacíos ni columnas canónicas."""
+    return " · ".join(f"{c}: {v}" for c, v in fila.items() if c.lower() not in COLUMNAS_CANONICAS and pd.notna(v) and str(v).strip())
+
+def buscar_texto(consulta, area=None, pagina=1, filas_por_pagina=RESULTADOS_POR_PAGINA):
+    """
+    Busca en todas las tablas de TABLAS_BUSQUEDA. Devuelve ({tabla: coincidencias}, página de
+    resultados con Tabla, Periodo y Registro), ordenada por relevancia (bm25) entre todas las tablas.
+    Con `area` solo cuenta y devuelve filas de esa área.
+    """
+    vacio = pd.DataFrame(columns=['Tabla', 'Periodo', 'Registro'])
+    expresion = consulta_fts(consulta)
+    destinos = [(t, *resolver_tabla(t)) for t in TABLAS_BUSQUEDA]
+    destinos = [(t, real, roles) for t, real, roles in destinos if real]
+    if not expresion or not destinos: return {}, vacio
+    for _, real, _ in destinos: asegurar_indice_busqueda(real)
+
+    def leer():
+        conteos, aciertos = {}, []
+        conn, _ = get_connection()
+        try:
+            for t, real, roles in destinos:
+                fts = citar_sql(PREFIJO_BUSQUEDA + real.lower())
+                condiciones, params = condiciones_area(roles, area)
+                # Con alcance por área se cruza con la tabla por rowid para filtrar por area_norm; CROSS JOIN
+                # obliga a partir del índice de texto (si no, SQLite recorre el área y consulta el índice por fila)
+                origen = fts + (f" CROSS JOIN {citar_sql(real)} ON {citar_sql(real)}.rowid = {fts}.rowid" if condiciones else "")
+                filtro = " AND ".join([f"{fts} MATCH ?"] + condiciones)
+                params = [expresion] + params
+                conteos[t] = conn.execute(f"SELECT COUNT(*) FROM {origen} WHERE {filtro}", params).fetchone()[0]
+                if not conteos[t]: continue
+                # Cada tabla aporta sus mejores hasta el final de la página; luego se mezclan por relevancia
+                filas = conn.execute(f"SELECT {fts}.rowid, {fts}.rank FROM {origen} WHERE {filtro} ORDER BY {fts}.rank LIMIT ?",
+                                     params + [pagina * filas_por_pagina]).fetchall()
+                aciertos += [(rango, t, real, rowid) for rowid, rango in filas]
+
+            aciertos = sorted(aciertos)[(pagina - 1) * filas_por_pagina:pagina * filas_por_pagina]
+            registros = {}
+            for real in {a[2] for a in aciertos}:
+                rowids = [a[3] for a in aciertos if a[2] == real]
+                df = pd.read_sql(f"SELECT rowid AS rowid_busqueda, * FROM {citar_sql(real)} "
+                                 f"WHERE rowid IN ({', '.join('?' * len(rowids))})", conn, params=rowids)
+                registros[real] = df.set_index('rowid_busqueda')
+        finally: conn.close()
+
+        nombres_ui = {v: k.title() for k, v in MAPA_TABLAS_OPERATIVAS.items()}
+        roles_por_tabla = {t: roles for t, _, roles in destinos}
+        resultados = []
+        for _, t, real, rowid in aciertos:
+            fila, roles = registros[real].loc[rowid], roles_por_tabla[t]
+            periodo = [texto_periodo(fila.get(roles[rol])) if roles.get(rol) else '' for rol in ('mes', 'anio')]
+            periodo[0] = MAPA_MES_NOMBRE.get(periodo[0].upper(), periodo[0])
+            resultados.append({'Tabla': nombres_ui.get(t, t), 'Periodo': " ".join(p for p in periodo if p),
+                               'Registro': resumir_registro(fila)})
+        return conteos, pd.DataFrame(resultados, columns=vacio.columns)
+
+    clave = normalize_text(area) if area else None
+    return calcular_cacheado([real for _, real, _ in destinos], 'busqueda', (expresion, clave, pagina, filas_por_pagina), leer)
+
+# ==============================================================================
+# 2.6 EDADES DE CARTERA
+# ==============================================================================
+# Un solo GROUP BY en SQLite con CASE por tramo sobre el año pedido de ope_cartera (las filas no
+# pasan a pandas); el resultado es chico (periodo x aseguradora) y queda cacheado por versión de datos.
+
+def sql_edades_cartera(tabla, roles, condiciones, origen=None):
+    """
+    SELECT agregado (anio, mes, aseguradora, monto por tramo..., sin fecha, registros) de la tabla de cartera.
+    Con `origen` (read_parquet del snapshot) se arma en el dialecto de DuckDB con los mismos resultados.
+    """
+    expr_anio, expr_mes = sql_periodo(roles, 'anio'), sql_periodo(roles, 'mes')
+    fecha, saldo = citar_sql(roles['fecha']), citar_sql(roles['saldo'])
+    if origen is None:
+        # Días del documento al último día del mes del periodo
+        corte = f"julianday(printf('%04d-%02d-01', {expr_anio}, {expr_mes}), '+1 month', '-1 day')"
+        dias = f"{corte} - julianday({fecha})"
+        suma, origen, limite = "TOTAL({})", citar_sql(tabla), " LIMIT -1"
+    else:
+        # Los mismos días fraccionarios que julianday, en segundos desde epoch
+        corte = f"epoch(CAST(last_day(make_date(CAST({expr_anio} AS INTEGER), CAST({expr_mes} AS INTEGER), 1)) AS TIMESTAMP))"
+        dias = f"({corte} - epoch(TRY_CAST({fecha} AS TIMESTAMP))) / 86400.0"
+        suma, saldo, limite = "COALESCE(SUM({}), 0)", f"TRY_CAST({saldo} AS DOUBLE)", ""
+    aseguradora = f"COALESCE(CAST({citar_sql(roles['aseguradora'])} AS TEXT), '')" if roles.get('aseguradora') else "''"
+
+    tramos, desde = [], None
+    for _, hasta in TRAMOS_EDAD:
+        limites = ([f"dias > {desde}"] if desde is not None else []) + ([f"dias <= {hasta}"] if hasta is not None else [])
+        tramos.append(suma.format(f"CASE WHEN {' AND '.join(limites)} THEN saldo END"))
+        desde = hasta
+    tramos.append(suma.format("CASE WHEN dias IS NULL THEN saldo END"))
+
+    filtro = " AND ".join([f"{expr_anio} IS NOT NULL", f"{expr_mes} IS NOT NULL"] + condiciones)
+    # LIMIT -1 impide que SQLite aplane la subconsulta: `dias` se calcula una vez por fila y no una por tramo
+    return f"""
+        SELECT anio, mes, aseguradora, {', '.join(tramos)}, COUNT(*)
+        FROM (SELECT {expr_anio} AS anio, {expr_mes} AS mes, {aseguradora} AS aseguradora,
+                     {saldo} AS saldo, {dias} AS dias
+              FROM {origen} WHERE {filtro}{limite})
+        GROUP BY 1, 2, 3
+    """
+
+def edades_cartera(anio=None, area=None):
+    """
+    Saldo de ope_cartera por periodo (anio, mes enteros), aseguradora y tramo de TRAMOS_EDAD, más
+    'Sin fecha' y registros, del año `anio` (toda la historia si es None; con DuckDB solo se leen
+    las particiones de ese año). Vacío si la tabla no tiene periodo, saldo y fecha del documento.
+    """
+    tramos = [t for t, _ in TRAMOS_EDAD] + [TRAMO_SIN_FECHA]
+    vacio = pd.DataFrame(columns=['anio', 'mes', 'aseguradora', *tramos, 'registros'])
+    tabla, roles = resolver_tabla('ope_cartera')
+    if not tabla or not all(roles.get(r) for r in ('anio', 'mes', 'saldo', 'fecha')): return vacio
+
+    def leer():
+        condiciones, params = condiciones_filtro(roles, [int(anio)] if anio else None, None, area)
+        df = leer_snapshot(tabla, roles, lambda origen: sql_edades_cartera(tabla, roles, condiciones, origen), params)
+        if df is None:
+            conn, _ = get_connection()
+            try: df = pd.read_sql(sql_edades_cartera(tabla, roles, condiciones), conn, params=params)
+            finally: conn.close()
+        df.columns = vacio.columns
+        return df.astype({'anio': 'int64', 'mes': 'int64'})
+
+    return calcular_cacheado([tabla], 'edades_cartera', (int(anio) if anio else None, clave_area(roles, area)), leer)
+
+def corte_edades(edades, anio, mes=None):
+    """(mes, filas) del corte a mostrar: el mes pedido o, con 'Todos', el último del año con saldos."""
+    del_anio = edades[edades['anio'] == int(anio)]
+    if del_anio.empty: return None, del_anio
+    mes_num = numero_mes(mes) if mes and mes != "Todos" else int(del_anio['mes'].max())
+    return mes_num, del_anio[del_anio['mes'] == mes_num]
+
+def tabla_edades(corte, n=10):
+    """Saldo por aseguradora (las `n` mayores y 'Otras') y tramo, con columna y fila de Total."""
+    tramos = [t for t, _ in TRAMOS_EDAD] + ([TRAMO_SIN_FECHA] if corte[TRAMO_SIN_FECHA].any() else [])
+    por_aseg = corte.groupby('aseguradora')[tramos].sum()
+    por_aseg.index = por_aseg.index.where(por_aseg.index != '', 'Sin aseguradora')
+    por_aseg['Total'] = por_aseg.sum(axis=1)
+    por_aseg = por_aseg.sort_values('Total', ascending=False)
+    if len(por_aseg) > n:
+        por_aseg = pd.concat([por_aseg.head(n), por_aseg.iloc[n:].sum().to_frame('Otras').T])
+    por_aseg.loc['Total'] = por_aseg.sum()
+    return por_aseg.rename_axis('Aseguradora').reset_index()
+
+def recaudo_vs_provision(res_cartera, res_provision):
+    """Recaudo y provisión por mes (de sus resúmenes mensuales) y la cobertura recaudo / provisión."""
+    df = pd.DataFrame({'Recaudo': res_cartera.groupby('mes')['valor'].sum(),
+                       'Provisión': res_provision.groupby('mes')['valor'].sum()}).fillna(0)
+    df = df.reindex([m for m in LISTA_MESES if m in df.index])
+    df['Cobertura'] = df['Recaudo'] / df['Provisión'].where(df['Provisión'] != 0)
+    return df.rename_axis('Mes').reset_index()
+
+# ==============================================================================
+# 2.7 MOTOR ANALÍTICO (DUCKDB SOBRE SNAPSHOTS PARQUET)
+# ==============================================================================
+# Con MOTOR_ANALITICO = 'duckdb' la carga reescribe, bajo el lock de escritura y tras el commit, las
+# particiones Parquet (periodo_anio=/periodo_mes=) de los periodos que tocó y anota la versión de datos
+# que reflejan. Las agregaciones filtran por periodo sobre esas carpetas (DuckDB salta las particiones
+# de otros años) y vuelven a SQLite si el snapshot no coincide con la versión vigente.
+
+@lru_cache(maxsize=None)
+def duckdb_instalado():
+    return all(find_spec(modulo) for modulo in ('duckdb', 'pyarrow'))
+
+def usar_duckdb():
+    return MOTOR_ANALITICO == 'duckdb' and duckdb_instalado()
+
+@st.cache_resource
+def get_duckdb():
+    """Base DuckDB en memoria, una por proceso; cada lectura abre su cursor (uno por hilo)."""
+    import duckdb
+    return duckdb.connect()
+
+def carpeta_snapshot(tabla):
+    ruta_bd = os.path.abspath(get_pool().path)
+    return os.path.join(os.path.splitext(ruta_bd)[0] + SUFIJO_CARPETA_PARQUET, tabla.lower())
+
+def tiene_periodo_canonico(conn, tabla):
+    columnas = {info[1].lower() for info in conn.execute(f"PRAGMA table_info({citar_sql(tabla)})")}
+    return set(COLUMNAS_PERIODO.values()) <= columnas
+
+def escribir_particion(conn, tabla, destino, anio, mes):
+    """Reescribe (archivo temporal + os.replace) la partición de un periodo; la borra si el periodo quedó vacío."""
+    carpeta = os.path.join(destino, f"periodo_anio={anio}", f"periodo_mes={mes}")
+    df = pd.read_sql(f"SELECT * FROM {citar_sql(tabla)} WHERE periodo_anio = ? AND periodo_mes = ?", conn, params=(anio, mes))
+    if df.empty:
+        shutil.rmtree(carpeta, ignore_errors=True)
+        return
+    # El periodo va en la ruta; las columnas con números y texto mezclados (SQLite lo permite) van como texto
+    df = df.drop(columns=list(COLUMNAS_PERIODO.values()))
+    mixtas = [c for c in df.columns if df[c].dtype == object and df[c].notna().any()]
+    if mixtas: df[mixtas] = df[mixtas].astype('string')
+    os.makedirs(carpeta, exist_ok=True)
+    temporal = os.path.join(carpeta, f"{ARCHIVO_PARTICION}.{os.getpid()}.tmp")
+    df.to_parquet(temporal, index=False)
+    os.replace(temporal, os.path.join(carpeta, ARCHIVO_PARTICION))
+
+def reconstruir_snapshot(conn, tabla, destino):
+    """Escribe el snapshot completo en una carpeta nueva y la cambia por la anterior."""
+    nueva = f"{destino}.{os.getpid()}.nueva"
+    shutil.rmtree(nueva, ignore_errors=True)
+    periodos = conn.execute(f"SELECT DISTINCT periodo_anio, periodo_mes FROM {citar_sql(tabla)} "
+                            f"WHERE periodo_anio IS NOT NULL AND periodo_mes IS NOT NULL").fetchall()
+    os.makedirs(nueva)
+    for anio, mes in periodos: escribir_particion(conn, tabla, nueva, anio, mes)
+    shutil.rmtree(destino, ignore_errors=True)
+    os.replace(nueva, destino)
+
+def actualizar_snapshot(conn, tabla, version_previa=None, version_carga=None, periodos=None):
+    """
+    Pone al día el snapshot Parquet de la tabla con la conexión de escritura (BEGIN IMMEDIATE: una carga
+    o un snapshot de otro proceso esperan). Si reflejaba `version_previa` solo se reescriben `periodos` y
+    queda marcado con `version_carga`; si no (o sin periodos, p. ej. tras un reemplazo), se rehace completo
+    con la versión vigente. Devuelve '' o el error: SQLite ya tiene los datos y las lecturas vuelven ahí.
+    """
+    destino = carpeta_snapshot(tabla)
+    ruta_version = os.path.join(destino, ARCHIVO_VERSION_SNAPSHOT)
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        if tiene_periodo_canonico(conn, tabla):
+            version = version_tabla(conn, tabla)
+            marcada = (leer_json(ruta_version) or {}).get('version')
+            if marcada == version: pass  # Otro proceso ya lo dejó al día
+            elif periodos is not None and marcada == version_previa:
+                # Otra carga pudo entrar tras el commit: sus periodos se reescriben con ella y la marca
+                # queda en la versión de esta, así que hasta entonces las lecturas siguen en SQLite
+                for anio, mes in sorted(periodos): escribir_particion(conn, tabla, destino, anio, mes)
+                escribir_json(ruta_version, {'version': version_carga})
+            else:
+                reconstruir_snapshot(conn, tabla, destino)
+                escribir_json(ruta_version, {'version': version})
+        conn.commit()
+        return ""
+    except Exception as e:
+        conn.rollback()
+        return str(e)
+
+def snapshot_vigente(tabla, roles):
+    """
+    Origen read_parquet(...) del snapshot de la tabla si DuckDB está habilitado, o None. Un snapshot
+    atrasado (cargas hechas con el motor 'sqlite', un error al escribirlo) se rehace aquí una vez.
+    """
+    if not usar_duckdb() or not tabla.lower().startswith(PREFIJO_SNAPSHOT): return None
+    if any((roles.get(rol) or '').lower() != columna for rol, columna in COLUMNAS_PERIODO.items()): return None
+    destino = carpeta_snapshot(tabla)
+    conn, _ = get_connection()
+    try: version = version_tabla(conn, tabla)
+    finally: conn.close()
+    if (leer_json(os.path.join(destino, ARCHIVO_VERSION_SNAPSHOT)) or {}).get('version') != version:
+        conn, _ = get_connection(escritura=True)
+        try: error = actualizar_snapshot(conn, tabla)
+        finally: conn.close()
+        if error: return None
+    archivos = os.path.join(destino, '*', '*', ARCHIVO_PARTICION)
+    if not glob.glob(archivos): return None
+    return f"read_parquet('{archivos.replace(chr(39), chr(39) * 2)}', hive_partitioning = true, union_by_name = true)"
+
+def leer_snapshot(tabla, roles, armar_sql, params=()):
+    """
+    DataFrame de la consulta `armar_sql(origen)` en DuckDB sobre el snapshot de la tabla, o None para
+    leer de SQLite (motor 'sqlite', DuckDB no instalado, tabla sin periodo o snapshot en reemplazo).
+    """
+    origen = snapshot_vigente(tabla, roles)
+    if not origen: return None
+    cursor = get_duckdb().cursor()
+    try: return cursor.execute(armar_sql(origen), list(params)).df()
+    except Exception: return None
+    finally: cursor.close()
+
+# ==============================================================================
+# 3. FUNCIONES DE ESCRITURA (GESTOR)
+# ==============================================================================
+
+def crear_usuario_bd(usuario, contrasena, rol, area):
+    conn, _ = get_connection(escritura=True)
+    try:
+        cols = [info[1] for info in conn.execute("PRAGMA table_info(usuarios)")]
+        col_pwd = 'contrasena' if 'contrasena' in cols else 'password'
+        conn.execute(f"INSERT INTO usuarios (usuario, {col_pwd}, rol, area_acceso) VALUES (?, ?, ?, ?)", (usuario, contrasena, rol, area))
+        conn.commit()
+        return True, "Usuario creado exitosamente."
+    except sqlite3.IntegrityError: return False, "El usuario ya existe."
+    except Exception as e: return False, f"Error: {e}"
+    finally: conn.close()
+
+@lru_cache(maxsize=4096)
+def tipo_columna(nombre):
+    """'numero', 'fecha' o None según el nombre de la columna (fecha tiene prioridad: 'FECHA PAGO')."""
+    texto = normalize_text(nombre)
+    if texto.lower() in [*COLUMNAS_PERIODO.values(), COLUMNA_HUELLA, 'fecha_carga']: return None
+    if any(k in texto for k in CLAVES_FECHA): return 'fecha'
+    if any(k in texto for k in CLAVES_NUMERICAS): return 'numero'
+    return None
+
+def separador_decimal(txt):
+    """
+    ',' o '.' según las celdas (ya sin signo ni símbolos) que solo admiten una lectura; None si ninguna
+    trae separadores. Formato colombiano por defecto: '1.500' son miles y '1,500' (ambiguo) es 1,5.
+    """
+    miles_punto = txt.str.fullmatch(r'\d{1,3}(\.\d{3})+(,\d+)?')
+    miles_coma = txt.str.fullmatch(r'\d{1,3}(,\d{3})+(\.\d+)?')
+    coma = miles_punto | (txt.str.fullmatch(r'\d*,\d+') & ~miles_coma)
+    punto = (miles_coma & (txt.str.contains('.', regex=False) | txt.str.count(',').gt(1))) | \
+            (txt.str.fullmatch(r'\d*\.\d+') & ~miles_punto)
+    if not txt.str.contains('[.,]').any(): return None
+    return '.' if punto.sum() > coma.sum() else ','
+
+def parsear_numeros(serie, decimal=None):
+    """
+    Números como vienen en los archivos, vectorizado: '$1.234.567,89', '1.234.567', '(1.500,5)',
+    '-2,5', '1,234,567.89' o celdas ya numéricas. Con `decimal` (',' o '.') se usa ese separador; si no,
+    se decide con separador_decimal. Las celdas que no siguen ese formato cuentan como no interpretables.
+    Devuelve (Series float, celdas no interpretables, separador usado o None si aún no hizo falta).
+    """
+    es_texto = serie.map(type).eq(str)
+    valores = pd.to_numeric(serie.where(~es_texto), errors='coerce').astype(float)
+    if es_texto.any():
+        txt = serie[es_texto].astype(str).str.replace('[\\s\u00a0$]|COP', '', regex=True)
+        negativo = txt.str.startswith('-') | (txt.str.startswith('(') & txt.str.endswith(')'))
+        txt = txt.str.strip('-()')
+        decimal = decimal or separador_decimal(txt)
+        if decimal == '.':
+            validos = txt.str.fullmatch(r'\d{1,3}(,\d{3})+(\.\d+)?|\d*\.?\d+')
+            txt = txt.str.replace(',', '', regex=False)
+        else:
+            validos = txt.str.fullmatch(r'\d{1,3}(\.\d{3})+(,\d+)?|\d*,?\d+')
+            txt = txt.str.replace('.', '', regex=False).str.replace(',', '.', regex=False)
+        numeros = pd.to_numeric(txt.where(validos), errors='coerce')
+        valores[es_texto] = numeros.where(~negativo, -numeros)
+    vacias = serie.isna() | (es_texto & serie.astype(str).str.strip().eq(''))
+    return valores, int((valores.isna() & ~vacias).sum()), decimal
+
+def parsear_fechas(serie):
+    """
+    Fechas a texto ISO ('AAAA-MM-DD', o con hora si alguna la trae), vectorizado: datetime, ISO,
+    dd/mm/aaaa y seriales de Excel. Devuelve (Series de texto, celdas no interpretables).
+    """
+    if pd.api.types.is_datetime64_any_dtype(serie):
+        fechas = serie
+    else:
+        fechas = pd.to_datetime(serie, errors='coerce', format='ISO8601')
+        for formato in ['%d/%m/%Y', '%d/%m/%Y %H:%M:%S', '%d-%m-%Y', '%Y/%m/%d']:
+            faltan = fechas.isna() & serie.notna()
+            if not faltan.any(): break
+            fechas[faltan] = pd.to_datetime(serie[faltan].astype(str).str.strip(), errors='coerce', format=formato)
+        faltan = fechas.isna() & serie.notna()
+        if faltan.any():
+            # Seriales de Excel (días desde 1899-12-30) entre 1954 y 2119
+            serial = pd.to_numeric(serie[faltan], errors='coerce')
+            serial = serial.where(serial.between(20000, 80000))
+            fechas[faltan] = pd.to_datetime(serial, unit='D', origin='1899-12-30', errors='coerce')
+    con_hora = (fechas.dropna() != fechas.dropna().dt.normalize()).any()
+    iso = fechas.dt.strftime('%Y-%m-%d %H:%M:%S' if con_hora else '%Y-%m-%d').astype(object)
+    iso = iso.where(fechas.notna(), None)
+    vacias = serie.isna() | serie.astype(str).str.strip().eq('')
+    return iso, int((fechas.isna() & ~vacias).sum())
+
+def tipificar_bloque(df, formatos=None):
+    """
+    Convierte en el bloque las columnas de montos/cantidades a número (entero si no tiene decimales)
+    y las de fechas a texto ISO. Devuelve (df, {columna: celdas que no se pudieron interpretar}).
+    `formatos` ({columna: 'texto' | 'fecha' | 'numero' | ',' | '.'}) es de la carga: lo que decide el primer
+    bloque que lo necesita (dejar la columna como viene, separador decimal) se mantiene en los siguientes.
+    """
+    formatos = {} if formatos is None else formatos
+    fallidas = {}
+    for col in df.columns:
+        tipo = tipo_columna(col)
+        serie = df[col]
+        formato = formatos.get(col)
+        if tipo is None or formato == 'texto': continue
+        if tipo == 'numero' and pd.api.types.is_numeric_dtype(serie):
+            if serie.notna().any(): formatos.setdefault(col, 'numero')
+            continue
+        if tipo == 'numero':
+            valores, n, decimal = parsear_numeros(serie, formato if formato in (',', '.') else None)
+        else:
+            (valores, n), decimal = parsear_fechas(serie), None
+        if formato is None:
+            con_datos = int(serie.notna().sum())
+            if not con_datos: continue
+            if n > MAX_FRACCION_FALLIDAS * con_datos:
+                formatos[col] = 'texto'
+                continue
+        formatos[col] = decimal or formato or tipo
+        if tipo == 'numero' and valores.dropna().mod(1).eq(0).all() and valores.abs().max(skipna=True) < 2**53:
+            valores = valores.astype('Int64')
+        df[col] = valores
+        if n: fallidas[col] = n
+    return df, fallidas
+
+def preparar_bloque(df, anio_sel=None, mes_sel=None, fecha_carga=None, tabla=None):
+    """
+    Inyecta las columnas canónicas de periodo y la fecha de carga en un bloque del archivo, y la de
+    área si `tabla` está en AREA_ACCESO_POR_TABLA.
+    """
+    # Asegurar columnas de periodo
+    col_anio = buscar_columna_inteligente(df, CLAVES_ANIO)
+    col_mes = buscar_columna_inteligente(df, CLAVES_MES)
+    
+    # Si no existen en el archivo o están vacías, usamos las seleccionadas
+    anio_canon, mes_canon = None, None
+    if not col_anio and anio_sel:
+        anio_canon = pd.Series(int(anio_sel), index=df.index, dtype='Int64')
+    elif col_anio:
+        if anio_sel:
+            # Opcional: Rellenar vacíos con la selección
+            df[col_anio] = df[col_anio].fillna(anio_sel)
+        anio_canon = normalizar_anio(df[col_anio])
+
+    if not col_mes and mes_sel:
+        mes_canon = pd.Series(numero_mes(mes_sel), index=df.index, dtype='Int64')
+    elif col_mes:
+        if mes_sel:
+            df[col_mes] = df[col_mes].fillna(mes_sel)
+        mes_canon = normalizar_mes(df[col_mes])
+
+    # Columnas canónicas (reemplazan las PERIODO_* / area_norm que traiga el archivo; SQLite no distingue mayúsculas)
+    df.columns = df.columns.astype(str)
+    claves_area = AREA_ACCESO_POR_TABLA.get((tabla or '').lower())
+    col_area = buscar_columna_inteligente([c for c in df.columns if c.lower() != COLUMNA_AREA], claves_area) if claves_area else None
+    df = df.drop(columns=[c for c in df.columns if c.lower() in [*COLUMNAS_PERIODO.values(), COLUMNA_AREA]])
+    if anio_canon is not None: df['periodo_anio'] = anio_canon
+    if mes_canon is not None: df['periodo_mes'] = mes_canon
+    if col_area: df[COLUMNA_AREA] = normalizar_area(df[col_area])
+
+    df['fecha_carga'] = fecha_carga or datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    return df
+
+# Fechas de pandas/openpyxl como texto ISO (igual que df.to_sql) al insertar con executemany
+def adaptar_fecha(t): return t.isoformat(sep=' ')
+sqlite3.register_adapter(datetime, adaptar_fecha)
+
+def huella_filas(df, apariciones=None):
+    """
+    Huella de 64 bits por fila, sin la fecha de carga e independiente del orden de las columnas.
+    Incluye el número de aparición de la fila en la carga: las filas idénticas de un mismo archivo
+    se conservan y volver a subirlo produce las mismas huellas. `apariciones` (Counter de la carga)
+    lleva la cuenta entre bloques; sin él se cuenta solo dentro del bloque.
+    """
+    datos = df.drop(columns=['fecha_carga', COLUMNA_HUELLA], errors='ignore')
+    datos = datos[sorted(datos.columns)]
+    base = pd.util.hash_pandas_object(datos, index=False)
+    aparicion = base.groupby(base.to_numpy()).cumcount()
+    if apariciones is not None:
+        if apariciones: aparicion += base.map(apariciones).fillna(0).astype('int64')
+        apariciones.update(base.value_counts().to_dict())
+    huella = pd.util.hash_pandas_object(pd.DataFrame({'h': base, 'n': aparicion}), index=False)
+    return pd.Series(huella.to_numpy().view('int64'), index=df.index)
+
+def crear_indice_huella(conn, tabla):
+    conn.execute(f"CREATE UNIQUE INDEX IF NOT EXISTS {citar_sql('ux_' + tabla.lower() + '_huella')} "
+                 f"ON {citar_sql(tabla)} ({COLUMNA_HUELLA})")
+
+def valores_sql(df):
+    """Filas del bloque como tuplas de tipos nativos de Python (None para nulos), para executemany."""
+    sqlite3.register_adapter(pd.Timestamp, adaptar_fecha)  # Aquí y no al importar: pandas se carga diferido
+    return df.astype(object).where(df.notna(), None).itertuples(index=False, name=None)
+
+def nombres_columnas(encabezado):
+    """Encabezados de una hoja al estilo de pandas: vacíos -> 'Unnamed: i', repetidos -> 'X.1'."""
+    nombres, vistos = [], {}
+    for i, nombre in enumerate(encabezado):
+        nombre = f"Unnamed: {i}" if nombre is None else str(nombre)
+        if nombre in vistos:
+            vistos[nombre] += 1
+            nombre = f"{nombre}.{vistos[nombre]}"
+        else:
+            vistos[nombre] = 0
+        nombres.append(nombre)
+    return nombres
+
+def leer_archivo_por_bloques(f, filas_por_bloque=FILAS_POR_BLOQUE):
+    """
+    Lee un CSV o XLSX (subido o abierto desde disco) por bloques, sin cargarlo completo en memoria.
+    Produce (DataFrame, avance) con el avance estimado entre 0 y 1 (None si no se conoce).
+    """
+    tamano = getattr(f, 'size', None)
+    if tamano is None and isinstance(f, io.BufferedReader):
+        tamano = os.fstat(f.fileno()).st_size  # Archivo abierto desde disco (trabajador de cargas)
+    if f.name.lower().endswith('.csv'):
+        # Montos como texto: read_csv leería '1.500' (miles colombianos) como 1,5; tipificar_bloque decide el separador
+        inicio = f.tell()
+        columnas = pd.read_csv(f, nrows=0).columns
+        f.seek(inicio)
+        como_texto = {c: str for c in columnas if tipo_columna(c) == 'numero'}
+        for bloque in pd.read_csv(f, chunksize=filas_por_bloque, dtype=como_texto):
+            yield bloque, (f.tell() / tamano if tamano else None)
+        return
+
+    # XLSX: iteración en modo solo lectura de openpyxl (no construye la hoja en memoria)
+    import openpyxl
+    wb = openpyxl.load_workbook(f, read_only=True, data_only=True)
+    try:
+        ws = wb.worksheets[0]
+        filas = ws.iter_rows(values_only=True)
+        encabezado = next(filas, None)
+        if encabezado is None: return
+        columnas = nombres_columnas(encabezado)
+        n, total = len(columnas), ws.max_row
+        lote, leidas = [], 1
+        for fila in filas:
+            leidas += 1
+            if all(v is None for v in fila): continue
+            lote.append(tuple(fila[:n]) + (None,) * (n - len(fila)))
+            if len(lote) >= filas_por_bloque:
+                yield pd.DataFrame(lote, columns=columnas), (leidas / total if total else None)
+                lote = []
+        if lote: yield pd.DataFrame(lote, columns=columnas), 1.0
+    finally:
+        wb.close()
+
+def cargar_bloques_bd(bloques, nombre_tabla, modo='append', anio_sel=None, mes_sel=None, progreso=None, deduplicar=False,
+                      preparados=False):
+    """
+    Carga masiva por bloques en una sola transacción: inserciones con executemany, resumen
+    mensual, índice de búsqueda, registro de esquema y versión. Si algo falla se hace rollback y la tabla queda intacta.
+    Con el motor 'duckdb', tras el commit se reescriben las particiones Parquet de los periodos cargados.
+    `bloques` produce (DataFrame, avance); `progreso(filas, filas_por_segundo, avance)` se llama por bloque.
+    `modo`: 'append' agrega, 'replace' reescribe la tabla y 'particion' reemplaza solo el periodo
+    (anio_sel, mes_sel). Con `deduplicar` las filas cuya huella ya existe se omiten.
+    Con `preparados` los bloques ya pasaron por preparar_bloque y tipificar_bloque (p. ej. en otros
+    procesos) y se insertan tal cual; pueden venir de varios archivos con las columnas en otro orden.
+    """
+    mes_num = numero_mes(mes_sel) if mes_sel else None
+    if modo == 'particion' and not (anio_sel and mes_num):
+        return False, "❌ Error: el reemplazo por periodo requiere año y mes."
+
+    conn, _ = get_connection(escritura=True)
+    fecha_carga = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    tabla_q = citar_sql(nombre_tabla)
+    rollup = ROLLUPS_MENSUALES.get(nombre_tabla.lower())
+    busqueda = nombre_tabla.lower() in TABLAS_BUSQUEDA
+    snapshot = usar_duckdb() and nombre_tabla.lower().startswith(PREFIJO_SNAPSHOT)
+    periodos = set()  # (anio, mes) que tocó la carga, para reescribir solo esas particiones del snapshot
+    total, insertadas, borradas, inicio = 0, 0, 0, time.time()
+    fallidas, formatos = {}, {}  # Formatos de columna que decide el primer bloque, para todo el archivo
+    apariciones = Counter()  # Filas idénticas vistas en bloques anteriores (huella de deduplicación)
+    try:
+        conn.execute("PRAGMA cache_size = -200000")
+        conn.execute("PRAGMA temp_store = MEMORY")
+        conn.execute("BEGIN IMMEDIATE")
+        version_previa = version_tabla(conn, nombre_tabla)
+
+        sql_insert, columnas_insert, desde_rowid, desde_busqueda = None, None, None, None
+        for df, avance in bloques:
+            if not preparados:
+                df = preparar_bloque(df, anio_sel, mes_sel, fecha_carga, nombre_tabla)
+                df, fallidas_bloque = tipificar_bloque(df, formatos)
+                for col, n in fallidas_bloque.items(): fallidas[col] = fallidas.get(col, 0) + n
+            if modo == 'particion':
+                fuera = ((df['periodo_anio'] != int(anio_sel)) | (df['periodo_mes'] != mes_num)).fillna(True)
+                if fuera.any():
+                    raise ValueError(f"{int(fuera.sum())} filas del archivo no son de {mes_sel} {anio_sel}")
+            if deduplicar:
+                df[COLUMNA_HUELLA] = huella_filas(df, apariciones)
+            if snapshot and set(COLUMNAS_PERIODO.values()) <= set(df.columns):
+                periodos.update((int(a), int(m)) for a, m in df[list(COLUMNAS_PERIODO.values())].dropna().drop_duplicates().itertuples(index=False))
+
+            # Primer bloque: prepara la tabla destino
+            if sql_insert is None:
+                if modo == 'replace':
+                    conn.execute(f"DROP TABLE IF EXISTS {tabla_q}")
+                if not tabla_existe(conn, nombre_tabla):
+                    conn.execute(pd.io.sql.get_schema(df, nombre_tabla, con=conn))
+                else:
+                    # Tablas cargadas antes de las columnas canónicas se migran antes de agregarles filas
+                    registrar_esquema(conn, nombre_tabla)
+                    existentes = {info[1].lower() for info in conn.execute(f"PRAGMA table_info({tabla_q})")}
+                    for canonica, tipo in [*((c, 'INTEGER') for c in COLUMNAS_PERIODO.values()),
+                                           (COLUMNA_HUELLA, 'INTEGER'), (COLUMNA_AREA, 'TEXT')]:
+                        if canonica in df.columns and canonica not in existentes:
+                            conn.execute(f"ALTER TABLE {tabla_q} ADD COLUMN {canonica} {tipo}")
+                    indexada = busqueda and tabla_existe(conn, PREFIJO_BUSQUEDA + nombre_tabla.lower())
+                    if modo == 'particion':
+                        # Solo se borra el periodo elegido (búsqueda sobre el índice de periodo)
+                        crear_indice_periodo(conn, nombre_tabla)
+                        if indexada:
+                            quitar_de_busqueda(conn, nombre_tabla, "periodo_anio = ? AND periodo_mes = ?", (int(anio_sel), mes_num))
+                        borradas = conn.execute(f"DELETE FROM {tabla_q} WHERE periodo_anio = ? AND periodo_mes = ?",
+                                                (int(anio_sel), mes_num)).rowcount
+                    # En append solo se acumulan al resumen las filas nuevas (rowid posterior al actual)
+                    elif rollup and tabla_existe(conn, PREFIJO_ROLLUP + nombre_tabla.lower()):
+                        desde_rowid = conn.execute(f"SELECT COALESCE(MAX(rowid), 0) FROM {tabla_q}").fetchone()[0]
+                    # Al índice de búsqueda se agregan las filas nuevas (en partición, después del borrado)
+                    if indexada:
+                        desde_busqueda = conn.execute(f"SELECT COALESCE(MAX(rowid), 0) FROM {tabla_q}").fetchone()[0]
+                if deduplicar:
+                    crear_indice_huella(conn, nombre_tabla)
+
+            # El INSERT nombra las columnas: se rearma solo si el bloque las trae en otro orden
+            if tuple(df.columns) != columnas_insert:
+                columnas_insert = tuple(df.columns)
+                columnas = ", ".join(citar_sql(c) for c in columnas_insert)
+                verbo = "INSERT OR IGNORE" if deduplicar else "INSERT"
+                sql_insert = f"{verbo} INTO {tabla_q} ({columnas}) VALUES ({', '.join('?' * len(columnas_insert))})"
+
+            cambios = conn.total_changes
+            conn.executemany(sql_insert, valores_sql(df))
+            insertadas += conn.total_changes - cambios
+            total += len(df)
+            if progreso: progreso(total, total / max(time.time() - inicio, 1e-6), avance)
+
+        if sql_insert is None:
+            raise ValueError("el archivo no tiene registros")
+
+        registrar_esquema(conn, nombre_tabla)
+        if rollup:
+            # Si el registro cambió, el resumen se descartó y se reconstruye completo
+            vigente = tabla_existe(conn, PREFIJO_ROLLUP + nombre_tabla.lower())
+            if desde_rowid is not None and vigente:
+                acumular_rollup(conn, nombre_tabla, *rollup, desde_rowid)
+            elif modo == 'particion' and vigente:
+                reconstruir_rollup(conn, nombre_tabla, *rollup, anio=anio_sel, mes=mes_sel)
+            else: reconstruir_rollup(conn, nombre_tabla, *rollup)
+        if busqueda:
+            if desde_busqueda is not None: acumular_busqueda(conn, nombre_tabla, desde_busqueda)
+            else: reconstruir_busqueda(conn, nombre_tabla)
+        version = incrementar_version(conn, nombre_tabla)
+        conn.commit()
+        get_cache_resultados().invalidar(nombre_tabla, version)
+        detalle = f", {borradas} reemplazados de {mes_sel} {anio_sel}" if modo == 'particion' else ""
+        if total > insertadas: detalle += f", {total - insertadas} duplicados omitidos"
+        aviso = ""
+        if fallidas:
+            aviso = (f" ⚠️ {sum(fallidas.values())} celdas no se pudieron interpretar y quedaron vacías ("
+                     + ", ".join(f"{col}: {n}" for col, n in fallidas.items()) + ").")
+        if snapshot:
+            error = actualizar_snapshot(conn, nombre_tabla, version_previa, version, None if modo == 'replace' else periodos)
+            if error: aviso += f" ⚠️ Snapshot Parquet sin actualizar ({error}); las agregaciones leerán de SQLite."
+        return True, f"✅ Éxito: {insertadas} registros procesados{detalle} ({total / max(time.time() - inicio, 1e-6):,.0f} filas/s).{aviso}"
+    except Exception as e:
+        conn.rollback()
+        return False, f"❌ Error SQL: {e}"
+    finally: conn.close()
+
+def cargar_dataframe_bd(df, nombre_tabla, modo='append', anio_sel=None, mes_sel=None, deduplicar=False):
+    return cargar_bloques_bd([(df, 1.0)], nombre_tabla, modo=modo, anio_sel=anio_sel, mes_sel=mes_sel, deduplicar=deduplicar)
+
+# ==============================================================================
+# 3.1 COLA DE CARGAS EN SEGUNDO PLANO
+# ==============================================================================
+# La app copia el archivo a staging y encola un trabajo; trabajador_cargas.py lo ejecuta en otro
+# proceso. SQLite admite un solo escritor y la carga lo retiene hasta el commit, así que la cola vive
+# en su propio archivo SQLite (encolar o consultar no espera a la carga) y el avance en vivo va a un
+# archivo junto al de staging; estado, filas, filas/s y errores quedan en la tabla de la cola.
+
+def ahora_texto():
+    return datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+def carpeta_staging():
+    """Carpeta de archivos en espera, junto a la base de datos."""
+    carpeta = os.path.join(os.path.dirname(os.path.abspath(get_pool().path)), CARPETA_STAGING)
+    os.makedirs(carpeta, exist_ok=True)
+    return carpeta
+
+def ruta_cola():
+    return os.path.splitext(os.path.abspath(get_pool().path))[0] + SUFIJO_COLA
+
+@st.cache_resource
+def preparar_cola(ruta):
+    """Crea el archivo de la cola (WAL, tabla de trabajos) una vez por proceso."""
+    conn = sqlite3.connect(ruta, timeout=SEGUNDOS_ESPERA_COLA)
+    try:
+        conn.execute("PRAGMA journal_mode = WAL")
+        crear_tabla_trabajos(conn)
+        conn.commit()
+    finally: conn.close()
+    return ruta
+
+def conexion_cola():
+    """
+    Conexión nueva a la cola de cargas. Sus transacciones son de una fila, así que la espera por el lock
+    es corta (SEGUNDOS_ESPERA_COLA) y nunca depende de la carga de datos en curso.
+    """
+    return sqlite3.connect(preparar_cola(ruta_cola()), timeout=SEGUNDOS_ESPERA_COLA)
+
+def escribir_json(ruta, datos):
+    """Escritura atómica: quien lee nunca ve el archivo a medias."""
+    temporal = f"{ruta}.{os.getpid()}.tmp"
+    with open(temporal, 'w', encoding='utf-8') as salida: json.dump(datos, salida)
+    os.replace(temporal, ruta)
+
+def leer_json(ruta):
+    try:
+        with open(ruta, encoding='utf-8') as entrada: return json.load(entrada)
+    except (OSError, ValueError): return None
+
+def encolar_carga(f, nombre_tabla, modo='append', anio_sel=None, mes_sel=None, deduplicar=False, usuario=None):
+    """Copia el archivo subido a staging y registra el trabajo como 'pendiente'. Devuelve su id."""
+    extension = os.path.splitext(f.name)[1].lower()
+    destino = os.path.join(carpeta_staging(), f"{datetime.now():%Y%m%d_%H%M%S}_{uuid.uuid4().hex[:8]}{extension}")
+    f.seek(0)
+    with open(destino, 'wb') as salida: shutil.copyfileobj(f, salida, 1024 * 1024)
+
+    conn = conexion_cola()
+    try:
+        cur = conn.execute(f"""INSERT INTO {TABLA_TRABAJOS}
+                               (tabla, archivo, nombre_original, modo, anio, mes, deduplicar, usuario, estado, creado)
+                               VALUES (?, ?, ?, ?, ?, ?, ?, ?, 'pendiente', ?)""",
+                           (nombre_tabla, destino, f.name, modo, int(anio_sel) if anio_sel else None, mes_sel,
+                            int(bool(deduplicar)), usuario, ahora_texto()))
+        conn.commit()
+        return cur.lastrowid
+    except Exception:
+        conn.rollback()
+        os.remove(destino)
+        raise
+    finally: conn.close()
+
+def listar_trabajos(limite=20):
+    """Últimos trabajos de carga con el avance en vivo de los que están en proceso."""
+    conn = conexion_cola()
+    try:
+        df = pd.read_sql(f"""SELECT id, nombre_original, tabla, modo, anio, mes, usuario, estado, filas, filas_seg,
+                                    mensaje, archivo, creado, iniciado, terminado
+                             FROM {TABLA_TRABAJOS} ORDER BY id DESC LIMIT ?""", conn, params=(limite,))
+    finally: conn.close()
+    df['avance'] = None
+    for i in df.index[df['estado'] == 'procesando']:
+        vivo = leer_json(df.at[i, 'archivo'] + '.avance')
+        if vivo: df.loc[i, ['filas', 'filas_seg', 'avance']] = [vivo['filas'], vivo['filas_seg'], vivo['avance']]
+    return df.drop(columns='archivo')
+
+def tomar_trabajo():
+    """Reclama el trabajo pendiente más antiguo (pasa a 'procesando'); None si no hay ninguno."""
+    conn = conexion_cola()
+    try:
+        hay = conn.execute(f"SELECT 1 FROM {TABLA_TRABAJOS} WHERE estado = 'pendiente' LIMIT 1").fetchone()
+        if not hay: return None  # El sondeo no toma el lock de escritura si no hay nada que hacer
+        conn.execute("BEGIN IMMEDIATE")
+        cur = conn.execute(f"""SELECT id, tabla, archivo, modo, anio, mes, deduplicar FROM {TABLA_TRABAJOS}
+                               WHERE estado = 'pendiente' ORDER BY id LIMIT 1""")
+        fila = cur.fetchone()
+        if fila:
+            conn.execute(f"UPDATE {TABLA_TRABAJOS} SET estado = 'procesando', pid = ?, iniciado = ? WHERE id = ?",
+                         (os.getpid(), ahora_texto(), fila[0]))
+        conn.commit()
+        return dict(zip([d[0] for d in cur.description], fila)) if fila else None
+    except Exception:
+        conn.rollback()
+        raise
+    finally: conn.close()
+
+def finalizar_trabajo(id_trabajo, estado, filas, filas_seg, mensaje):
+    conn = conexion_cola()
+    try:
+        conn.execute(f"""UPDATE {TABLA_TRABAJOS} SET estado = ?, filas = ?, filas_seg = ?, mensaje = ?, terminado = ?
+                         WHERE id = ?""", (estado, filas, filas_seg, mensaje, ahora_texto(), id_trabajo))
+        conn.commit()
+    finally: conn.close()
+
+def recuperar_interrumpidos():
+    """Marca como error los trabajos que quedaron 'procesando' de un trabajador que se detuvo (su carga hizo rollback)."""
+    conn = conexion_cola()
+    try:
+        n = conn.execute(f"""UPDATE {TABLA_TRABAJOS} SET estado = 'error', terminado = ?,
+                             mensaje = '❌ Interrumpido: el proceso de carga se detuvo antes de terminar; no se guardó nada.'
+                             WHERE estado = 'procesando'""", (ahora_texto(),)).rowcount
+        conn.commit()
+        return n
+    finally: conn.close()
+
+def procesar_trabajo(trabajo):
+    """Ejecuta un trabajo reclamado con la carga por bloques y deja el resultado en la tabla de trabajos."""
+    ruta_avance = trabajo['archivo'] + '.avance'
+    ultimo = {'filas': 0, 'filas_seg': 0.0}
+    def progreso(filas, filas_seg, avance):
+        ultimo.update(filas=filas, filas_seg=filas_seg)
+        escribir_json(ruta_avance, {'filas': filas, 'filas_seg': filas_seg, 'avance': avance})
+
+    try:
+        with open(trabajo['archivo'], 'rb') as f:
+            ok, msg = cargar_bloques_bd(leer_archivo_por_bloques(f), trabajo['tabla'], modo=trabajo['modo'],
+                                        anio_sel=trabajo['anio'], mes_sel=trabajo['mes'], progreso=progreso,
+                                        deduplicar=bool(trabajo['deduplicar']))
+    except Exception as e:
+        ok, msg = False, f"❌ Error: {e}"
+    finalizar_trabajo(trabajo['id'], 'completado' if ok else 'error', ultimo['filas'], ultimo['filas_seg'], msg)
+    if os.path.exists(ruta_avance): os.remove(ruta_avance)
+    # Los archivos con error se conservan en staging para revisarlos
+    if ok: os.remove(trabajo['archivo'])
+    return ok
+
+def ruta_latido():
+    return os.path.join(carpeta_staging(), "trabajador.latido")
+
+def marcar_latido():
+    escribir_json(ruta_latido(), {'pid': os.getpid(), 'fecha': ahora_texto()})
+
+def trabajador_activo(excepto_pid=None):
+    """True si hay un trabajador con latido reciente (distinto de `excepto_pid`)."""
+    ruta = ruta_latido()
+    try: edad = time.time() - os.path.getmtime(ruta)
+    except OSError: return False
+    latido = leer_json(ruta) or {}
+    return edad < SEGUNDOS_LATIDO and latido.get('pid') != excepto_pid
+
+def iniciar_trabajador():
+    """Lanza trabajador_cargas.py en un proceso aparte, apuntando a la misma base de datos."""
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), "trabajador_cargas.py")
+    entorno = dict(os.environ, CHRISTUS_DB_PATH=os.path.abspath(get_pool().path))
+    # Proceso desacoplado: sobrevive a la sesión (y a la pestaña) que encoló la carga
+    opciones = ({'creationflags': subprocess.CREATE_NO_WINDOW | subprocess.CREATE_NEW_PROCESS_GROUP}
+                if os.name == 'nt' else {'start_new_session': True})
+    with open(os.path.join(carpeta_staging(), "trabajador.log"), 'a', encoding='utf-8') as log:
+        subprocess.Popen([sys.executable, script], env=entorno, stdin=subprocess.DEVNULL,
+                         stdout=log, stderr=log, **opciones)
+
+@st.cache_resource
+def get_arranque_trabajador():
+    """Lock y hora del último arranque: cada proceso de la app lanza a lo sumo un trabajador por latido."""
+    return {'lock': threading.Lock(), 'ultimo': 0.0}
+
+def asegurar_trabajador():
+    """Arranca el trabajador si no hay uno vivo. Devuelve True si lo lanzó."""
+    arranque = get_arranque_trabajador()
+    with arranque['lock']:
+        if trabajador_activo() or time.time() - arranque['ultimo'] < SEGUNDOS_LATIDO: return False
+        iniciar_trabajador()
+        arranque['ultimo'] = time.time()
+        return True
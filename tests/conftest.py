@@ -0,0 +1,25 @@
+import os
+import sys
+
+import pytest
+import streamlit.logger
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import motor_datos as md
+
+# Sin servidor, Streamlit avisa en cada lectura que no hay contexto de sesión
+streamlit.logger.set_log_level('error')
+
+
+@pytest.fixture
+def bd(tmp_path, monkeypatch):
+    """BD nueva y migrada para la prueba; el pool, las migraciones y el caché del proceso se reinician."""
+    monkeypatch.setenv('CHRISTUS_DB_PATH', str(tmp_path / 'prueba.db'))
+    md.get_pool.clear()
+    md.migrar_esquema.clear()
+    md.get_cache_resultados.clear()
+    md.init_db()
+    yield md
+    md.get_pool.clear()
+    md.migrar_esquema.clear()
+    md.get_cache_resultados.clear()
@@ -0,0 +1,25 @@
+import os
+import subprocess
+import sys
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_importar_motor_no_carga_pandas():
+    # La pantalla de login no paga el import de pandas; el ajuste de copy-on-write espera al primer uso
+    codigo = ("import sys, motor_datos as md; assert 'pandas' not in sys.modules; "
+              "md.pd.DataFrame; assert 'pandas' in sys.modules and not md.ModuloDiferido.AJUSTES")
+    subprocess.run([sys.executable, '-c', codigo], cwd=RAIZ, check=True)
+
+
+def test_init_db_no_carga_pandas(tmp_path):
+    # BD nueva (sin tablas ope_*) y BD con una tabla ope_* aún sin inscribir: ninguna importa pandas antes del login
+    codigo = ("import sqlite3, sys, motor_datos as md; md.init_db(); "
+              "sqlite3.connect(md.get_pool().path).executescript("
+              "\"CREATE TABLE ope_facturacion (ANIO TEXT, MES TEXT, VALOR REAL); "
+              "INSERT INTO ope_facturacion VALUES ('2025', 'Enero', 1);\"); "
+              "md.migrar_esquema.clear(); md.init_db(); "
+              "conn, _ = md.get_connection(); assert md.registro_vigente(conn, 'ope_facturacion'); "
+              "assert 'pandas' not in sys.modules")
+    entorno = dict(os.environ, CHRISTUS_DB_PATH=str(tmp_path / 'prueba.db'))
+    subprocess.run([sys.executable, '-c', codigo], cwd=RAIZ, env=entorno, check=True)
@@ -0,0 +1,34 @@
+import pandas as pd
+
+
+def facturas(mes, filas):
+    return pd.DataFrame([{'ANIO': 2025, 'MES': mes, 'ASEGURADORA': a, 'PACIENTE': p, 'VALOR': v} for a, p, v in filas])
+
+
+def test_busqueda_indexa_cargas_y_reemplazos(bd):
+    assert bd.cargar_dataframe_bd(facturas('Enero', [('Sura', 'Clínica del Norte', 10), ('Sanitas', 'Hospital Sur', 20)]),
+                                  'ope_facturacion', 'append')[0]
+    # Sin tildes ni mayúsculas y por prefijo
+    conteos, resultados = bd.buscar_texto('clinica nor')
+    assert conteos['ope_facturacion'] == 1
+    assert resultados[['Tabla', 'Periodo']].values.tolist() == [['Facturacion', 'Enero 2025']]
+    assert 'Clínica del Norte' in resultados['Registro'].iloc[0]
+
+    # Append: solo se indexan las filas nuevas; partición: las filas reemplazadas salen del índice
+    assert bd.cargar_dataframe_bd(facturas('Febrero', [('Sura', 'Clínica Central', 5)]), 'ope_facturacion', 'append')[0]
+    assert bd.buscar_texto('clinica')[0]['ope_facturacion'] == 2
+    assert bd.cargar_dataframe_bd(facturas('Enero', [('Sura', 'Centro Médico', 7)]), 'ope_facturacion', 'particion',
+                                  anio_sel=2025, mes_sel='Enero')[0]
+    assert bd.buscar_texto('clinica')[0]['ope_facturacion'] == 1
+    assert bd.buscar_texto('hospital')[0]['ope_facturacion'] == 0
+    # Los montos no se indexan y las comillas no rompen la consulta FTS
+    assert bd.buscar_texto('7')[0]['ope_facturacion'] == 0
+    assert bd.buscar_texto('"medico')[0]['ope_facturacion'] == 1
+
+
+def test_paginas_de_resultados(bd):
+    assert bd.cargar_dataframe_bd(facturas('Marzo', [('Sura', f'Paciente {i}', i) for i in range(5)]), 'ope_facturacion', 'append')[0]
+    paginas = [bd.buscar_texto('paciente', pagina=p, filas_por_pagina=2)[1] for p in (1, 2, 3)]
+    assert [len(p) for p in paginas] == [2, 2, 1]
+    assert len({r for p in paginas for r in p['Registro']}) == 5
+    assert bd.consulta_fts('  ') is None and bd.consulta_fts('sura "x') == '"sura"* """x"*'
@@ -0,0 +1,50 @@
+import os
+import sys
+
+import pytest
+
+import cargador_lotes as cl
+
+
+@pytest.mark.parametrize('ruta, tabla', [
+    ('facturacion_2024_01.csv', 'ope_facturacion'),
+    ('Cuentas Médicas Enero 2025.xlsx', 'ope_cuentas_medicas'),
+    (os.path.join('historico', 'radicacion', '202403.csv'), 'ope_radicacion'),  # Por la carpeta
+    ('ope_cartera-2024-02.csv', 'ope_cartera'),
+    ('facturacion_vs_radicacion.csv', None),                                    # Ambiguo
+    ('reporte_2024.csv', None),
+])
+def test_inferir_tabla(ruta, tabla):
+    assert cl.inferir_tabla(ruta) == tabla
+
+
+@pytest.mark.parametrize('nombre, periodo', [
+    ('facturacion_2024-01.csv', (2024, 1)),
+    ('facturacion_202412.csv', (2024, 12)),
+    ('cartera_03_2025.xlsx', (2025, 3)),
+    ('Cartera Enero 2025.xlsx', (2025, 1)),
+    ('radicacion_SEP_2024.csv', (2024, 9)),
+    ('admisiones ENE24.csv', (2024, 1)),
+    ('provision_2024.csv', (2024, None)),
+    ('facturacion.csv', (None, None)),
+])
+def test_inferir_periodo(nombre, periodo):
+    assert cl.inferir_periodo(nombre) == periodo
+
+
+def test_planificar_la_linea_de_comandos_manda():
+    plan = cl.planificar(['cartera_2024_01.csv', 'otro.csv'], anio=2023)
+    assert [(p['tabla'], p['anio'], p['mes']) for p in plan] == [('ope_cartera', 2023, 1), (None, 2023, None)]
+    assert plan[1]['error'] and not plan[0]['error']
+
+
+def test_carga_por_lotes_de_un_directorio(bd, tmp_path, monkeypatch):
+    carpeta = tmp_path / 'historico' / 'facturacion'
+    carpeta.mkdir(parents=True)
+    (carpeta / '2025_01.csv').write_text("ASEGURADORA,VALOR\nSura,1.500\nSanitas,500\n", encoding='utf-8')
+    (carpeta / '2025_02.csv').write_text("ASEGURADORA,VALOR\nSura,250\n", encoding='utf-8')
+    (carpeta / 'notas.txt').write_text("no es un archivo de datos", encoding='utf-8')
+    monkeypatch.setattr(sys, 'argv', ['cargador_lotes.py', str(tmp_path / 'historico'), '--procesos', '1'])
+    assert not cl.main()
+    res = bd.obtener_resumen('ope_facturacion', 2025)
+    assert res.groupby('mes')['valor'].sum().to_dict() == {'Enero': 2000, 'Febrero': 250}
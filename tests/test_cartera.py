@@ -0,0 +1,51 @@
+import pandas as pd
+import pytest
+
+CARTERA = pd.DataFrame({
+    'ANIO': [2025, 2025, 2025, 2025, 2024],
+    'MES': ['Marzo', 'Marzo', 'Marzo', 'Marzo', 'Diciembre'],
+    'ASEGURADORA': ['Sura', 'Sura', 'Sanitas', 'Sanitas', 'Sura'],
+    'SALDO': [100, 200, 70, 50, 999],
+    # Corte de marzo: 31/03/2025 -> 16, 75 y 31 días; sin fecha
+    'FECHA FACTURA': ['2025-03-15', '2025-01-15', '2025-02-28', None, '2024-12-01'],
+})
+
+
+@pytest.mark.parametrize('motor', ['sqlite', 'duckdb'])
+def test_edades_cartera_del_anio(bd, monkeypatch, motor):
+    if motor == 'duckdb' and not bd.duckdb_instalado(): pytest.skip("DuckDB no instalado")
+    monkeypatch.setattr(bd, 'MOTOR_ANALITICO', motor)
+    assert bd.cargar_dataframe_bd(CARTERA, 'ope_cartera', 'append')[0]
+    if motor == 'duckdb': assert bd.snapshot_vigente(*bd.resolver_tabla('ope_cartera'))
+
+    edades = bd.edades_cartera(2025)
+    assert edades['anio'].unique().tolist() == [2025]  # 2024 no se lee
+    mes, corte = bd.corte_edades(edades, 2025)
+    assert mes == 3
+    tabla = bd.tabla_edades(corte).set_index('Aseguradora')
+    assert tabla.loc['Sura', ['0-30', '61-90', 'Total']].tolist() == [100, 200, 300]
+    assert tabla.loc['Sanitas', ['31-60', 'Sin fecha', 'Total']].tolist() == [70, 50, 120]
+    assert tabla.loc['Total', 'Total'] == 420
+
+
+def test_tramos_y_corte_de_edades(bd):
+    # Corte de febrero 2025: 28/02. Límites de tramo (30, 60, 180 días), documento posterior al corte y más de 180 días
+    fechas = ['2025-01-29', '2025-01-28', '2024-12-29', '2024-09-01', '2024-08-31', '2025-03-10']
+    febrero = pd.DataFrame({'ANIO': 2025, 'MES': 'Febrero', 'ASEGURADORA': [f'EPS {i}' for i in range(6)],
+                            'SALDO': [1, 2, 4, 8, 16, 32], 'FECHA FACTURA': fechas})
+    enero = pd.DataFrame({'ANIO': [2025], 'MES': ['Enero'], 'ASEGURADORA': ['EPS 0'], 'SALDO': [64], 'FECHA FACTURA': ['2025-01-01']})
+    assert bd.cargar_dataframe_bd(pd.concat([enero, febrero]), 'ope_cartera', 'append')[0]
+
+    edades = bd.edades_cartera(2025)
+    mes, corte = bd.corte_edades(edades, 2025)  # 'Todos': el último mes con saldos
+    assert mes == 2 and corte['registros'].sum() == 6
+    sumas = corte[[t for t, _ in bd.TRAMOS_EDAD]].sum().to_dict()
+    assert sumas == {'0-30': 1 + 32, '31-60': 2, '61-90': 4, '91-180': 8, '180+': 16}
+    assert bd.corte_edades(edades, 2025, 'Enero')[1]['0-30'].sum() == 64
+    assert bd.corte_edades(edades, 2024)[0] is None
+
+    # Las `n` aseguradoras de mayor saldo y el resto en 'Otras'
+    tabla = bd.tabla_edades(corte, n=2)
+    assert tabla['Aseguradora'].tolist() == ['EPS 5', 'EPS 4', 'Otras', 'Total']
+    assert tabla.set_index('Aseguradora').loc['Otras', 'Total'] == 15
+    assert 'Sin fecha' not in tabla.columns
@@ -0,0 +1,41 @@
+import io
+import sqlite3
+import time
+
+
+def archivo_subido(nombre='enero.csv'):
+    f = io.BytesIO(b"ANIO,MES,VALOR\n2025,Enero,1\n")
+    f.name = nombre
+    return f
+
+
+def test_encolar_no_espera_una_carga_en_curso(bd):
+    # Otro proceso carga datos: retiene el lock de escritura de la BD principal hasta su commit
+    carga = sqlite3.connect(bd.get_pool().path)
+    carga.execute("BEGIN IMMEDIATE")
+    try:
+        inicio = time.monotonic()
+        id_trabajo = bd.encolar_carga(archivo_subido(), 'ope_facturacion', usuario='admin')
+        assert time.monotonic() - inicio < 1
+    finally:
+        carga.rollback()
+        carga.close()
+    trabajo = bd.tomar_trabajo()
+    assert trabajo['id'] == id_trabajo and trabajo['tabla'] == 'ope_facturacion'
+    assert bd.listar_trabajos()['estado'].tolist() == ['procesando']
+
+
+def test_migracion_pasa_la_cola_a_su_archivo(bd):
+    escritura, _ = bd.get_connection(escritura=True)
+    try:  # BD en la versión 2: la cola aún vive en la BD principal
+        bd.crear_tabla_trabajos(escritura)
+        escritura.execute("INSERT INTO trabajos_carga (tabla, archivo, modo, estado) VALUES ('ope_cartera', 'x.csv', 'append', 'pendiente')")
+        escritura.execute("DELETE FROM schema_version WHERE version >= 3")
+        escritura.commit()
+    finally: escritura.close()
+    bd.migrar_esquema.clear()
+    bd.init_db()
+    conn, _ = bd.get_connection()
+    try: assert not conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'trabajos_carga'").fetchone()
+    finally: conn.close()
+    assert bd.tomar_trabajo()['tabla'] == 'ope_cartera'
@@ -0,0 +1,73 @@
+import sqlite3
+import threading
+import time
+
+
+def crear_tabla(md, tabla='ope_facturacion'):
+    """Tabla cargada por fuera de la app: sin registro ni columnas canónicas."""
+    with sqlite3.connect(md.get_pool().path) as conn:
+        conn.execute(f"CREATE TABLE {tabla} (ANIO TEXT, MES TEXT, VALOR_FACTURADO REAL)")
+        conn.executemany(f"INSERT INTO {tabla} VALUES (?, ?, ?)",
+                         [('2025', 'Enero', 100.0), ('2025', 'Febrero', 50.0)])
+
+
+def test_lectura_resuelve_roles_sin_escribir_con_carga_en_curso(bd):
+    crear_tabla(bd)
+    escritura, _ = bd.get_connection(escritura=True)
+    escritura.execute("BEGIN IMMEDIATE")  # Una carga en curso retiene el lock de escritura
+    try:
+        resultado = {}
+        lector = threading.Thread(target=lambda: resultado.update(roles=bd.obtener_roles('ope_facturacion')))
+        inicio = time.monotonic()
+        lector.start()
+        lector.join(5)
+        assert not lector.is_alive() and time.monotonic() - inicio < 5
+    finally:
+        escritura.rollback()
+        escritura.close()
+    roles = resultado['roles']
+    assert (roles['anio'], roles['mes'], roles['valor']) == ('ANIO', 'MES', 'VALOR_FACTURADO')
+    conn, _ = bd.get_connection()
+    try: assert not bd.registro_vigente(conn, 'ope_facturacion')
+    finally: conn.close()
+
+
+def test_init_db_inscribe_y_migra_con_la_conexion_de_escritura(bd):
+    crear_tabla(bd)
+    bd.migrar_esquema.clear()
+    bd.init_db()
+    conn, _ = bd.get_connection()
+    try:
+        assert bd.registro_vigente(conn, 'ope_facturacion')
+        assert bd.roles_tabla(conn, 'ope_facturacion')['anio'] == 'periodo_anio'
+        meses = [f[0] for f in conn.execute("SELECT periodo_mes FROM ope_facturacion ORDER BY rowid")]
+        assert meses == [1, 2]
+    finally: conn.close()
+
+
+def test_init_db_reinscribe_registros_de_una_version_anterior(bd):
+    crear_tabla(bd)
+    bd.migrar_esquema.clear()
+    bd.init_db()
+    escritura, _ = bd.get_connection(escritura=True)
+    try:
+        escritura.execute("UPDATE registro_esquema SET firma = 'v0|' || firma WHERE tabla = 'ope_facturacion'")
+        escritura.commit()
+    finally: escritura.close()
+    bd.migrar_esquema.clear()
+    bd.init_db()
+    conn, _ = bd.get_connection()
+    try: assert bd.registro_vigente(conn, 'ope_facturacion')
+    finally: conn.close()
+
+
+def test_alcance_por_area_antes_de_inscribir(bd):
+    with sqlite3.connect(bd.get_pool().path) as conn:
+        conn.executemany("INSERT INTO catalogo_indicadores (area, indicador) VALUES (?, ?)",
+                         [('Facturación', 'Glosas'), ('Cartera', 'Recaudo')])
+    # Catálogo de una BD anterior a area_norm, resuelto en memoria
+    roles = bd.resolver_roles('catalogo_indicadores', ['id', 'area', 'responsable', 'indicador', 'fecha_carga'])
+    assert roles['area'] == 'area'
+    filas = [f for bloque in bd.bloques_consulta('catalogo_indicadores', roles, area='FACTURACION')
+             for f in bloque['indicador']]
+    assert filas == ['Glosas']
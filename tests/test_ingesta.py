@@ -0,0 +1,98 @@
+import io
+
+import pandas as pd
+import pytest
+
+import motor_datos as md
+
+
+@pytest.mark.parametrize('celdas, esperado', [
+    (['1.500', '2.000'], [1500, 2000]),                   # Miles colombianos, aunque ninguna celda tenga dos puntos
+    (['1.500', '2.300'], [1500, 2300]),
+    (['$1.234.567,89', '-2,5', '(1.500,5)'], [1234567.89, -2.5, -1500.5]),
+    (['1,234,567'], [1234567]),                           # Miles con coma (exportaciones en inglés)
+    (['1,234,567.89', '12.5'], [1234567.89, 12.5]),
+    (['1.5', '2.25'], [1.5, 2.25]),                       # Punto que no puede ser de miles
+    (['1,500'], [1.5]),                                   # Ambiguo: gana el formato colombiano
+    (['COP 1.500', ' 2.000 '], [1500, 2000]),
+])
+def test_parsear_numeros_formatos(celdas, esperado):
+    valores, fallidas, _ = md.parsear_numeros(pd.Series(celdas, dtype=object))
+    assert valores.tolist() == pytest.approx(esperado)
+    assert fallidas == 0
+
+
+def test_parsear_numeros_celdas_invalidas():
+    valores, fallidas, _ = md.parsear_numeros(pd.Series(['abc', '1.500', None, ''], dtype=object))
+    assert valores.iloc[1] == 1500
+    assert fallidas == 1
+
+
+def test_separador_decimal_fijo_en_toda_la_carga():
+    formatos = {}
+    primero, _ = md.tipificar_bloque(pd.DataFrame({'RECAUDO': ['1.500', '2.000']}), formatos)
+    # El segundo bloque traería evidencia de punto decimal, pero el archivo ya se leyó con coma
+    segundo, fallidas = md.tipificar_bloque(pd.DataFrame({'RECAUDO': ['1.5', '2.000']}), formatos)
+    assert formatos['RECAUDO'] == ','
+    assert primero['RECAUDO'].tolist() == [1500, 2000]
+    assert segundo['RECAUDO'].iloc[1] == 2000 and pd.isna(segundo['RECAUDO'].iloc[0])
+    assert fallidas == {'RECAUDO': 1}
+
+
+def test_columna_no_numerica_queda_como_texto_en_toda_la_carga():
+    formatos = {}
+    primero, _ = md.tipificar_bloque(pd.DataFrame({'VALOR': ['x', 'y']}), formatos)
+    segundo, _ = md.tipificar_bloque(pd.DataFrame({'VALOR': ['1', '2']}), formatos)
+    assert formatos['VALOR'] == 'texto'
+    assert primero['VALOR'].tolist() == ['x', 'y']
+    assert segundo['VALOR'].tolist() == ['1', '2']
+
+
+def test_carga_lee_miles_colombianos(bd):
+    bloques = [(pd.DataFrame({'ANIO': [2025], 'MES': ['Enero'], 'RECAUDO': ['1.500']}), 0.5),
+               (pd.DataFrame({'ANIO': [2025], 'MES': ['Enero'], 'RECAUDO': ['2.000']}), 1.0)]
+    ok, mensaje = bd.cargar_bloques_bd(bloques, 'ope_cartera', 'append')
+    assert ok, mensaje
+    assert bd.obtener_resumen('ope_cartera', 2025)['valor'].sum() == 3500
+
+
+def test_columna_ano_con_tilde():
+    assert md.buscar_columna_inteligente(['PLANO', 'AÑO', 'MES'], md.CLAVES_ANIO) == 'AÑO'
+    assert md.buscar_columna_inteligente(['PLANO', 'ANOTACION'], md.CLAVES_ANIO) is None
+    # El año del archivo manda sobre el seleccionado en la carga
+    bloque = md.preparar_bloque(pd.DataFrame({'AÑO': [2024], 'MES': ['Marzo'], 'VALOR': [1]}), 2025, 'Enero')
+    assert bloque['periodo_anio'].tolist() == [2024] and bloque['periodo_mes'].tolist() == [3]
+
+
+def test_csv_con_miles_colombianos(bd):
+    f = io.BytesIO("ANIO,MES,RECAUDO,ID\n2025,Enero,1.500,7\n2025,Enero,2.000,8\n2025,Enero,,9\n".encode('utf-8'))
+    f.name = 'cartera.csv'
+    ok, mensaje = bd.cargar_bloques_bd(bd.leer_archivo_por_bloques(f), 'ope_cartera', 'append')
+    assert ok, mensaje
+    assert bd.obtener_resumen('ope_cartera', 2025)['valor'].sum() == 3500
+
+
+def test_deduplicar_conserva_filas_identicas_de_bloques_distintos(bd):
+    fila = {'ANIO': 2025, 'MES': 'Enero', 'ASEGURADORA': 'Sura', 'VALOR': 100}
+    bloques = lambda: [(pd.DataFrame([fila]), 0.5), (pd.DataFrame([fila]), 1.0)]
+    ok, mensaje = bd.cargar_bloques_bd(bloques(), 'ope_facturacion', 'append', deduplicar=True)
+    assert ok and 'duplicados' not in mensaje, mensaje
+    # Volver a subir el mismo archivo no agrega nada
+    ok, mensaje = bd.cargar_bloques_bd(bloques(), 'ope_facturacion', 'append', deduplicar=True)
+    assert ok and '2 duplicados omitidos' in mensaje, mensaje
+    tabla, roles = bd.resolver_tabla('ope_facturacion')
+    assert bd.contar_registros(tabla, roles) == 2
+
+
+def test_alcance_por_area_solo_en_tablas_mapeadas(bd):
+    # En ope_cartera 'ÁREA' es el servicio clínico, no el área de acceso del usuario
+    cartera = pd.DataFrame({'ANIO': 2025, 'MES': 'Enero', 'ÁREA': ['Urgencias', 'Cirugía'], 'RECAUDO': [1, 2]})
+    assert bd.cargar_dataframe_bd(cartera, 'ope_cartera', 'append')[0]
+    tabla, roles = bd.resolver_tabla('ope_cartera')
+    assert roles['area'] is None
+    assert bd.contar_registros(tabla, roles, area='Cartera') == 2
+
+    catalogo = pd.DataFrame({'area': ['Cartera', 'Facturación'], 'indicador': ['x', 'y']})
+    assert bd.cargar_dataframe_bd(catalogo, 'catalogo_indicadores', 'replace')[0]
+    df, _ = bd.obtener_datos('INDICADORES', 'catalogo_indicadores', area='Facturacion')
+    assert df['indicador'].tolist() == ['y']
@@ -0,0 +1,71 @@
+import threading
+from functools import partial
+
+import pandas as pd
+
+
+def test_primer_lector_no_modifica_el_cache(bd):
+    bd.cargar_dataframe_bd(pd.DataFrame({'area': ['Cartera'], 'indicador': ['Recaudo']}), 'catalogo_indicadores', 'append')
+    df, _ = bd.obtener_datos("INDICADORES", "catalogo_indicadores")
+    columnas = list(df.columns)
+    df.columns = [c.upper() for c in df.columns]  # Como hace la página de Indicadores
+    assert list(bd.obtener_datos("INDICADORES", "catalogo_indicadores")[0].columns) == columnas
+
+    calcular = lambda: pd.DataFrame({'valor': [1, 2]})
+    resultado = bd.calcular_cacheado(['catalogo_indicadores'], 'prueba', (), calcular)
+    resultado['valor'] = 0
+    assert bd.calcular_cacheado(['catalogo_indicadores'], 'prueba', (), calcular)['valor'].tolist() == [1, 2]
+
+
+def test_indicadores_sin_columnas_internas(bd):
+    catalogo = pd.DataFrame({'AREA': ['Cartera', 'Facturación'], 'INDICADOR': ['Recaudo', 'Glosas'], 'META': [1, 2]})
+    assert bd.cargar_dataframe_bd(catalogo, 'catalogo_indicadores', 'replace')[0]
+    df, tabla = bd.obtener_datos("INDICADORES", "catalogo_indicadores", area='Cartera')
+    assert list(bd.sin_columnas_internas(df).columns) == ['AREA', 'INDICADOR', 'META']
+    roles = bd.resolver_tabla(tabla)[1]
+    exportado = pd.concat(bd.bloques_consulta(tabla, roles, area='Cartera', columnas=bd.columnas_visibles(tabla)))
+    assert exportado.to_dict('list') == {'AREA': ['Cartera'], 'INDICADOR': ['Recaudo'], 'META': [1]}
+
+
+def test_exportacion_por_bloques(bd, tmp_path):
+    datos = pd.DataFrame({'ANIO': 2025, 'MES': ['Enero'] * 5 + ['Febrero'] * 2, 'VALOR': range(7)})
+    assert bd.cargar_dataframe_bd(datos, 'ope_facturacion', 'append')[0]
+    tabla, roles = bd.resolver_tabla('ope_facturacion')
+    bloques = lambda: bd.bloques_consulta(tabla, roles, [2025], [1], filas_por_bloque=2, columnas=bd.columnas_visibles(tabla))
+    with open(tmp_path / 'enero.csv', 'w+b') as salida:
+        assert bd.exportar_csv(bloques(), salida) == 5
+        salida.seek(0)
+        assert pd.read_csv(salida, encoding='utf-8-sig')['VALOR'].tolist() == [0, 1, 2, 3, 4]
+    with open(tmp_path / 'enero.xlsx', 'w+b') as salida:
+        assert bd.exportar_xlsx(bloques(), salida) == 5
+        salida.seek(0)
+        assert pd.read_excel(salida)['VALOR'].tolist() == [0, 1, 2, 3, 4]
+
+
+def test_lecturas_en_paralelo(bd):
+    for tabla, columna in [('ope_facturacion', 'VALOR'), ('ope_radicacion', 'VALOR RADICADO'), ('ope_admisiones', 'CANTIDAD')]:
+        datos = pd.DataFrame({'ANIO': 2025, 'MES': ['Enero', 'Febrero'], columna: [10, 20]})
+        assert bd.cargar_dataframe_bd(datos, tabla, 'append')[0]
+    tablas = ['ope_facturacion', 'ope_radicacion', 'ope_admisiones']
+    # Cada tarea espera a las demás: solo terminan si corren a la vez, cada una con su conexión del pool
+    barrera = threading.Barrier(len(tablas), timeout=5)
+    def leer(tabla):
+        barrera.wait()
+        return bd.obtener_resumen(tabla, 2025)
+    resultados = dict(bd.leer_en_paralelo({t: partial(leer, t) for t in tablas}))
+    assert sorted(resultados) == sorted(tablas)
+    assert all(bd.total_kpi(res) == 30 for res in resultados.values())
+
+
+def test_paginacion_y_conteo(bd):
+    datos = pd.DataFrame({'ANIO': 2025, 'MES': ['Enero'] * 7 + ['Febrero'] * 3, 'VALOR': range(10)})
+    assert bd.cargar_dataframe_bd(datos, 'ope_facturacion', 'append')[0]
+    tabla, roles = bd.resolver_tabla('ope_facturacion')
+    assert bd.contar_registros(tabla, roles) == 10
+    assert bd.contar_registros(tabla, roles, [2025], [1]) == 7
+    paginas = [bd.leer_pagina(tabla, roles, [2025], [1], pagina=p, filas_por_pagina=3)['VALOR'].tolist() for p in (1, 2, 3)]
+    assert paginas == [[0, 1, 2], [3, 4, 5], [6]]
+    assert bd.leer_pagina(tabla, roles, [2025], [2], pagina=1, filas_por_pagina=3)['VALOR'].tolist() == [7, 8, 9]
+    # Una carga nueva cambia la versión de la tabla: el conteo cacheado no queda viejo
+    assert bd.cargar_dataframe_bd(datos.head(1), 'ope_facturacion', 'append')[0]
+    assert bd.contar_registros(tabla, roles, [2025], [1]) == 8
@@ -0,0 +1,55 @@
+import pandas as pd
+
+
+def facturas(mes, valores, aseguradora='Sura', anio=2025):
+    return pd.DataFrame({'ANIO': anio, 'MES': mes, 'ASEGURADORA': aseguradora, 'VALOR': valores})
+
+
+def totales(bd, anio=2025):
+    """{(mes, aseguradora): (valor, registros)} del resumen mensual."""
+    res = bd.obtener_resumen('ope_facturacion', anio)
+    return {(f.mes, f.aseguradora): (f.valor, f.registros) for f in res.itertuples()}
+
+
+def totales_crudos(bd, anio=2025):
+    """Lo mismo calculado sobre las filas de la tabla."""
+    conn, _ = bd.get_connection()
+    try:
+        filas = conn.execute("""SELECT periodo_mes, ASEGURADORA, SUM(VALOR), COUNT(*) FROM ope_facturacion
+                                WHERE periodo_anio = ? GROUP BY 1, 2""", (anio,)).fetchall()
+    finally: conn.close()
+    return {(bd.MAPA_MES_NOMBRE[str(m)], a): (v, n) for m, a, v, n in filas}
+
+
+def test_resumen_acumula_las_cargas_append(bd, monkeypatch):
+    assert bd.cargar_dataframe_bd(facturas('Enero', [100, 50]), 'ope_facturacion', 'append')[0]
+    assert totales(bd) == {('Enero', 'Sura'): (150, 2)}
+    # Segunda carga: mes nuevo, aseguradora nueva y más filas de un grupo existente; solo se acumulan las filas nuevas
+    def sin_reconstruir(*args, **kwargs): raise AssertionError("el append no debe reconstruir el resumen")
+    monkeypatch.setattr(bd, 'reconstruir_rollup', sin_reconstruir)
+    nuevas = pd.concat([facturas('Febrero', [30]), facturas('Enero', [20], 'Sanitas'), facturas('Enero', [5])])
+    assert bd.cargar_dataframe_bd(nuevas, 'ope_facturacion', 'append')[0]
+    esperado = {('Enero', 'Sura'): (155, 3), ('Enero', 'Sanitas'): (20, 1), ('Febrero', 'Sura'): (30, 1)}
+    assert totales(bd) == esperado == totales_crudos(bd)
+    assert bd.total_kpi(bd.filtrar_por_periodo(bd.obtener_resumen('ope_facturacion', 2025), None, 'Enero')) == 175
+
+
+def test_reemplazo_de_periodo_solo_cambia_ese_mes(bd):
+    inicial = pd.concat([facturas('Enero', [100, 50]), facturas('Febrero', [30]), facturas('Enero', [7], anio=2024)])
+    assert bd.cargar_dataframe_bd(inicial, 'ope_facturacion', 'append')[0]
+    ok, mensaje = bd.cargar_dataframe_bd(facturas('Enero', [80], 'Sanitas'), 'ope_facturacion', 'particion',
+                                         anio_sel=2025, mes_sel='Enero')
+    assert ok and '2 reemplazados' in mensaje, mensaje
+    assert totales(bd) == {('Enero', 'Sanitas'): (80, 1), ('Febrero', 'Sura'): (30, 1)} == totales_crudos(bd)
+    assert totales(bd, 2024) == {('Enero', 'Sura'): (7, 1)}
+
+
+def test_resumen_se_reconstruye_si_falta(bd):
+    assert bd.cargar_dataframe_bd(facturas('Marzo', [10, 20]), 'ope_facturacion', 'append')[0]
+    escritura, _ = bd.get_connection(escritura=True)
+    try:  # Tabla cargada antes de existir los resúmenes
+        escritura.execute("DROP TABLE rollup_ope_facturacion")
+        bd.incrementar_version(escritura, 'ope_facturacion')
+        escritura.commit()
+    finally: escritura.close()
+    assert totales(bd) == {('Marzo', 'Sura'): (30, 2)}
@@ -0,0 +1,37 @@
+import pandas as pd
+import pytest
+
+import motor_datos as md
+
+
+def resumen(valores):
+    """Resumen mensual {(anio, mes): valor} con los meses por nombre, como lo entrega obtener_resumen."""
+    return pd.DataFrame([{'anio': str(a), 'mes': md.LISTA_MESES[m - 1], 'aseguradora': '', 'valor': v, 'registros': 1}
+                         for (a, m), v in valores.items()])
+
+
+def test_serie_tendencia_variacion_anual_y_moviles():
+    # Enero 2024 a marzo 2025, con un hueco en febrero 2024 (cuenta como 0) y enero de dos aseguradoras
+    valores = {(2024, m): 100 for m in range(1, 13) if m != 2}
+    valores.update({(2025, 1): 150, (2025, 2): 50, (2025, 3): 80})
+    res = pd.concat([resumen(valores), resumen({(2024, 1): 20})])
+    serie = md.serie_tendencia(res)
+    assert len(serie) == 15 and serie.loc[pd.Period('2024-02', 'M'), 'Valor'] == 0
+    enero = serie.loc[pd.Period('2025-01', 'M')]
+    assert (enero['Valor'], enero['Año anterior'], enero['Var. anual']) == (150, 120, pytest.approx(0.25))
+    assert pd.isna(serie.loc[pd.Period('2025-02', 'M'), 'Var. anual'])  # Sin base el año anterior
+    marzo = serie.loc[pd.Period('2025-03', 'M')]
+    assert marzo['Móvil 3m'] == 150 + 50 + 80
+    assert marzo['Móvil 12m'] == 100 * 9 + 150 + 50 + 80  # Abril 2024 a marzo 2025
+
+
+def test_tendencia_recorta_despues_de_calcular():
+    valores = {(2024, m): 10 for m in range(1, 13)}
+    valores.update({(2025, 1): 20})
+    df = md.tendencia_procesos({'Facturado': resumen(valores), 'Recaudo': resumen({(2025, 1): 5})}, anios=[2025])
+    facturado = df[df['Tipo'] == 'Facturado'].iloc[0]
+    # El primer mes mostrado usa los meses de 2024 para la variación y los móviles
+    assert (facturado['Periodo'], facturado['Var. anual'], facturado['Móvil 3m']) == (pd.Timestamp('2025-01-01'), 1.0, 40)
+    assert df['Tipo'].tolist() == ['Facturado', 'Recaudo']
+    assert md.anios_resumenes({'a': resumen(valores), 'b': resumen({(2023, 5): 1})}) == [2023, 2024, 2025]
+    assert md.tendencia_procesos({}).empty
@@ -0,0 +1,70 @@
+"""
+Trabajador de cargas en segundo plano del Tablero Christus.
+
+Procesa los trabajos que la app deja en la cola (trabajos_carga en <BD>_cola.db, archivos en staging_cargas),
+uno a la vez porque SQLite admite un solo escritor, y registra estado, filas, filas/s y errores.
+Corre en su propio proceso: las sesiones web no quedan ocupadas durante la carga y cerrar la
+pestaña no la interrumpe. La app lo lanza sola cuando encola una carga; también puede correrse
+a mano (por ejemplo como servicio) con la base indicada en CHRISTUS_DB_PATH.
+
+Uso:
+    python trabajador_cargas.py
+    python trabajador_cargas.py --ocioso 0   # no termina aunque no haya trabajos
+"""
+import argparse
+import os
+import threading
+import time
+
+import streamlit.logger
+
+import motor_datos as md
+
+# Sin servidor, Streamlit avisa en cada lectura que no hay contexto de sesión
+streamlit.logger.set_log_level('error')
+
+
+def latir(detener):
+    """Mantiene el latido mientras el proceso vive, aunque una etapa larga de la carga no reporte avance."""
+    while not detener.wait(md.SEGUNDOS_LATIDO / 6):
+        md.marcar_latido()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Procesa en segundo plano las cargas encoladas desde la app.")
+    parser.add_argument('--ocioso', type=int, default=md.MAX_SEGUNDOS_OCIOSO,
+                        help="Segundos sin trabajos antes de terminar (0: no termina)")
+    args = parser.parse_args()
+
+    md.init_db()
+    if md.trabajador_activo(excepto_pid=os.getpid()):
+        print(f"{md.ahora_texto()} Ya hay un trabajador activo; se termina.", flush=True)
+        return
+    md.marcar_latido()
+    detener = threading.Event()
+    threading.Thread(target=latir, args=(detener,), daemon=True).start()
+
+    # Solo corre un trabajador a la vez: lo que quedó 'procesando' es de uno que se detuvo
+    interrumpidos = md.recuperar_interrumpidos()
+    if interrumpidos:
+        print(f"{md.ahora_texto()} {interrumpidos} trabajo(s) interrumpido(s) marcados como error.", flush=True)
+
+    print(f"{md.ahora_texto()} Trabajador {os.getpid()} atendiendo {md.get_pool().path}", flush=True)
+    ultimo_trabajo = time.time()
+    try:
+        while not args.ocioso or time.time() - ultimo_trabajo < args.ocioso:
+            trabajo = md.tomar_trabajo()
+            if trabajo is None:
+                time.sleep(md.SEGUNDOS_SONDEO)
+                continue
+            ok = md.procesar_trabajo(trabajo)
+            print(f"{md.ahora_texto()} Trabajo {trabajo['id']} ({trabajo['tabla']}): {'completado' if ok else 'error'}", flush=True)
+            ultimo_trabajo = time.time()
+    finally:
+        detener.set()
+        try: os.remove(md.ruta_latido())
+        except OSError: pass
+
+
+if __name__ == '__main__':
+    main()